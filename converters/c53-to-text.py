@@ -10,15 +10,19 @@ elements
 """
 from __future__ import print_function
 from os import path as fp
-import codecs
 import math
-import os
 import sys
 import xml.etree.ElementTree as ET
 import re
 
+from ttt.archive import open_binary
 from ttt.cli import CliConfig, iodir_argparser, generic_main
-from ttt.date import read_date
+from ttt.datecache import (DateCache, add_date_cache_args,
+                           check_date_cache_args, report_date_cache)
+from ttt.pipeline import Stages, write_snippets
+
+# shared by the workers (see --date-cache)
+DATES = DateCache()
 
 _MEMBRANE_BRACKETS = re.compile(r'\s*\((.*)\)')
 _MEMBRANE_PUNCT = re.compile(r'[.:-]')
@@ -73,69 +77,95 @@ def _membrane_name(line):
     return mname
 
 
-def _write_membrane(ntext, oprefix):
+def _date_str(line):
+    """
+    The bit of a membrane line that may be a date
+    """
+    return " ".join(line.split()[:3])
+
+
+def _membrane_snippets(ntext, oprefix, dates):
     """
-    Write out text for an individual membrane
-    (may involve multiple files)
+    Snippets for an individual membrane
+    (may involve multiple files), given the dates for
+    each of its lines (see `_date_str`)
     """
     lines = ntext.split("\n")
     mname = _membrane_name(lines[0])
     subentries = lines[1:]
     digits = _digits(subentries)
+    snippets = []
     for i, line in enumerate(subentries):
-        date_str = " ".join(line.split()[:3])
-        try:
-            date = read_date(date_str, fuzzy=True)
-        except ValueError as _:
-            date = None
+        date = dates[_date_str(line)]
         filename = "-".join([oprefix,
                              mname,
                              str(i+1).zfill(digits)])
-        with codecs.open(filename, 'w', 'utf-8') as stream:
-            if date is not None:
-                print(date, file=stream)
-            print(line, file=stream)
+        text = line + "\n"
+        if date is not None:
+            text = date + "\n" + text
+        snippets.append((filename, text))
+    return snippets
 
 
-def _write_items(tree, oprefix):
+def _item_snippets(tree, oprefix):
     """
-    Write out text for individual pieces of the XML tree.
+    Snippets for individual pieces of the XML tree.
     (nimrodel or opennlp seem to crash and burn on large files,
     so we have to feed it little tiny pieces)
     """
-    for node in tree.iter('entry'):
-        ntext = node.text.strip()
-        if ntext.startswith("Membrane "):
-            _write_membrane(ntext, oprefix)
+    membranes = [n.text.strip() for n in tree.iter('entry')]
+    membranes = [x for x in membranes if x.startswith("Membrane ")]
+    # read all the dates in one go
+    date_strs = list(set(_date_str(line) for ntext in membranes
+                         for line in ntext.split("\n")[1:]))
+    dates = dict(zip(date_strs, DATES.read_dates(date_strs, fuzzy=True)))
+    snippets = []
+    for ntext in membranes:
+        snippets.extend(_membrane_snippets(ntext, oprefix, dates))
+    return snippets
+
+
+def _read(idir, subpath):
+    """
+    read stage: raw bytes of the XML file
+    """
+    with open_binary(fp.join(idir, subpath)) as fin:
+        return fin.read()
 
 
-def convert(idir, odir, subpath):
+def _parse(subpath, raw):
     """
-    read XML file, write tweaked XML file
+    parse stage: XML file to text snippets
     """
-    # Is there a cleaner way to do this?
     try:
         prefix = subpath[:10]  # e.g. C53_p00177
-        tree = ET.parse(fp.join(idir, subpath))
-        oprefix = fp.join(odir, prefix)
-        if not fp.exists(oprefix):
-            os.makedirs(oprefix)
-        _write_items(tree, fp.join(oprefix, prefix))
+        tree = ET.fromstring(raw)
+        return _item_snippets(tree, fp.join(prefix, prefix))
     except ET.ParseError as oops:
         # shrug
         print(oops, file=sys.stderr)
+        return []
+
+
+# read XML file, write text snippets
+STAGES = Stages(read=_read, parse=_parse, write=write_snippets)
+
+CONFIG = CliConfig(description='C53 xml to text',
+                   input_description='XML files (via antiword)',
+                   glob='*.xml')
 
 
 def main():
     """
     Read input dir, dump in output dir
     """
-    cfg = CliConfig(description='C53 xml to text',
-                    input_description='XML files (via antiword)',
-                    glob='*.xml')
-    psr = iodir_argparser(cfg)
+    psr = iodir_argparser(CONFIG)
+    add_date_cache_args(psr)
     args = psr.parse_args()
-    generic_main(cfg, convert, args)
+    check_date_cache_args(psr, args)
+    DATES.dirname = args.date_cache
+    generic_main(CONFIG, STAGES, args)
+    report_date_cache(DATES, args)
 
 if __name__ == '__main__':
     main()
@@ -12,11 +12,11 @@ small text snippets with one directory per roll.
 
 from __future__ import print_function
 from os import path as fp
-import codecs
-import os
 import xml.etree.ElementTree as ET
 
+from ttt.archive import open_text, strip_compression
 from ttt.cli import CliConfig, iodir_argparser, generic_main
+from ttt.pipeline import Stages, write_snippets
 
 # ---------------------------------------------------------------------
 #
@@ -47,12 +47,13 @@ def _remove_boring_parts(tree):
             _empty_out(dateline)
 
 
-def _write_items(tree, oprefix):
+def _item_snippets(tree, oprefix):
     """
-    Write out text for individual pieces of the XML tree.
+    Snippets for individual pieces of the XML tree.
     (nimrodel or opennlp seem to crash and burn on large files,
     so we have to feed it little tiny pieces)
     """
+    snippets = []
     for node in tree.iter('text'):
         node_id = node.attrib.get("id", "")
         if node_id.startswith("r"):
@@ -61,38 +62,45 @@ def _write_items(tree, oprefix):
         dates = [x.attrib['value'] for x in node.iter('date')]
         body = "\n".join(node.itertext())
         text = "\n\n".join(dates[:1] + [body])
-        with codecs.open(ofilename, 'w', 'utf-8') as ofile:
-            print(text, file=ofile)
+        snippets.append((ofilename, text + "\n"))
+    return snippets
 
 
-def convert(idir, odir, subpath):
+def _read(idir, subpath):
     """
-    read XML file, write tweaked XML file
+    read stage: text of the XML file
+    """
+    with open_text(fp.join(idir, subpath), 'utf-8') as fin:
+        return fin.read()
+
+
+def _parse(subpath, text):
+    """
+    parse stage: XML file to text snippets
     """
     # Is there a cleaner way to do this?
     parser = ET.XMLParser(encoding='utf-8')
-    prefix = fp.splitext(subpath)[0]
-    ifile = fp.join(idir, subpath)
-    with codecs.open(ifile, 'r', 'utf-8') as fin:
-        utext = fin.read().encode('utf-8')
-        tree = ET.fromstringlist([utext], parser=parser)
-        _remove_boring_parts(tree)
-        oprefix = fp.join(odir, prefix)
-        if not fp.exists(oprefix):
-            os.makedirs(oprefix)
-        _write_items(tree, fp.join(oprefix, prefix))
+    prefix = fp.splitext(strip_compression(subpath))[0]
+    tree = ET.fromstringlist([text.encode('utf-8')], parser=parser)
+    _remove_boring_parts(tree)
+    return _item_snippets(tree, fp.join(prefix, prefix))
+
+
+# read XML file, write text snippets
+STAGES = Stages(read=_read, parse=_parse, write=write_snippets)
+
+CONFIG = CliConfig(description='Fine Rolls xml to text',
+                   input_description='XML files (manually annotated TEI)',
+                   glob='roll*.xml')
 
 
 def main():
     """
     Read input dir, dump in output dir
     """
-    cfg = CliConfig(description='Fine Rolls xml to text',
-                    input_description='XML files (manually annotated TEI)',
-                    glob='roll*.xml')
-    psr = iodir_argparser(cfg)
+    psr = iodir_argparser(CONFIG)
     args = psr.parse_args()
-    generic_main(cfg, convert, args)
+    generic_main(CONFIG, STAGES, args)
 
 
 if __name__ == '__main__':
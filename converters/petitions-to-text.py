@@ -22,11 +22,11 @@ of lexicon
 from __future__ import print_function
 from os import path as fp
 from collections import namedtuple
-import codecs
-import os
 import re
 
+from ttt.archive import open_text
 from ttt.cli import CliConfig, iodir_argparser, generic_main
+from ttt.pipeline import Stages, write_snippets
 
 _BLOCK_START = "Reference and Date"
 _TEXT_DIR = "text"
@@ -84,58 +84,68 @@ def extract_petition(block):
                     endorsement=endorsement)
 
 
-def save_petition(petition, odir):
+def petition_snippet(petition):
     """
-    write a petition to the output dir
+    the output path (relative to the output dir) and text for a
+    petition, or None if there is nothing to write
 
-    :: (Petition, FilePath) -> IO ()
+    :: Petition -> Maybe (FilePath, String)
     """
 
     if petition.request is None:
-        return
+        return None
 
     ref_parts = _REF_PARTS.split(petition.reference)
     ref_subdir = "-".join(ref_parts[:3])
-    dname = fp.join(odir, _TEXT_DIR, ref_subdir)
-    if not fp.exists(dname):
-        os.makedirs(dname)
-    filename = fp.join(dname, "-".join(ref_parts))
+    filename = fp.join(_TEXT_DIR, ref_subdir, "-".join(ref_parts))
 
     lines = []
     if petition.date is not None:
         lines.append(petition.date)
     lines.extend(petition.request)
+    return filename, "\n\n".join(lines) + "\n"
 
-    with codecs.open(filename, 'w', 'utf-8') as stream:
-        print("\n\n".join(lines), file=stream)
+
+def _read(idir, subpath):
+    """
+    read stage: lines of a petitions file
+    """
+    with open_text(fp.join(idir, subpath), 'iso8859-1') as stream:
+        return stream.readlines()
 
 
-def convert(idir, odir, subpath):
+def _parse(_, lines):
     """
-    read petitions file; write records
+    parse stage: output snippets for each petition in a file
     """
-    ifile = fp.join(idir, subpath)
-    with codecs.open(ifile, 'r', 'iso8859-1') as stream:
-        block = []
-        for line in stream.readlines():
-            if line.startswith(_BLOCK_START):
-                if any(block):  # block has non-empty lines
-                    petition = extract_petition(block)
-                    save_petition(petition, odir)
-                block = []
-            block.append(line.strip())
+    snippets = []
+    block = []
+    for line in lines:
+        if line.startswith(_BLOCK_START):
+            if any(block):  # block has non-empty lines
+                snippet = petition_snippet(extract_petition(block))
+                if snippet is not None:
+                    snippets.append(snippet)
+            block = []
+        block.append(line.strip())
+    return snippets
+
+
+# read petitions file; write records
+STAGES = Stages(read=_read, parse=_parse, write=write_snippets)
+
+CONFIG = CliConfig(description='TTT petitions converter',
+                   input_description='.dat files',
+                   glob='*.dat')
 
 
 def main():
     """
     Read input dir, dump in output dir
     """
-    cfg = CliConfig(description='TTT petitions converter',
-                    input_description='.dat files',
-                    glob='*.dat')
-    psr = iodir_argparser(cfg)
+    psr = iodir_argparser(CONFIG)
     args = psr.parse_args()
-    generic_main(cfg, convert, args)
+    generic_main(CONFIG, STAGES, args)
 
 
 if __name__ == '__main__':
@@ -14,16 +14,20 @@ clever semantics into the whitespace.
 
 from __future__ import print_function
 from os import path as fp
-import codecs
 import htmlentitydefs
 import itertools
 import math
-import os
 import re
 import xml.etree.ElementTree as ET
 
+from ttt.archive import open_text, strip_compression
 from ttt.cli import CliConfig, iodir_argparser, generic_main
-from ttt.date import read_date
+from ttt.datecache import (DateCache, add_date_cache_args,
+                           check_date_cache_args, report_date_cache)
+from ttt.pipeline import Stages, write_snippets
+
+# shared by the workers (see --date-cache)
+DATES = DateCache()
 
 _OTHER_ENTITIES = {'emacr': 275,
                    'utilde': 361}
@@ -79,25 +83,31 @@ def _column_to_text(xml):
     return "".join(xml.itertext())
 
 
-def _convert_row(doc_date, xml):
+def _row_date_text(xml):
     """
-    Given a default date (for the whole document) and a (date, entry)
-    row, return
-
-    * a (partial) iso string for the date
-    * the text for the entry
+    The (cleaned up) text of a row's date column, if it has one
     """
     ths = list(xml.iter('th'))
-    tds = list(xml.iter('td'))
     if len(ths) < 1:
-        date = None
+        return None
     elif len(ths) > 1:
         ET.dump(xml)
         raise Exception("Did not expect more than one th node")
     else:
-        th_text = _clean_date(ths[0].text or "")
-        date = read_date(th_text, prefix=doc_date, fuzzy=True)  # or doc_date
+        return _clean_date(ths[0].text or "")
+
 
+def _convert_row(doc_date, date, xml):
+    """
+    Given a default date (for the whole document), the date read
+    from the row's date column (if any) and a (date, entry) row,
+    return
+
+    * a (partial) iso string for the date
+    * the text for the entry
+    """
+    ths = list(xml.iter('th'))
+    tds = list(xml.iter('td'))
     columns = ths + tds
     text = "\n".join(_column_to_text(x) for x in columns)
     if text:
@@ -130,12 +140,21 @@ def _convert_section(xml):
     """
 
     some = lambda l: [x for x in l if x is not None]
-    dates = some(read_date(_clean_date(x.text))
-                 for x in xml.iter('head'))
+    dates = some(DATES.read_dates([_clean_date(x.text)
+                                   for x in xml.iter('head')]))
     section_date = dates[0] if dates else None
+    rows = list(xml.iter('tr'))
+    # read the dates for all the rows in one go
+    date_texts = [_row_date_text(r) for r in rows]
+    row_dates = iter(DATES.read_dates([x for x in date_texts
+                                       if x is not None],
+                                      prefix=section_date, fuzzy=True))
     for br_node in xml.iter('br'):
         br_node.text = "\n"
-    return [_convert_row(section_date, r) for r in xml.iter('tr')]
+    return [_convert_row(section_date,
+                         None if x is None else next(row_dates),
+                         r)
+            for x, r in zip(date_texts, rows)]
 
 
 def concat_l(items):
@@ -145,9 +164,10 @@ def concat_l(items):
     return list(itertools.chain.from_iterable(items))
 
 
-def convert(ifile):
+def convert_text(text):
     """
     Return a list of date, string tuples for each row in the table
+    (given the raw iso-8859-1 decoded XML)
     """
     # The data is actually iso-8859-1 converted but it
     # contains entities which are defined elsewhere,
@@ -158,11 +178,18 @@ def convert(ifile):
     #
     # Is there a cleaner way to do this?
     parser = ET.XMLParser(encoding='utf-8')
-    with codecs.open(ifile, 'r', 'iso-8859-1') as fin:
-        utext = unescape(fin.read()).encode('utf-8')
-        tree = ET.fromstringlist([utext], parser=parser)
-        return concat_l(_convert_section(x)
-                        for x in tree.findall('section'))
+    utext = unescape(text).encode('utf-8')
+    tree = ET.fromstringlist([utext], parser=parser)
+    return concat_l(_convert_section(x)
+                    for x in tree.findall('section'))
+
+
+def convert(ifile):
+    """
+    Return a list of date, string tuples for each row in the table
+    """
+    with open_text(ifile, 'iso-8859-1') as fin:
+        return convert_text(fin.read())
 
 
 def _non_empty(row):
@@ -172,37 +199,51 @@ def _non_empty(row):
     return [x for x in row if x] if row else []
 
 
-def _do_file(idir, text_dir, subpath):
+def _read(idir, subpath):
     """
-    Write converted output for a given file
+    Read stage: raw text for a given file
     """
-    ifile = fp.join(idir, subpath)
-    rows = [_non_empty(x) for x in convert(ifile)]
+    with open_text(fp.join(idir, subpath), 'iso-8859-1') as fin:
+        return fin.read()
+
+
+def _parse(subpath, text):
+    """
+    Parse stage: output snippets for a given file
+    """
+    rows = [_non_empty(x) for x in convert_text(text)]
     if not rows:
-        return
+        return []
     zwidth = int(math.floor(math.log10(len(rows)))) + 1
+    bname = fp.splitext(strip_compression(fp.basename(subpath)))[0]
+    snippets = []
     for i, row in enumerate(x for x in rows if x):
-        bname = fp.splitext(fp.basename(ifile))[0]
-        odir = fp.join(text_dir, bname[:4])
         tbase = "{prefix}-{row}".format(prefix=bname,
                                         row=str(i).zfill(zwidth))
-        if not fp.exists(odir):
-            os.makedirs(odir)
-        tfile = fp.join(odir, tbase)
-        with codecs.open(tfile, 'w', 'utf-8') as fout:
-            print("\n\n".join(row), file=fout)
+        snippets.append((fp.join(bname[:4], tbase),
+                         "\n\n".join(row) + "\n"))
+    return snippets
+
+
+# Write converted output for a given file
+STAGES = Stages(read=_read, parse=_parse, write=write_snippets)
+
+CONFIG = CliConfig(description='state papers to text',
+                   input_description='XML files',
+                   glob='*.xml')
 
 
 def main():
     """
     Read input dir, dump in output dir
     """
-    cfg = CliConfig(description='state papers to text',
-                    input_description='XML files',
-                    glob='*.xml')
-    psr = iodir_argparser(cfg)
+    psr = iodir_argparser(CONFIG)
+    add_date_cache_args(psr)
     args = psr.parse_args()
-    generic_main(cfg, _do_file, args)
+    check_date_cache_args(psr, args)
+    DATES.dirname = args.date_cache
+    generic_main(CONFIG, STAGES, args)
+    report_date_cache(DATES, args)
 
 
 if __name__ == '__main__':
@@ -16,6 +16,12 @@ DATA_DIR="$TTT_DIR"/GOLD/working
 
 bash "$SCRIPT_DIR/create-ttt-gold-tarball.sh"
 
+# results are kept in a snapshot store (GOLD/snapshots), which only
+# stores each distinct file once; the old robot results are hard
+# links to the latest snapshot
+SNAPSHOT_DIR="$TTT_DIR/GOLD/snapshots"
+STAMP=$(date +%Y-%m-%d-%H%M%S)
+
 for dataset in $DATASETS; do
     dataset_dir="$DATA_DIR/$dataset"
     old="$dataset_dir/json-$OLD_ROBOT"
@@ -26,8 +32,8 @@ for dataset in $DATASETS; do
         echo >&2 "Have you run nimrodel?"
         exit 1
     fi
-    rm -rf "$old"
-    cp -R "$new" "$old"
+    python "$SCRIPT_DIR/snapshot.py" "$SNAPSHOT_DIR"\
+        save "$dataset/$STAMP" "$new" --checkout "$old"
 done
 
 mv "$DATA_DIR/unit-tests-${NEW_ROBOT}.txt" "$DATA_DIR/unit-tests-${OLD_ROBOT}.txt"
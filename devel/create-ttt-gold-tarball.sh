@@ -1,8 +1,6 @@
 #!/bin/bash
 
-# Recreate the reports comparing the latest nimrodel
-# results against various reference systems and the
-# last nimrodel
+# Archive the GOLD working dir
 
 set -e
 DZERO=$(dirname "$0")
@@ -14,17 +12,12 @@ popd > /dev/null
 
 source "$SCRIPT_DIR/env"
 DATA_DIR="$TTT_DIR"/GOLD/working
-DATA_BNAME=$(basename "$DATA_DIR")
-
-# avoid including resource forks in the tarball
-# they confuse nimrodel
-export COPYFILE_DISABLE=1
 
+# a directory of tarballs (compressed in parallel) with a manifest;
+# only the files that changed since the latest archive are stored
+# (see gold-archive.py for restoring or reading the archives)
 TODAY=$(date +%Y-%m-%d)
-pushd "$DATA_DIR/.." > /dev/null
-TARBALL_BNAME=ttt-gold-$TODAY
-rm -rf "$TARBALL_BNAME"
-mv "$DATA_BNAME" "$TARBALL_BNAME"
-tar cjvf "${TARBALL_BNAME}.tar.bz" "$TARBALL_BNAME"
-mv "$TARBALL_BNAME"  "$DATA_BNAME"
-popd > /dev/null
+ARCHIVE="$TTT_DIR/GOLD/ttt-gold-$TODAY.tars"
+rm -rf "$ARCHIVE"
+python "$SCRIPT_DIR/gold-archive.py" build\
+    "$DATA_DIR" "$ARCHIVE" --incremental --jobs "$JOBS" "$@"
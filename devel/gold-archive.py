@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Build, restore or list chunked (and optionally incremental) archives
+of the GOLD working dir (see `ttt.goldarchive`)
+"""
+
+from __future__ import print_function
+from os import path as fp
+import argparse
+import glob
+import multiprocessing
+import sys
+
+from ttt.archive import (is_chunked_archive, iter_tar_members,
+                         read_chunked_manifest)
+from ttt.goldarchive import (DEFAULT_CHUNK_SIZE, ArchiveError,
+                             archive_chain, build_archive, restore_archive)
+from ttt.torpor import Torpor
+
+
+def _latest_archive(archive):
+    "the last archive (by name) in the same directory as this one"
+    pattern = fp.join(fp.dirname(fp.abspath(archive)), '*')
+    name = fp.basename(fp.normpath(archive))
+    others = [x for x in sorted(glob.glob(pattern))
+              if fp.basename(x) != name and is_chunked_archive(x)]
+    return others[-1] if others else None
+
+
+def _build(args):
+    "build an archive"
+    parent = args.parent
+    if args.incremental and parent is None:
+        parent = _latest_archive(args.archive)
+    desc = 'archiving {} ({})'.format(args.input,
+                                      'since ' + fp.basename(parent)
+                                      if parent else 'in full')
+    with Torpor(desc):
+        stats = build_archive(args.input, args.archive,
+                              parent=parent,
+                              processes=args.jobs,
+                              chunk_size=args.chunk_size * 1024 * 1024,
+                              compression=args.compression)
+    print('{}: {} files, {} new or changed ({} bytes in {} chunks)'
+          .format(args.archive, stats.files, stats.changed, stats.size,
+                  stats.chunks),
+          file=sys.stderr)
+
+
+def _restore(args):
+    "restore an archive"
+    with Torpor('restoring {}'.format(args.archive)):
+        count = restore_archive(args.archive, args.output,
+                                processes=args.jobs)
+    print('{}: {} files'.format(args.output, count), file=sys.stderr)
+
+
+def _list(args):
+    "list the contents of an archive"
+    print('chain: ' + ' <- '.join(archive_chain(args.archive)))
+    files = read_chunked_manifest(args.archive)['files']
+    for subpath, entry in sorted(files.items()):
+        print(u'{}\t{}/{}'.format(subpath, entry['archive'],
+                                  entry['chunk']).encode('utf-8'))
+
+
+def _cat(args):
+    "print files from an archive (without extracting it)"
+    for _, stream in iter_tar_members(args.archive, args.prefix):
+        sys.stdout.write(stream.read())
+
+
+def main():
+    """
+    Read cli args, do the subcommand
+    """
+    psr = argparse.ArgumentParser(description='GOLD dir archives')
+    subparsers = psr.add_subparsers()
+
+    psr_build = subparsers.add_parser('build', help='build an archive')
+    psr_build.add_argument('input', metavar='DIR',
+                           help='dir to archive (eg. GOLD/working)')
+    psr_build.add_argument('archive', metavar='DIR',
+                           help='archive to create '
+                           '(eg. GOLD/ttt-gold-YYYY-MM-DD.tars)')
+    psr_build.add_argument('--parent', metavar='DIR',
+                           help='only archive what changed since this '
+                           'archive (in the same directory)')
+    psr_build.add_argument('--incremental', action='store_true',
+                           help='only archive what changed since the '
+                           'latest archive in the same directory')
+    psr_build.add_argument('--chunk-size', metavar='MB', type=int,
+                           default=DEFAULT_CHUNK_SIZE // (1024 * 1024),
+                           help='(uncompressed) chunk size')
+    psr_build.add_argument('--compression', choices=['bz2', 'gz'],
+                           default='bz2')
+    psr_build.set_defaults(func=_build)
+
+    psr_restore = subparsers.add_parser('restore',
+                                        help='extract an archive')
+    psr_restore.add_argument('archive', metavar='DIR')
+    psr_restore.add_argument('output', metavar='DIR')
+    psr_restore.set_defaults(func=_restore)
+
+    psr_list = subparsers.add_parser('list', help='list archive contents')
+    psr_list.add_argument('archive', metavar='DIR')
+    psr_list.set_defaults(func=_list)
+
+    psr_cat = subparsers.add_parser('cat', help='print archived files')
+    psr_cat.add_argument('archive', metavar='DIR')
+    psr_cat.add_argument('prefix', metavar='DIR', nargs='?', default='',
+                         help='only files in this subdir')
+    psr_cat.set_defaults(func=_cat)
+
+    for subpsr in [psr_build, psr_restore]:
+        subpsr.add_argument('--jobs', '-j', metavar='N', type=int,
+                            default=multiprocessing.cpu_count(),
+                            help='number of processes to use')
+
+    args = psr.parse_args()
+    try:
+        args.func(args)
+    except ArchiveError as oops:
+        sys.exit(str(oops))
+
+
+if __name__ == '__main__':
+    main()
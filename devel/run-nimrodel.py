@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Run nimrodel on the unannotated text of several datasets at once,
+with a pool of nimrodel processes (see `ttt.nimrodel`)
+
+With `--cache`, only snippets that this version of nimrodel has not
+seen before are sent to it (see `ttt.cache`)
+"""
+
+from __future__ import print_function
+from os import path as fp
+import argparse
+import shlex
+import sys
+
+from ttt.cache import ResultCache, run_cached
+from ttt.nimrodel import DEFAULT_JOB_FILES, Scheduler, make_jobs
+from ttt.torpor import Torpor
+
+
+def main():
+    """
+    Read cli args, run nimrodel on all the datasets
+    """
+    psr = argparse.ArgumentParser(description='nimrodel scheduler')
+    psr.add_argument('data', metavar='DIR',
+                     help='data dir (eg. GOLD/working)')
+    psr.add_argument('datasets', metavar='DATASET', nargs='+',
+                     help='datasets (subdirs of the data dir with '
+                     'an unannotated dir)')
+    psr.add_argument('--output', metavar='NAME', default='json-nimrodel',
+                     help='where to put the results (within each '
+                     'dataset dir)')
+    psr.add_argument('--nimrodel', metavar='COMMAND', default='nimrodel',
+                     help='how to run nimrodel '
+                     '(eg. "bash ../nimrodel/bin/nimrodel")')
+    psr.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+                     help='number of nimrodel processes to run at a time')
+    psr.add_argument('--job-files', metavar='N', type=int,
+                     default=DEFAULT_JOB_FILES,
+                     help='number of files to give nimrodel at a time')
+    psr.add_argument('--timeout', metavar='SECONDS', type=float,
+                     help='give up on (and split) any job that takes '
+                     'longer than this')
+    psr.add_argument('--verbose', '-v', action='store_true',
+                     help='report on each job')
+    psr.add_argument('--cache', metavar='DIR',
+                     help='reuse results for snippets seen before')
+    psr.add_argument('--version', metavar='STRING',
+                     help='(with --cache) nimrodel version/config '
+                     '(eg. a hash of its source tree)')
+    args = psr.parse_args()
+    if args.cache and not args.version:
+        psr.error('--cache needs --version')
+
+    dirs = [(fp.join(args.data, d, 'unannotated'),
+             fp.join(args.data, d, args.output))
+            for d in args.datasets]
+    scheduler = Scheduler(shlex.split(args.nimrodel),
+                          workers=args.jobs,
+                          timeout=args.timeout,
+                          verbose=args.verbose)
+    if args.cache:
+        cache = ResultCache(args.cache, args.version)
+        with Torpor('running nimrodel (cached)'):
+            failures, stats = run_cached(scheduler, cache, dirs,
+                                         max_files=args.job_files)
+        print('{} files from cache, {} new snippets '
+              '(+ {} duplicates)'.format(stats.hits, stats.misses,
+                                         stats.duplicates),
+              file=sys.stderr)
+    else:
+        jobs = []
+        for dataset, (idir, odir) in zip(args.datasets, dirs):
+            jobs.extend(make_jobs(dataset, idir, odir,
+                                  max_files=args.job_files))
+        with Torpor('running nimrodel ({} jobs)'.format(len(jobs))):
+            failures = scheduler.run(jobs)
+    for ifile, error in sorted(failures.items()):
+        print('ERROR processing {}: {}'.format(ifile, error),
+              file=sys.stderr)
+    if failures:
+        print('{} file(s) failed'.format(len(failures)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
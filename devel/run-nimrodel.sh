@@ -10,27 +10,20 @@ popd > /dev/null
 source "$SCRIPT_DIR/env"
 DATA_DIR="$TTT_DIR/GOLD/working"
 
-bash "$NIMRODEL_DIR/bin/nimrodel" selftest > "$DATA_DIR/unit-tests-${NEW_ROBOT}.txt"
-
-which parallel > /dev/null
-if [ $? -eq 0 ]; then
-    NIMRODEL_SUBCMD=parallel-dir
-    NIMRODEL_ARGS=$JOBS
-else
-    NIMRODEL_SUBCMD=dir
-    NIMRODEL_ARGS=
-fi
-
-
-for dataset in $DATASETS; do
-    dataset_dir="$DATA_DIR/$dataset"
-    time bash "$NIMRODEL_DIR/bin/nimrodel" "$NIMRODEL_SUBCMD"\
-        $NIMRODEL_ARGS\
-        "$dataset_dir/unannotated"\
-        "$dataset_dir/json-$NEW_ROBOT"
-done
-
-bash "$SCRIPT_DIR/create-reports.sh"
+# results are cached by snippet text and nimrodel source tree
+# (committed and uncommitted changes)
+NIMRODEL_VERSION=$(cd "$NIMRODEL_DIR" && { git rev-parse HEAD; git diff HEAD; }\
+    | shasum | cut -d' ' -f1)
+
+# unit tests, nimrodel on all datasets at once ($JOBS nimrodel
+# processes at a time; set NIMRODEL_TIMEOUT to give up on inputs that
+# take too long), and then the reports
+run_tasks\
+    --nimrodel "bash '$NIMRODEL_DIR/bin/nimrodel'"\
+    --nimrodel-version "$NIMRODEL_VERSION"\
+    --nimrodel-jobs "$JOBS"\
+    ${NIMRODEL_TIMEOUT:+--timeout "$NIMRODEL_TIMEOUT"}\
+    --cache "$TTT_DIR/GOLD/cache"
 
 echo >&2 ""
 echo >&2 "Have a look at the reports in $DATA_DIR"
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Bring the GOLD working dir up to date: convert the annotations to
+json, run nimrodel, list the entities for each system, and compare
+each system against the reference systems (see `ttt.dag`)
+
+Only the steps whose inputs have changed since they were last run
+are run again, as many at a time as `--jobs` allows
+"""
+
+from __future__ import print_function
+from os import path as fp
+import argparse
+import codecs
+import fnmatch
+import hashlib
+import shlex
+import subprocess
+import sys
+import time
+
+from ttt.cli import walk_sorted
+from ttt.dag import BLOCKED, FAILED, DagError, Task, TaskRunner
+from ttt.manifest import file_sha1
+
+TTT_DIR = fp.dirname(fp.dirname(fp.abspath(__file__)))
+STATE_FILE = '.ttt-tasks.json'
+MK_REPORT = fp.join(TTT_DIR, 'evaluation', 'mk-report.py')
+PRINT_ENTITIES = fp.join(TTT_DIR, 'evaluation', 'print-entities.py')
+
+
+def code_salt(script):
+    """
+    A hash of a script and of the `ttt` package sources (but not its
+    tests), so that tasks run again when our own code changes.
+
+    (We hash the sources rather than listing the package dir as an
+    input, which would also pick up the .pyc files that running the
+    tasks leaves behind)
+    """
+    pkg_dir = fp.join(TTT_DIR, 'ttt')
+    sources = [(fp.basename(script), script)]
+    sources.extend((fp.join('ttt', s), fp.join(pkg_dir, s))
+                   for s in walk_sorted(pkg_dir)
+                   if s.endswith('.py') and
+                   not fp.basename(s).startswith('test_'))
+    digest = hashlib.sha1()
+    for name, filename in sources:
+        digest.update('{}\0{}\n'.format(name, file_sha1(filename)))
+    return digest.hexdigest()
+
+
+def write_entities_list(edir, ofile):
+    """
+    Gather the entities in a directory of entities files into a
+    single sorted list (without duplicates)
+    """
+    entities = set()
+    for subpath in walk_sorted(edir):
+        with codecs.open(fp.join(edir, subpath), 'r', 'utf-8') as stream:
+            entities.update(stream.read().splitlines())
+    with codecs.open(ofile, 'w', 'utf-8') as stream:
+        for entity in sorted(entities):
+            print(entity, file=stream)
+
+
+def entities_action(jdir, edir, ofile):
+    """
+    print-entities and gather the results
+    """
+    def entities():
+        "list the entities"
+        subprocess.check_call([sys.executable, PRINT_ENTITIES, jdir, edir])
+        write_entities_list(edir, ofile)
+    return entities
+
+
+def selftest_action(command, ofile):
+    """
+    Save the results of nimrodel's unit tests
+    """
+    def selftest():
+        "run the unit tests"
+        with open(ofile, 'w') as stream:
+            subprocess.call(command + ['selftest'], stdout=stream)
+    return selftest
+
+
+def report_pairs(args):
+    """
+    The (before, after) pairs of systems to compare (each only once)
+    """
+    refs = args.ref_systems
+    pairs = [(args.annotator, r) for r in refs + [args.old_robot]
+             if r != args.annotator]
+    pairs.extend((r, robot)
+                 for robot in [args.old_robot, args.new_robot]
+                 for r in refs)
+    pairs.append((args.old_robot, args.new_robot))
+    return [p for i, p in enumerate(pairs) if p not in pairs[:i]]
+
+
+def mk_tasks(args):
+    """
+    The task graph for the GOLD working dir
+    """
+    tasks = []
+    data = args.data
+    run_nimrodel = args.nimrodel is not None
+
+    if run_nimrodel:
+        command = shlex.split(args.nimrodel)
+        # without a version we cannot tell if nimrodel has changed,
+        # so it always has to run
+        version = args.nimrodel_version or str(time.time())
+        selftest_file = fp.join(data,
+                                'unit-tests-{}.txt'.format(args.new_robot))
+        tasks.append(Task(name='selftest',
+                          inputs=[],
+                          outputs=[selftest_file],
+                          action=selftest_action(command, selftest_file),
+                          salt=version))
+        nimrodel_cmd = [sys.executable,
+                        fp.join(TTT_DIR, 'devel', 'run-nimrodel.py'),
+                        '--nimrodel', args.nimrodel,
+                        '--jobs', str(args.nimrodel_jobs),
+                        '--output', 'json-' + args.new_robot]
+        if args.timeout is not None:
+            nimrodel_cmd.extend(['--timeout', str(args.timeout)])
+        if args.cache is not None:
+            nimrodel_cmd.extend(['--cache', args.cache,
+                                 '--version', version])
+        nimrodel_cmd.append(data)
+        nimrodel_cmd.extend(args.datasets)
+        # run-nimrodel.py fails if nimrodel could not process some
+        # inputs, so that the task is not taken to be up to date (and
+        # runs again next time) while some of its output is missing
+        tasks.append(Task(name='nimrodel',
+                          inputs=[fp.join(data, d, 'unannotated')
+                                  for d in args.datasets],
+                          outputs=[fp.join(data, d, 'json-' + args.new_robot)
+                                   for d in args.datasets],
+                          action=nimrodel_cmd,
+                          salt=version))
+
+    # the entities lists and reports only depend on the json dirs as
+    # far as the fingerprints are concerned, so changes to the code
+    # that makes them have to come in through the salt
+    entities_salt = code_salt(PRINT_ENTITIES)
+    report_salt = code_salt(MK_REPORT)
+    report_includes = [fp.join(TTT_DIR, 'evaluation', d)
+                       for d in ['css', 'js']]
+
+    for dataset in args.datasets:
+        ddir = fp.join(data, dataset)
+        script = fp.join(TTT_DIR, 'oneoff', 'annotations-to-json.py')
+        tasks.append(Task(name='annotations:' + dataset,
+                          inputs=[fp.join(ddir, 'annotations-' +
+                                          args.annotator),
+                                  script],
+                          outputs=[fp.join(ddir, 'json-' + args.annotator)],
+                          action=[sys.executable, script,
+                                  fp.join(ddir, 'annotations-' +
+                                          args.annotator),
+                                  fp.join(ddir, 'json-' + args.annotator)],
+                          salt=''))
+        systems = args.ref_systems + [args.old_robot, args.new_robot]
+        for system in systems:
+            jdir = fp.join(ddir, 'json-' + system)
+            edir = fp.join(ddir, 'entities-' + system)
+            tasks.append(Task(name='entities:{}:{}'.format(dataset, system),
+                              inputs=[jdir],
+                              outputs=[edir, edir + '.txt'],
+                              action=entities_action(jdir, edir,
+                                                     edir + '.txt'),
+                              salt=entities_salt))
+        for before, after in report_pairs(args):
+            odir = fp.join(ddir, 'report-{}-v-{}'.format(before, after))
+            tasks.append(Task(name='report:{}:{}-v-{}'.format(dataset,
+                                                              before,
+                                                              after),
+                              inputs=[fp.join(ddir, 'json-' + before),
+                                      fp.join(ddir, 'json-' + after)] +
+                              report_includes,
+                              outputs=[odir],
+                              action=[sys.executable, MK_REPORT,
+                                      '--before',
+                                      fp.join(ddir, 'json-' + before),
+                                      fp.join(ddir, 'json-' + after),
+                                      odir],
+                              salt=report_salt))
+    return tasks
+
+
+def select_targets(tasks, targets):
+    """
+    The names of the tasks for the targets: a task name or pattern,
+    or a prefix for task names (eg. `annotations`, `report:fine-rolls`,
+    `entities:*:eric`)
+    """
+    if not targets:
+        return None
+    names = []
+    for target in targets:
+        matches = [t.name for t in tasks
+                   if fnmatch.fnmatchcase(t.name, target) or
+                   t.name.startswith(target + ':')]
+        if not matches:
+            raise DagError('no tasks for target {}'.format(target))
+        names.extend(matches)
+    return names
+
+
+def main():
+    """
+    Read cli args, bring the targets up to date
+    """
+    psr = argparse.ArgumentParser(description='GOLD working dir tasks')
+    psr.add_argument('targets', metavar='TARGET', nargs='*',
+                     help='what to bring up to date (a task name, '
+                     'pattern or prefix, eg. "annotations", '
+                     '"report:fine-rolls"; default: everything)')
+    psr.add_argument('--data', metavar='DIR', required=True,
+                     help='data dir (eg. GOLD/working)')
+    psr.add_argument('--datasets', metavar='DATASET', nargs='+',
+                     required=True)
+    psr.add_argument('--annotator', metavar='SYSTEM', required=True)
+    psr.add_argument('--ref-systems', metavar='SYSTEM', nargs='+',
+                     required=True)
+    psr.add_argument('--old-robot', metavar='SYSTEM', required=True)
+    psr.add_argument('--new-robot', metavar='SYSTEM', required=True)
+    psr.add_argument('--nimrodel', metavar='COMMAND',
+                     help='how to run nimrodel (if not given, we just '
+                     'use whatever nimrodel output there already is)')
+    psr.add_argument('--nimrodel-version', metavar='STRING',
+                     help='nimrodel version/config (eg. a hash of '
+                     'its source tree)')
+    psr.add_argument('--nimrodel-jobs', metavar='N', type=int, default=1,
+                     help='number of nimrodel processes to run at a time')
+    psr.add_argument('--timeout', metavar='SECONDS', type=float,
+                     help='give up on any nimrodel job that takes '
+                     'longer than this')
+    psr.add_argument('--cache', metavar='DIR',
+                     help='reuse nimrodel results for snippets seen '
+                     'before')
+    psr.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+                     help='number of tasks to run at a time')
+    psr.add_argument('--force', action='store_true',
+                     help='run tasks even if they seem up to date')
+    psr.add_argument('--dry-run', '-n', action='store_true',
+                     help='just list the tasks that need to run')
+    args = psr.parse_args()
+
+    tasks = mk_tasks(args)
+    try:
+        runner = TaskRunner(tasks, fp.join(args.data, STATE_FILE),
+                            jobs=args.jobs)
+        targets = select_targets(tasks, args.targets)
+        if args.dry_run:
+            for name in runner.stale(targets):
+                print(name)
+            return
+        status = runner.run(targets, force=args.force)
+    except DagError as oops:
+        sys.exit(str(oops))
+    bad = sorted(n for n, s in status.items() if s in [FAILED, BLOCKED])
+    counts = {}
+    for result in status.values():
+        counts[result] = counts.get(result, 0) + 1
+    print(', '.join('{} {}'.format(n, s) for s, n in sorted(counts.items())),
+          file=sys.stderr)
+    for name in bad:
+        print('{}: {}'.format(name, status[name]), file=sys.stderr)
+    if bad:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
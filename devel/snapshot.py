@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Save, check out and manage snapshots of result directories (eg. the
+blessed nimrodel results) in a content-addressed store (see
+`ttt.snapshot`)
+"""
+
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+from ttt.snapshot import SnapshotError, SnapshotStore
+
+
+def _save(args):
+    "save a snapshot"
+    store = SnapshotStore(args.store)
+    name = args.name
+    if name.endswith('/'):
+        name += time.strftime('%Y-%m-%d-%H%M%S')
+    previous = args.since
+    if previous is None and '/' in name.rstrip('/'):
+        previous = store.latest(name.rsplit('/', 1)[0] + '/')
+    stats = store.save(name, args.input, previous=previous)
+    print('{}: {} files ({} read, {} new)'.format(name, stats.files,
+                                                 stats.hashed,
+                                                 stats.stored),
+          file=sys.stderr)
+    if args.checkout is not None:
+        _checkout_as(store, name, args.checkout, link=True)
+
+
+def _checkout_as(store, name, output, link):
+    "check out a snapshot, with a progress report"
+    changed = store.checkout(name, output, link=link)
+    print('{}: {} files updated'.format(output, changed), file=sys.stderr)
+
+
+def _checkout(args):
+    "check out a snapshot"
+    store = SnapshotStore(args.store)
+    name = args.name
+    if name.endswith('/'):
+        name = store.latest(name)
+        if name is None:
+            raise SnapshotError('no snapshots for {}'.format(args.name))
+    _checkout_as(store, name, args.output, link=not args.copy)
+
+
+def _list(args):
+    "list snapshots"
+    for name in SnapshotStore(args.store).snapshots(args.prefix):
+        print(name)
+
+
+def _drop(args):
+    "forget snapshots"
+    store = SnapshotStore(args.store)
+    for name in args.names:
+        store.drop(name)
+    if args.gc:
+        _gc(args)
+
+
+def _gc(args):
+    "clean up the store"
+    removed = SnapshotStore(args.store).gc()
+    print('{} unused files removed'.format(removed), file=sys.stderr)
+
+
+def main():
+    """
+    Read cli args, do the subcommand
+    """
+    psr = argparse.ArgumentParser(description='result snapshots')
+    psr.add_argument('store', metavar='DIR',
+                     help='snapshot store (eg. GOLD/snapshots)')
+    subparsers = psr.add_subparsers()
+
+    psr_save = subparsers.add_parser('save', help='save a snapshot')
+    psr_save.add_argument('name', metavar='NAME',
+                          help='snapshot name (ending with a slash, eg. '
+                          '"fine-rolls/", to add a timestamp)')
+    psr_save.add_argument('input', metavar='DIR',
+                          help='directory to save')
+    psr_save.add_argument('--since', metavar='NAME',
+                          help='assume that files with the same size and '
+                          'modification time as in this snapshot have not '
+                          'changed (default: the latest one with the '
+                          'same prefix)')
+    psr_save.add_argument('--checkout', metavar='DIR',
+                          help='then check the snapshot out here')
+    psr_save.set_defaults(func=_save)
+
+    psr_checkout = subparsers.add_parser('checkout',
+                                         help='check a snapshot out')
+    psr_checkout.add_argument('name', metavar='NAME',
+                              help='snapshot name (or prefix ending with '
+                              'a slash for the latest one)')
+    psr_checkout.add_argument('output', metavar='DIR',
+                              help='where to check it out')
+    psr_checkout.add_argument('--copy', action='store_true',
+                              help='copy files instead of hard linking '
+                              'them to the store')
+    psr_checkout.set_defaults(func=_checkout)
+
+    psr_list = subparsers.add_parser('list', help='list snapshots')
+    psr_list.add_argument('prefix', metavar='PREFIX', nargs='?', default='')
+    psr_list.set_defaults(func=_list)
+
+    psr_drop = subparsers.add_parser('drop', help='forget snapshots')
+    psr_drop.add_argument('names', metavar='NAME', nargs='+')
+    psr_drop.add_argument('--gc', action='store_true',
+                          help='then remove files no snapshot uses')
+    psr_drop.set_defaults(func=_drop)
+
+    psr_gc = subparsers.add_parser('gc',
+                                   help='remove files no snapshot uses')
+    psr_gc.set_defaults(func=_gc)
+
+    args = psr.parse_args()
+    try:
+        args.func(args)
+    except SnapshotError as oops:
+        sys.exit(str(oops))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Convert a dataset, run nimrodel on it and score the results against a
+reference, all at the same time (see `ttt.stream`), reporting the
+running scores as we go
+"""
+
+from __future__ import print_function
+import argparse
+import shlex
+import sys
+
+from ttt.cli import read_records
+from ttt.nimrodel import DEFAULT_JOB_FILES
+from ttt.stream import StreamingRun, load_stages, print_progress
+
+
+def main():
+    """
+    Read cli args, run everything
+    """
+    psr = argparse.ArgumentParser(description='streaming nimrodel run')
+    psr.add_argument('converter', metavar='SCRIPT',
+                     help='converter script (eg. '
+                     'converters/fine-rolls-to-text.py)')
+    psr.add_argument('input', metavar='DIR',
+                     help='raw data (input for the converter)')
+    psr.add_argument('text', metavar='DIR',
+                     help='where to put the converter output')
+    psr.add_argument('json', metavar='DIR',
+                     help='where to put the nimrodel output')
+    psr.add_argument('--reference', metavar='DIR',
+                     help='json dir to score the results against')
+    psr.add_argument('--nimrodel', metavar='COMMAND', default='nimrodel',
+                     help='how to run nimrodel '
+                     '(eg. "bash ../nimrodel/bin/nimrodel")')
+    psr.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+                     help='number of nimrodel processes to run at a time')
+    psr.add_argument('--job-files', metavar='N', type=int,
+                     default=DEFAULT_JOB_FILES,
+                     help='number of files to give nimrodel at a time')
+    psr.add_argument('--timeout', metavar='SECONDS', type=float,
+                     help='give up on (and split) any job that takes '
+                     'longer than this')
+    psr.add_argument('--report-every', metavar='SECONDS', type=float,
+                     default=60,
+                     help='how often to report progress')
+    args = psr.parse_args()
+
+    stages, config = load_stages(args.converter)
+    reference = None if args.reference is None\
+        else read_records(args.reference)
+    run = StreamingRun(stages, shlex.split(args.nimrodel),
+                       args.text, args.json,
+                       reference=reference,
+                       workers=args.jobs,
+                       job_files=args.job_files,
+                       timeout=args.timeout)
+    scores = run.run(args.input, config.glob,
+                     on_progress=print_progress,
+                     interval=args.report_every)
+    print_progress((run.converted, run.processed, scores))
+    for subpath, error in sorted(run.convert_failures.items()):
+        print('ERROR converting', subpath, file=sys.stderr)
+        print(error, file=sys.stderr)
+    for subpath, error in sorted(run.failures.items()):
+        print('ERROR running nimrodel on {}: {}'.format(subpath, error),
+              file=sys.stderr)
+    if run.convert_failures or run.failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,20 +12,5 @@ popd > /dev/null
 source "$SCRIPT_DIR/env"
 DATA_DIR="$TTT_DIR"/GOLD/working
 
-for dataset in $DATASETS; do
-    dataset_dir="$DATA_DIR/$dataset"
-    human_json_dir="$dataset_dir/json-$ANNOTATOR"
-
-    # convert annotations to json
-    python "$TTT_DIR/oneoff/annotations-to-json.py"\
-        "$dataset_dir/annotations-$ANNOTATOR"\
-        "$human_json_dir"
-
-    # convenient entities list
-    print-entities.py\
-        "$human_json_dir"\
-        "$dataset_dir/entities-$ANNOTATOR"
-    cat "$dataset_dir/entities-$ANNOTATOR"/*\
-        | sort | uniq\
-        > "$dataset_dir/entities-${ANNOTATOR}.txt"
-done
+# convert annotations to json, and list their entities
+run_tasks annotations "entities:*:$ANNOTATOR"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Run nimrodel on converter output in batches of snippets rather than
+one snippet at a time (see `ttt.batch`)
+
+* pack: glue snippets into batches (for running nimrodel by hand)
+* unpack: split nimrodel's output for the batches back up by snippet
+* run: pack, run nimrodel on each batch (bisecting the batches that
+  it crashes on) and unpack
+"""
+
+from __future__ import print_function
+from os import path as fp
+import argparse
+import json
+import shlex
+import sys
+
+from ttt.batch import (DEFAULT_BATCH_SIZE, SEPARATOR,
+                       batch_text_dir, iter_snippets, load_batches,
+                       pack_snippets, run_bisecting, save_batch,
+                       save_records)
+from ttt.nimrodel import batch_runner
+from ttt.torpor import Torpor
+
+
+def _separator(string):
+    "separator from the command line (with backslash escapes)"
+    return string.decode('string_escape').decode('utf-8')
+
+
+def _add_pack_args(psr):
+    "options for how to batch things up"
+    psr.add_argument('--batch-size', metavar='CHARS', type=int,
+                     default=DEFAULT_BATCH_SIZE,
+                     help='maximum size of a batch')
+    psr.add_argument('--separator', type=_separator, default=SEPARATOR,
+                     help='what to put between snippets '
+                     '(default: %(default)r)')
+
+
+def _pack(args):
+    "pack subcommand"
+    with Torpor('packing snippets [{}]'.format(args.input)):
+        for batch in pack_snippets(iter_snippets(args.input),
+                                   max_size=args.batch_size,
+                                   separator=args.separator):
+            save_batch(batch, args.output)
+    print('now run nimrodel on', batch_text_dir(args.output),
+          file=sys.stderr)
+
+
+def _unpack(args):
+    "unpack subcommand"
+    failures = []
+    with Torpor('unpacking records [{}]'.format(args.json)):
+        for batch in load_batches(args.batches):
+            try:
+                with open(fp.join(args.json, batch.name)) as stream:
+                    save_records(args.output,
+                                 batch.unpack(json.load(stream)))
+            except Exception as oops:  # pylint: disable=broad-except
+                failures.append((batch.name, oops))
+    for name, oops in failures:
+        print('ERROR unpacking {}: {}'.format(name, oops), file=sys.stderr)
+    if failures:
+        print('{} batch(es) failed (try the run subcommand, which '
+              'bisects them)'.format(len(failures)), file=sys.stderr)
+        sys.exit(1)
+
+
+def _run(args):
+    "run subcommand"
+    run = batch_runner(shlex.split(args.nimrodel))
+    failures = []
+    with Torpor('running nimrodel on batches [{}]'.format(args.input)):
+        for batch in pack_snippets(iter_snippets(args.input),
+                                   max_size=args.batch_size,
+                                   separator=args.separator):
+            for piece, pairs, error in run_bisecting(batch, run):
+                if error is None:
+                    save_records(args.output, pairs)
+                else:
+                    failures.append((piece.ids[0], error))
+    for subpath, error in failures:
+        print('ERROR processing', subpath, file=sys.stderr)
+        print(error, file=sys.stderr)
+    if failures:
+        print('{} snippet(s) failed'.format(len(failures)), file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    """
+    Read cli args, do the subcommand
+    """
+    psr = argparse.ArgumentParser(description='batched nimrodel')
+    subparsers = psr.add_subparsers()
+
+    psr_pack = subparsers.add_parser('pack', help='make batches')
+    psr_pack.add_argument('input', metavar='DIR',
+                          help='converter output (dir or corpus file)')
+    psr_pack.add_argument('output', metavar='DIR',
+                          help='batch directory')
+    _add_pack_args(psr_pack)
+    psr_pack.set_defaults(func=_pack)
+
+    psr_unpack = subparsers.add_parser('unpack', help='split results')
+    psr_unpack.add_argument('batches', metavar='DIR',
+                            help='batch directory')
+    psr_unpack.add_argument('json', metavar='DIR',
+                            help='nimrodel output for the batches')
+    psr_unpack.add_argument('output', metavar='DIR',
+                            help='output directory')
+    psr_unpack.set_defaults(func=_unpack)
+
+    psr_run = subparsers.add_parser('run', help='run nimrodel')
+    psr_run.add_argument('input', metavar='DIR',
+                         help='converter output (dir or corpus file)')
+    psr_run.add_argument('output', metavar='DIR',
+                         help='output directory')
+    psr_run.add_argument('--nimrodel', metavar='COMMAND',
+                         default='nimrodel',
+                         help='how to run nimrodel '
+                         '(eg. "bash ../nimrodel/bin/nimrodel")')
+    _add_pack_args(psr_run)
+    psr_run.set_defaults(func=_run)
+
+    args = psr.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Write the snippets in a corpus file (eg. from a converter run with
+`--corpus`) out as a directory of text files, one per snippet, which
+is what nimrodel wants (see `ttt.corpus`)
+"""
+
+from __future__ import print_function
+import argparse
+
+from ttt.cli import add_shard_arg
+from ttt.corpus import Corpus, export_corpus
+from ttt.torpor import Torpor
+
+
+def main():
+    """
+    Read input corpus, dump in output dir
+    """
+    psr = argparse.ArgumentParser(description='corpus exporter')
+    psr.add_argument('input', metavar='FILE', help='corpus file')
+    psr.add_argument('output', metavar='DIR', help='output directory')
+    add_shard_arg(psr)
+    args = psr.parse_args()
+    want = None if args.shard is None else args.shard.includes
+    with Torpor('exporting corpus [{}]'.format(args.input)):
+        with Corpus(args.input) as corpus:
+            export_corpus(corpus, args.output, want=want)
+
+
+if __name__ == '__main__':
+    main()
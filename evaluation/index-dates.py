@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Index the records in a json dir (eg. nimrodel output) by their
+appearanceDate (see `ttt.dateindex`), so that mk-report.py can
+report on a window of dates without reading the whole dir.
+
+Run this again whenever the json dir changes (mk-report.py notices
+if the index is out of date, and reads the whole dir instead)
+"""
+
+from __future__ import print_function
+import argparse
+import sys
+
+from ttt.dateindex import default_index_path, index_dir
+from ttt.torpor import Torpor
+
+
+def main():
+    """
+    Read input dir, write index
+    """
+    psr = argparse.ArgumentParser(description='json dir date indexer')
+    psr.add_argument('input', metavar='DIR', help='dir with json files')
+    psr.add_argument('--output', metavar='FILE',
+                     help='where to write the index (default: '
+                     'DIR.date-index, which is where mk-report.py '
+                     'looks for it)')
+    psr.add_argument('--threads', metavar='N', type=int, default=1,
+                     help='number of threads to read json files with')
+    psr.add_argument('--processes', metavar='N', type=int, default=1,
+                     help='number of processes to decode json files with')
+    args = psr.parse_args()
+    ofile = args.output or default_index_path(args.input)
+    with Torpor('indexing dates [{}]'.format(args.input)):
+        index = index_dir(args.input,
+                          threads=args.threads,
+                          processes=args.processes)
+        index.save(ofile)
+    print('{} dated records in {} files'.format(len(index),
+                                               len(index.paths)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
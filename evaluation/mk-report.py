@@ -17,6 +17,7 @@ produce an HTML report
 from __future__ import print_function
 from collections import defaultdict, Counter
 from itertools import chain
+from multiprocessing.pool import ThreadPool
 from os import path as fp
 import argparse
 import codecs
@@ -25,11 +26,17 @@ import itertools
 import glob
 import os
 import shutil
+import sys
 
 from html import XHTML
 
-from ttt.cli import read_records
-from ttt.score import score_records, SCORE_KEYS
+from ttt.cli import (add_record_filter_args, iter_records, path_sort_key,
+                     read_records, record_filter)
+from ttt.compact import CompactRecord, compact_record
+from ttt.date import date_ranges, pack_isos, unpack_isos
+from ttt.dateindex import (DateIndex, default_index_path, subrecord_range,
+                           window_range)
+from ttt.score import score_streams, SCORE_KEYS
 from ttt.torpor import Torpor
 
 # ---------------------------------------------------------------------
@@ -164,10 +171,17 @@ def count(fun, items):
 
 def count_and_mean(fun, items):
     """
-    ((v -> int), [v]) -> (int, int)
+    ((v -> int), Iterable v) -> (int, int)
+
+    (single pass, so you can give this a stream of items, eg. from
+    `ttt.cli.iter_records`)
     """
-    total = count(fun, items)
-    avg = float(total)/len(items) if items else 0.0
+    total = 0
+    num_items = 0
+    for item in items:
+        total += fun(item)
+        num_items += 1
+    avg = float(total)/num_items if num_items else 0.0
     return (total, avg)
 
 
@@ -498,12 +512,24 @@ def mk_score_report(ofile, records_ref, records_tst):
     """
     Emit a scoring table, showing precision, recall, etc scores
     for each file as well as an aggregrate score
+
+    The records are streams of (filename, records) pairs sorted on
+    their filenames (eg. from `ttt.cli.iter_records`, or
+    `_sorted_records`)
     """
+    ref_keys = []
+
+    def note_keys(pairs):
+        "remember the reference filenames as they go by"
+        for pair in pairs:
+            ref_keys.append(pair[0])
+            yield pair
+
     with Torpor('computing scores'):
         agg_scores, indiv_scores = \
-            score_records(records_ref, records_tst)
+            score_streams(note_keys(records_ref), records_tst)
     with Torpor('saving scores'):
-        _save_scores(ofile, agg_scores, indiv_scores, records_ref.keys())
+        _save_scores(ofile, agg_scores, indiv_scores, ref_keys)
 
 # ---------------------------------------------------------------------
 # tabular report
@@ -674,36 +700,56 @@ def _subrec_key(subrec):
     return tuple(sorted(map(tweak, subrec.items())))
 
 
+def _date_ranges(groups, dates, num_groups):
+    """
+    earliest and latest date (None if there are none) in each group,
+    given the group of each date
+    """
+    try:
+        packed = pack_isos(dates)
+    except ValueError:
+        # not all ISO dates, so just compare them as strings
+        lows = [None] * num_groups
+        highs = [None] * num_groups
+        for group, date in zip(groups, dates):
+            if lows[group] is None or date < lows[group]:
+                lows[group] = date
+            if highs[group] is None or date > highs[group]:
+                highs[group] = date
+        return lows, highs
+    lows, highs = date_ranges(groups, packed, num_groups)
+    return unpack_isos(lows), unpack_isos(highs)
+
+
 def _condense_helper(subrecs):
     """
     count the instances of a subrecord within a record
     """
     counts = defaultdict(int)
-    dates = defaultdict(set)
+    indices = {}
     subrecs2 = []
+    # (index in subrecs2, date) for each date
+    date_groups = []
+    dates = []
     for subrec in subrecs:
         key = _subrec_key(subrec)
         if key not in counts:
             subrec2 = copy.copy(subrec)
+            indices[key] = len(subrecs2)
             subrecs2.append(subrec2)
         counts[key] += 1
         date = subrec2.get(_DATE_COL)
         if date is not None:
-            dates[key].add(date)
+            date_groups.append(indices[key])
+            dates.append(date)
 
-    has_date_range = any(dates.values())
-
-    for subrec in subrecs2:
+    lows, highs = _date_ranges(date_groups, dates, len(subrecs2))
+    for subrec, low, high in zip(subrecs2, lows, highs):
         key = _subrec_key(subrec)
         subrec['count'] = counts[key]
-        sdates = dates.get(key)
-        if sdates is None:
-            pass
-        elif not has_date_range:
-            subrec[_DATE_COL] = list(sdates)[0]
-        else:
-            subrec[_DATE_COL_MIN] = min(sdates)
-            subrec[_DATE_COL_MAX] = max(sdates)
+        if low is not None:
+            subrec[_DATE_COL_MIN] = low
+            subrec[_DATE_COL_MAX] = high
             if _DATE_COL in subrec:
                 del subrec[_DATE_COL]
 
@@ -748,17 +794,100 @@ def _norm_records(records):
     Tidy up whitespace within records
     """
     records2 = {}
+    # tidied values are new strings, so compact records need to share
+    # them all over again
+    interned = {}
     for fname, subrecs in records.items():
         subrecs2 = []
         for subrec in subrecs:
-            subrec2 = {}
-            for key in subrec:
-                subrec2[key] = " ".join(subrec[key].split())
+            pairs = [(k, " ".join(v.split())) for k, v in subrec.items()]
+            # same type as the original (which may be a CompactRecord)
+            if isinstance(subrec, CompactRecord):
+                subrec2 = CompactRecord(pairs, interned=interned)
+            else:
+                subrec2 = type(subrec)(pairs)
             subrecs2.append(subrec2)
         records2[fname] = subrecs2
     return records2
 
 
+def _sorted_records(records):
+    """
+    (filename, records) pairs in filename order (see
+    `ttt.cli.path_sort_key`)
+    """
+    return ((k, records[k]) for k in sorted(records, key=path_sort_key))
+
+
+def _load_date_index(inputdir):
+    """
+    the date index for a dir, if it has one that is up to date
+    """
+    ifile = default_index_path(inputdir)
+    if not fp.exists(ifile):
+        return None
+    try:
+        index = DateIndex.load(ifile)
+    except IOError as oops:
+        print('{}; reading all of {}'.format(oops, inputdir),
+              file=sys.stderr)
+        return None
+    if not index.is_current(inputdir):
+        print('{} is out of date (run index-dates.py again); reading all '
+              'of {}'.format(ifile, inputdir), file=sys.stderr)
+        return None
+    return index
+
+
+def _read_window(inputdir, window, rfilter=None,
+                 threads=1, processes=1, compact=False):
+    """
+    Read input dir, return dictionary from filenames to the json
+    records whose dates are within a window (from, to), leaving out
+    files without any.
+
+    If the dir has an up to date date index (see `ttt.dateindex`),
+    we only read the files that have records in the window
+    """
+    first, last = window_range(*window)
+    interned = {}
+
+    def select(subpath, subrecs):
+        "the records we want from a file (None if we want no file)"
+        if rfilter is not None:
+            if not rfilter.want_file(subpath):
+                return None
+            subrecs = rfilter.apply(subrecs)
+        if not subrecs:
+            return None
+        return compact_record(subrecs, interned) if compact else subrecs
+
+    records = {}
+    index = _load_date_index(inputdir)
+    if index is not None:
+        for subpath, subrecs in index.read_window(inputdir, *window):
+            subrecs = select(subpath, subrecs)
+            if subrecs is not None:
+                records[fp.basename(subpath)] = subrecs
+        return records
+
+    def in_window(subrec):
+        "if a subrecord has a date within the window"
+        span = subrecord_range(subrec)
+        return span is not None and span[0] <= last and span[1] >= first
+
+    files_only = None if rfilter is None or rfilter.files is None else\
+        rfilter._replace(fields=None, equals=None, exists=None)
+    for subpath, subrecs in iter_records(inputdir,
+                                         rfilter=files_only,
+                                         threads=threads,
+                                         processes=processes):
+        subrecs = select(subpath, [x for x in subrecs if in_window(x)])
+        if subrecs is not None:
+            records[fp.basename(subpath)] = subrecs
+    return records
+
+
 def main():
     """
     Read input dir, dump in output dir
@@ -768,13 +897,60 @@ def main():
     psr.add_argument('output', metavar='DIR', help='output directory')
     psr.add_argument('--before', metavar='DIR',
                      help='another dir with json files (for comparsion)')
+    psr.add_argument('--threads', metavar='N', type=int, default=1,
+                     help='number of threads to read json files with')
+    psr.add_argument('--processes', metavar='N', type=int, default=1,
+                     help='number of processes to decode json files with')
+    psr.add_argument('--compact', action='store_true',
+                     help='use a more compact (but slower) in-memory '
+                     'representation of the records')
+    psr.add_argument('--date-from', metavar='DATE',
+                     help='only report on records dated from DATE '
+                     '(an ISO partial date, eg. 1290); for dirs with a '
+                     'date index (see index-dates.py), we only read the '
+                     'files with such records')
+    psr.add_argument('--date-to', metavar='DATE',
+                     help='only report on records dated up to DATE '
+                     '(an ISO partial date, eg. 1310)')
+    add_record_filter_args(psr)
     args = psr.parse_args()
+    rfilter = record_filter(args)
+    window = None
+    if args.date_from is not None or args.date_to is not None:
+        window = (args.date_from, args.date_to)
+        try:
+            window_range(*window)
+        except ValueError as oops:
+            psr.error(str(oops))
     if not fp.exists(args.output):
         os.makedirs(args.output)
 
+    def load(inputdir):
+        "read and tidy up records"
+        if window is not None:
+            return _norm_records(_read_window(inputdir, window,
+                                              rfilter=rfilter,
+                                              threads=args.threads,
+                                              processes=args.processes,
+                                              compact=args.compact))
+        return _norm_records(read_records(inputdir,
+                                          rfilter=rfilter,
+                                          threads=args.threads,
+                                          processes=args.processes,
+                                          compact=args.compact))
+
     # straightforward one row per json object
-    with Torpor('reading "after" records [{}]'.format(args.input)):
-        records = _norm_records(read_records(args.input))
+    if args.before:
+        # read the before and after dirs at the same time
+        pool = ThreadPool(2)
+        with Torpor('reading "before" and "after" records [{}, {}]'
+                    .format(args.before, args.input)):
+            records_before, records = pool.map(load,
+                                               [args.before, args.input])
+        pool.close()
+    else:
+        with Torpor('reading "after" records [{}]'.format(args.input)):
+            records = load(args.input)
     # squashed and sorted within each file
     crecords = _condense_records(records)
     # squashed and sorted altogether
@@ -787,8 +963,6 @@ def main():
 
     # if we're in diff mode
     if args.before:
-        with Torpor('reading "before" records [{}]'.format(args.before)):
-            records_before = _norm_records(read_records(args.before))
         crecords_before = _condense_records(records_before)
         drecords_before = {fp.basename(args.before):
                            _supercondense_record(records_before)}
@@ -798,7 +972,9 @@ def main():
         with Torpor('making before/after whole-dir reports'):
             mk_report(rpath("single-before"), drecords_before)
             mk_report(rpath("single-after"), drecords)
-        mk_score_report(rpath("scores"), records_before, records)
+        mk_score_report(rpath("scores"),
+                        _sorted_records(records_before),
+                        _sorted_records(records))
 
     else:
         records_before = None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Find clusters of near-duplicate snippets in converter output (see
+`ttt.minhash`), and report how much redundancy there is.
+
+The cluster map is a json object from each snippet id to the id of
+its cluster's representative.  You can also write out just the
+representatives, for nimrodel
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import sys
+
+from ttt.batch import iter_snippets
+from ttt.minhash import DEFAULT_CONFIG, LshConfig, find_clusters
+from ttt.pipeline import write_snippets
+from ttt.torpor import Torpor
+
+
+def _group(subpath):
+    "what we break the summary down by (top level dir)"
+    return subpath.split('/')[0] if '/' in subpath else '.'
+
+
+def summarise(cluster_map, stream=sys.stderr):
+    """
+    Print how many snippets there are, and how many of them are
+    cluster representatives (by top level dir)
+    """
+    snippets = {}
+    clusters = {}
+    for subpath, rep in cluster_map.items():
+        group = _group(subpath)
+        snippets[group] = snippets.get(group, 0) + 1
+        if rep == subpath:
+            clusters[group] = clusters.get(group, 0) + 1
+    rows = sorted(snippets.items())
+    rows.append(('TOTAL', sum(snippets.values())))
+    clusters['TOTAL'] = sum(clusters.values())
+    print('{:<20} {:>9} {:>9} {:>10}'.format('', 'snippets', 'unique',
+                                             'redundant'),
+          file=stream)
+    for group, count in rows:
+        num_clusters = clusters.get(group, 0)
+        print('{:<20} {:>9} {:>9} {:>9.1f}%'
+              .format(group, count, num_clusters,
+                      100.0 * (count - num_clusters) / count),
+              file=stream)
+
+
+def main():
+    """
+    Read input dir, write cluster map
+    """
+    psr = argparse.ArgumentParser(description='near-duplicate snippets')
+    psr.add_argument('input', metavar='DIR',
+                     help='converter output (dir or corpus file)')
+    psr.add_argument('output', metavar='FILE',
+                     help='cluster map (json)')
+    psr.add_argument('--shingle-size', metavar='N', type=int,
+                     default=DEFAULT_CONFIG.shingle_size,
+                     help='words per shingle')
+    psr.add_argument('--bands', metavar='N', type=int,
+                     default=DEFAULT_CONFIG.bands,
+                     help='number of LSH bands')
+    psr.add_argument('--rows', metavar='N', type=int,
+                     default=DEFAULT_CONFIG.rows,
+                     help='signature rows per LSH band')
+    psr.add_argument('--threshold', metavar='SIM', type=float,
+                     default=DEFAULT_CONFIG.threshold,
+                     help='similarity (0 to 1) above which snippets '
+                     'are near-duplicates')
+    psr.add_argument('--representatives', metavar='DIR',
+                     help='copy one snippet per cluster here')
+    args = psr.parse_args()
+    config = LshConfig(shingle_size=args.shingle_size,
+                       bands=args.bands,
+                       rows=args.rows,
+                       threshold=args.threshold,
+                       seed=DEFAULT_CONFIG.seed)
+    with Torpor('finding near-duplicates [{}]'.format(args.input)):
+        cluster_map = find_clusters(iter_snippets(args.input), config)
+    with open(args.output, 'w') as stream:
+        json.dump(cluster_map, stream, indent=0, sort_keys=True)
+    if args.representatives:
+        write_snippets(args.representatives,
+                       (pair for pair in iter_snippets(args.input)
+                        if cluster_map[pair[0]] == pair[0]))
+    if cluster_map:
+        summarise(cluster_map)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+# pylint: disable=invalid-name
+# pylint: enable=invalid-name
+
+"""
+Pack a directory of json files (eg. nimrodel output) into a few
+large shards and an index (see `ttt.packed`).
+
+The result can be used anywhere that expects a json dir
+(eg. mk-report.py, print-entities.py)
+"""
+
+from __future__ import print_function
+import argparse
+
+from ttt.cli import iter_records
+from ttt.packed import pack_records, DEFAULT_SHARD_SIZE
+from ttt.torpor import Torpor
+
+
+def main():
+    """
+    Read input dir, dump in output dir
+    """
+    psr = argparse.ArgumentParser(description='json dir packer')
+    psr.add_argument('input', metavar='DIR', help='dir with json files')
+    psr.add_argument('output', metavar='DIR', help='output directory')
+    psr.add_argument('--shard-size', metavar='MB', type=int,
+                     default=DEFAULT_SHARD_SIZE // (1024 * 1024),
+                     help='start a new shard after this many megabytes')
+    args = psr.parse_args()
+    with Torpor('packing records [{}]'.format(args.input)):
+        pack_records(iter_records(args.input), args.output,
+                     shard_size=args.shard_size * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,41 +13,45 @@ for each text in the style of nimrodel
 from __future__ import print_function
 from os import path as fp
 import codecs
-import json
 import os
 
-from ttt.cli import CliConfig, iodir_argparser, read_records
+from ttt.cli import (CliConfig, RecordFilter,
+                     add_record_filter_args, iodir_argparser,
+                     iter_records)
 
 
-def save_occurrences(input_dir, output_dir, subpath):
+def save_occurrences(output_dir, subpath, jdicts):
     """
-    Given input and output dirs, and a subpath within the
-    input dir, read json, dump original occurences as text
+    Given an output dir, a subpath within it and the json
+    records for that subpath, dump original occurences as text
     """
-    ifilename = fp.join(input_dir, subpath)
     ofilename = fp.join(output_dir, subpath)
-    with open(ifilename, 'rb') as istream:
-        jdicts = json.load(istream)
-        insts = [x.get('origOccurrence', '') for x in jdicts]
-        with codecs.open(ofilename, 'w', 'utf-8') as ostream:
-            print("\n".join(insts), file=ostream)
+    insts = [x.get('origOccurrence', '') for x in jdicts]
+    with codecs.open(ofilename, 'w', 'utf-8') as ostream:
+        print("\n".join(insts), file=ostream)
 
 
 def main():
     "read cli args, loop on dir"
     cfg = CliConfig(description='crude annotations viewer',
-                    input_description='annotation json',
+                    input_description='annotation json '
+                    '(or packed dir or corpus)',
                     glob='*')
-    psr = iodir_argparser(cfg)
+    psr = iodir_argparser(cfg, run_options=False)
+    add_record_filter_args(psr, fields=False)
     args = psr.parse_args()
+    # we only ever look at the occurrences
+    rfilter = RecordFilter(fields=['origOccurrence'],
+                           files=args.files,
+                           equals=args.where,
+                           exists=args.has)
     output_dir = args.output
-    for root, _, files in os.walk(args.input):
-        root_subpath = fp.relpath(root, args.input)
-        oroot = fp.join(output_dir, root_subpath)
+    for subpath, jdicts in iter_records(args.input, rfilter=rfilter,
+                                        shard=args.shard):
+        oroot = fp.join(output_dir, fp.dirname(subpath))
         if not fp.exists(oroot):
             os.makedirs(oroot)
-        for bname in files:
-            save_occurrences(root, oroot, bname)
+        save_occurrences(output_dir, subpath, jdicts)
 
 if __name__ == '__main__':
     main()
@@ -6,6 +6,9 @@ with some simple sentence segmentation along the way
 for readability
 
 NB: files are assumed to be UTF-8 encoded
+
+The input may also be a corpus file (see `ttt.corpus`), in which
+case the output keeps the snippets' relative paths
 """
 
 from __future__ import print_function
@@ -17,9 +20,20 @@ import os
 
 import nltk.data
 
+from ttt.cli import add_shard_arg
+from ttt.corpus import Corpus, is_corpus
 from ttt.reflow import reflow
 
 
+def do_text(tokenizer, itext, ofile):
+    """
+    Write modified version of the input text to the output file
+    """
+    otext = reflow(tokenizer, itext)
+    with codecs.open(ofile, 'w', 'utf-8') as stream_out:
+        print(otext, file=stream_out)
+
+
 def do_file(tokenizer, ifile, output_dir):
     """
     Read input file, write modified version to output dir with
@@ -27,10 +41,21 @@ def do_file(tokenizer, ifile, output_dir):
     """
     ofile = fp.join(output_dir, fp.basename(ifile))
     with codecs.open(ifile, 'r', 'utf-8') as stream_in:
-        itext = stream_in.read()
-        otext = reflow(tokenizer, itext)
-        with codecs.open(ofile, 'w', 'utf-8') as stream_out:
-            print(otext, file=stream_out)
+        do_text(tokenizer, stream_in.read(), ofile)
+
+
+def do_corpus(tokenizer, corpus, output_dir, shard=None):
+    """
+    Write modified versions of the snippets in a corpus to the
+    output dir (with the same relative paths)
+    """
+    for subpath, itext in corpus:
+        if shard is not None and not shard.includes(subpath):
+            continue
+        ofile = fp.join(output_dir, subpath)
+        if not fp.exists(fp.dirname(ofile)):
+            os.makedirs(fp.dirname(ofile))
+        do_text(tokenizer, itext, ofile)
 
 
 def main():
@@ -38,19 +63,26 @@ def main():
     Read input dir, dump in output dir
     """
     psr = argparse.ArgumentParser(description='text reflow')
-    psr.add_argument('input', metavar='DIR', help='dir with text files')
+    psr.add_argument('input', metavar='DIR',
+                     help='dir with text files (or corpus file)')
     psr.add_argument('output', metavar='DIR', help='output directory')
     psr.add_argument('--tokenizer', metavar='FILE',
                      default='tokenizers/punkt/english.pickle',
                      help='pickle for NLTK sentence tokenizer')
+    add_shard_arg(psr)
     args = psr.parse_args()
 
     tokenizer = nltk.data.load(args.tokenizer)
 
     if not fp.exists(args.output):
         os.makedirs(args.output)
+    if is_corpus(args.input):
+        with Corpus(args.input) as corpus:
+            do_corpus(tokenizer, corpus, args.output, shard=args.shard)
+        return
     for ifile in glob.glob(fp.join(args.input, '*')):
-        do_file(tokenizer, ifile, args.output)
+        if args.shard is None or args.shard.includes(fp.basename(ifile)):
+            do_file(tokenizer, ifile, args.output)
 
 if __name__ == '__main__':
     main()
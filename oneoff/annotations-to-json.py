@@ -12,10 +12,10 @@ for each text in the style of nimrodel
 
 from __future__ import print_function
 from os import path as fp
-import codecs
 import json
 import re
 
+from ttt.archive import open_text, strip_compression
 from ttt.cli import CliConfig, iodir_argparser, generic_main
 
 
@@ -44,7 +44,7 @@ def mk_converter(input_format):
 
             (FilePath, FilePath) -> FilePath
         """
-        bname = subpath
+        bname = strip_compression(subpath)
         if input_format == 'gate' and subpath.endswith(_GATE_SUFFIX):
             bname = subpath[:len(subpath) - len(_GATE_SUFFIX)]
         return fp.join(output_dir, bname)
@@ -58,7 +58,7 @@ def mk_converter(input_format):
         """
         ifilename = fp.join(input_dir, subpath)
         ofilename = output_path(output_dir, subpath)
-        with codecs.open(ifilename, 'r', 'utf-8') as istream:
+        with open_text(ifilename, 'utf-8') as istream:
             txt = istream.read()
             matches = person_re.findall(txt)
             jdicts = [{'origOccurrence': x} for x in matches]
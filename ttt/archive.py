@@ -0,0 +1,244 @@
+"""
+Reading inputs that are compressed, or tucked away in a tarball
+
+Files ending in `.gz`, `.bz2` or `.xz` are decompressed on the fly
+(xz needs Python 3 or the `backports.lzma` package).
+
+Directories inside of a tarball can be named by a path that goes
+through the tarball as if it were itself a directory, eg.
+`GOLD/ttt-gold-2015-01-01.tar.bz/ttt-gold-2015-01-01/fine-rolls/json-eric`
+Members are read in a single streaming pass (in archive order), so
+nothing needs to be unpacked to disk first.
+
+The same goes for chunked archives (see `ttt.goldarchive`): a
+directory of tarballs with a manifest saying which files they hold
+(and which files in earlier archives in an incremental chain are
+still current), eg. `GOLD/ttt-gold-2015-01-01.tars/fine-rolls/json-eric`
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from os import path as fp
+import bz2
+import codecs
+import gzip
+import io
+import json
+import tarfile
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None  # pylint: disable=invalid-name
+
+CHUNKED_MANIFEST = 'MANIFEST.json'
+
+
+def _open_xz(filename):
+    "open an xz compressed file for reading (if we can)"
+    if lzma is None:
+        raise IOError('Need the lzma module (Python 3 or backports.lzma) '
+                      'to read ' + filename)
+    return lzma.LZMAFile(filename)
+
+
+_OPENERS = {'.gz': lambda f: gzip.GzipFile(f, 'rb'),
+            '.bz2': lambda f: bz2.BZ2File(f, 'rb'),
+            '.xz': _open_xz}
+
+
+def _decompress_xz(data):
+    "decompress xz compressed bytes (if we can)"
+    if lzma is None:
+        raise IOError('Need the lzma module (Python 3 or backports.lzma) '
+                      'to decompress xz data')
+    return lzma.decompress(data)
+
+
+# for streams we cannot seek in (eg. tarball members), by suffix
+_DECOMPRESSORS = {'.gz': lambda d: gzip.GzipFile(fileobj=io.BytesIO(d),
+                                                 mode='rb').read(),
+                  '.bz2': bz2.decompress,
+                  '.xz': _decompress_xz}
+
+
+def compression_suffix(filename):
+    """
+    The compression suffix for a file (eg. '.gz'), or None if
+    we think it is not compressed
+    """
+    ext = fp.splitext(filename)[1]
+    return ext if ext in _OPENERS else None
+
+
+def strip_compression(filename):
+    """
+    The name a file would have if it were decompressed
+    (eg. "foo.xml.gz" => "foo.xml")
+    """
+    if compression_suffix(filename):
+        return fp.splitext(filename)[0]
+    return filename
+
+
+def open_binary(filename):
+    """
+    Open a file for reading in binary mode, decompressing it if
+    it has a compression suffix
+    """
+    suffix = compression_suffix(filename)
+    if suffix is None:
+        return open(filename, 'rb')
+    return _OPENERS[suffix](filename)
+
+
+def open_text(filename, encoding):
+    """
+    Like `codecs.open(filename, 'r', encoding)` but decompressing
+    files with a compression suffix
+    """
+    if compression_suffix(filename) is None:
+        return codecs.open(filename, 'r', encoding)
+    return codecs.getreader(encoding)(open_binary(filename))
+
+
+def read_member(name, stream):
+    """
+    Read all of a file object (eg. a tarball member from
+    `iter_tar_members`), decompressing it if its name has a
+    compression suffix ::
+
+        (FilePath, File) -> IO Bytes
+    """
+    suffix = compression_suffix(name)
+    if suffix is None:
+        return stream.read()
+    return _DECOMPRESSORS[suffix](stream.read())
+
+# ---------------------------------------------------------------------
+# tarballs
+# ---------------------------------------------------------------------
+
+
+def split_tar_path(path):
+    """
+    If a path goes through a tarball (or chunked archive), return the
+    path to the tarball and the path of the directory within it
+    (possibly empty); otherwise None ::
+
+        FilePath -> Maybe (FilePath, FilePath)
+    """
+    if is_chunked_archive(path):
+        return path, ''
+    if fp.exists(path) and not fp.isfile(path):
+        return None
+    inner = []
+    outer = fp.normpath(path)
+    while outer and not fp.exists(outer):
+        outer, bname = fp.split(outer)
+        inner.insert(0, bname)
+    if outer and fp.isfile(outer) and tarfile.is_tarfile(outer):
+        return outer, '/'.join(inner)
+    if outer and is_chunked_archive(outer):
+        return outer, '/'.join(inner)
+    return None
+
+
+def iter_tar_members(tarball, prefix='', want=None):
+    """
+    Stream the regular files in a tarball below the given directory,
+    yielding their paths (relative to that directory) along with a
+    file object to read them with. If you supply a `want` predicate on
+    these paths, we skip over any members it rejects ::
+
+        (FilePath, FilePath, Maybe (FilePath -> Bool))
+        -> Iterator (FilePath, File)
+
+    NB: the file object is only good until you ask for the next member
+    """
+    prefix = prefix.strip('/')
+    if is_chunked_archive(tarball):
+        for pair in iter_chunked_members(tarball, prefix, want):
+            yield pair
+        return
+    tar = tarfile.open(tarball, 'r|*')
+    try:
+        for member in tar:
+            name = member.name
+            if name.startswith('./'):
+                name = name[2:]
+            if not member.isfile():
+                continue
+            if prefix:
+                if not name.startswith(prefix + '/'):
+                    continue
+                name = name[len(prefix) + 1:]
+            if want is not None and not want(name):
+                continue
+            yield name, tar.extractfile(member)
+    finally:
+        tar.close()
+
+
+# ---------------------------------------------------------------------
+# chunked archives
+# ---------------------------------------------------------------------
+
+
+def is_chunked_archive(path):
+    """
+    If a path is a chunked archive directory (see `ttt.goldarchive`)
+    """
+    return fp.isdir(path) and fp.isfile(fp.join(path, CHUNKED_MANIFEST))
+
+
+def read_chunked_manifest(archive):
+    """
+    The manifest for a chunked archive directory
+    """
+    with open(fp.join(archive, CHUNKED_MANIFEST)) as stream:
+        return json.load(stream)
+
+
+def chunk_locations(archive):
+    """
+    Where to find each file in a chunked archive: the paths to the
+    chunks (which may be in earlier archives in its chain) that hold
+    the current version of the files, and which files these are ::
+
+        FilePath -> [(FilePath, Set FilePath)]
+    """
+    manifest = read_chunked_manifest(archive)
+    parent_dir = fp.dirname(fp.abspath(archive))
+    chunks = {}
+    for subpath, entry in manifest['files'].items():
+        if isinstance(subpath, unicode):
+            # like tar member names
+            subpath = subpath.encode('utf-8')
+        location = fp.join(parent_dir, entry['archive'], entry['chunk'])
+        chunks.setdefault(location, set()).add(subpath)
+    return sorted(chunks.items())
+
+
+def iter_chunked_members(archive, prefix='', want=None):
+    """
+    `iter_tar_members` for a chunked archive directory. We read the
+    chunks one at a time, in name order (so earlier archives in its
+    chain first)
+    """
+    prefix = prefix.strip('/')
+    for chunk, subpaths in chunk_locations(archive):
+        if prefix:
+            subpaths = set(s[len(prefix) + 1:] for s in subpaths
+                           if s.startswith(prefix + '/'))
+        if want is not None:
+            subpaths = set(s for s in subpaths if want(s))
+        if not subpaths:
+            continue
+        for name, stream in iter_tar_members(chunk, prefix,
+                                             want=subpaths.__contains__):
+            yield name, stream
@@ -0,0 +1,274 @@
+"""
+Packing converter snippets into batches for nimrodel
+
+Nimrodel crashes on large inputs, which is why the converters cut
+their documents up into tiny snippets; but then we pay nimrodel's
+startup costs over and over again.  Instead, we can glue snippets
+together into batches of up to a given size, separated by blank
+lines (which nimrodel does not merge entities across), and keep a
+map of where each snippet starts and ends in the batch.
+
+Nimrodel's output for a batch is a list of records with no positions
+in them, so to split it back into per-snippet records we look for
+each record's `origOccurrence` in the batch text (records come out
+in text order), and give it to the snippet that this falls in.  If we
+cannot place a record, we treat it like a crash.
+
+A batch that nimrodel crashes on is bisected: we split it in two and
+try again with each half, down to individual snippets if need be, so
+one bad snippet does not cost us the others.
+
+Batch directory layout ::
+
+    text/batch-NNNNN  -- snippets, glued together (feed this to nimrodel)
+    map/batch-NNNNN   -- json: separator, [[snippet id, start, end]]
+
+Offsets are in characters (not bytes)
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from bisect import bisect_right
+from collections import namedtuple
+from os import path as fp
+import codecs
+import json
+import os
+import traceback
+
+from .archive import open_text
+from .cli import walk_sorted
+from .corpus import Corpus, is_corpus
+
+DEFAULT_BATCH_SIZE = 32 * 1024
+SEPARATOR = u'\n\n\n'
+
+_TEXT_DIR = 'text'
+_MAP_DIR = 'map'
+_BATCH_TEMPLATE = 'batch-{:05}'
+
+
+class BatchError(Exception):
+    """
+    Nimrodel did not cope with a batch (crashed, or gave us output
+    that we could not split back up)
+    """
+    pass
+
+
+class Batch(namedtuple('Batch', 'name ids offsets text separator')):
+    """
+    Snippets glued together ::
+
+        name      :: String
+        ids       :: [FilePath]         -- snippet ids (relative paths)
+        offsets   :: [(Int, Int)]       -- start, end of each snippet
+        text      :: Text
+        separator :: Text
+    """
+    def __len__(self):
+        return len(self.ids)
+
+    def snippets(self):
+        """
+        The (id, text) snippets in this batch
+        """
+        return [(i, self.text[start:end]) for i, (start, end)
+                in zip(self.ids, self.offsets)]
+
+    def halves(self):
+        """
+        Split a batch into two (roughly equal in size) batches
+        """
+        snippets = self.snippets()
+        total = sum(len(t) for _, t in snippets)
+        size = 0
+        for middle, (_, text) in enumerate(snippets):
+            size += len(text)
+            if size * 2 >= total:
+                break
+        middle = min(max(middle + 1, 1), len(snippets) - 1)
+        return [_make_batch(self.name + suffix, part, self.separator)
+                for suffix, part in [('a', snippets[:middle]),
+                                     ('b', snippets[middle:])]]
+
+    def unpack(self, records):
+        """
+        Split nimrodel's records for the batch into records for each
+        snippet (raising `BatchError` if we cannot place one) ::
+
+            [Record] -> [(FilePath, [Record])]
+        """
+        starts = [s for s, _ in self.offsets]
+        results = [[] for _ in self.ids]
+        # where the last record started and ended (records may
+        # overlap, but do not go backwards)
+        last_start, last_end = 0, 0
+        for record in records:
+            occurrence = record.get('origOccurrence', '')
+            pos = self.text.find(occurrence, last_end) if occurrence else -1
+            if pos < 0 and occurrence:
+                pos = self.text.find(occurrence, last_start)
+            if pos < 0:
+                raise BatchError('Could not find {!r} in batch {}'
+                                 .format(occurrence, self.name))
+            idx = bisect_right(starts, pos) - 1
+            if idx < 0 or pos + len(occurrence) > self.offsets[idx][1]:
+                raise BatchError('{!r} crosses snippets in batch {}'
+                                 .format(occurrence, self.name))
+            results[idx].append(record)
+            last_start, last_end = pos, pos + len(occurrence)
+        return list(zip(self.ids, results))
+
+
+def _make_batch(name, snippets, separator):
+    "glue some snippets together"
+    ids = []
+    offsets = []
+    chunks = []
+    pos = 0
+    for subpath, text in snippets:
+        if chunks:
+            chunks.append(separator)
+            pos += len(separator)
+        ids.append(subpath)
+        offsets.append((pos, pos + len(text)))
+        chunks.append(text)
+        pos += len(text)
+    return Batch(name=name, ids=ids, offsets=offsets,
+                 text=u''.join(chunks), separator=separator)
+
+
+def pack_snippets(snippets, max_size=DEFAULT_BATCH_SIZE,
+                  separator=SEPARATOR):
+    """
+    Group snippets into batches of up to `max_size` characters (a
+    snippet that is bigger than that gets a batch of its own).
+    Snippets are stripped of surrounding whitespace, so that they
+    do not run into the separator ::
+
+        (Iterable (FilePath, Text), Int, Text) -> Iterator Batch
+    """
+    current = []
+    size = 0
+    num = 0
+    for subpath, text in snippets:
+        text = text.strip()
+        if current and size + len(separator) + len(text) > max_size:
+            yield _make_batch(_BATCH_TEMPLATE.format(num), current,
+                              separator)
+            num += 1
+            current = []
+            size = 0
+        elif current:
+            size += len(separator)
+        current.append((subpath, text))
+        size += len(text)
+    if current:
+        yield _make_batch(_BATCH_TEMPLATE.format(num), current, separator)
+
+
+def run_bisecting(batch, run):
+    """
+    Run a function (eg. nimrodel) on a batch, splitting it and trying
+    again if it raises an exception. Yield a (batch, result, error)
+    triple for each piece that we ran to the end, where error is a
+    formatted traceback for a single-snippet batch we gave up on
+    (and result is None) ::
+
+        (Batch, Batch -> IO a) -> Iterator (Batch, Maybe a, Maybe String)
+    """
+    todo = [batch]
+    while todo:
+        current = todo.pop()
+        try:
+            result = run(current)
+        except Exception:  # pylint: disable=broad-except
+            if len(current) > 1:
+                todo.extend(reversed(current.halves()))
+            else:
+                yield current, None, traceback.format_exc()
+            continue
+        yield current, result, None
+
+
+# ---------------------------------------------------------------------
+# batch directories
+# ---------------------------------------------------------------------
+
+
+def iter_snippets(path):
+    """
+    (id, text) snippets in a directory of converter output (UTF-8
+    text files) or a corpus file, in id order ::
+
+        FilePath -> Iterator (FilePath, Text)
+    """
+    if is_corpus(path):
+        with Corpus(path) as corpus:
+            for pair in corpus:
+                yield pair
+        return
+    for subpath in walk_sorted(path):
+        with open_text(fp.join(path, subpath), 'utf-8') as stream:
+            yield subpath, stream.read()
+
+
+def _write_text(filename, text):
+    "write a UTF-8 text file (creating its directory if needed)"
+    dirname = fp.dirname(filename)
+    if not fp.exists(dirname):
+        os.makedirs(dirname)
+    with codecs.open(filename, 'w', 'utf-8') as stream:
+        stream.write(text)
+
+
+def save_batch(batch, bdir):
+    """
+    Save a batch (text and offset map) in a batch directory
+    """
+    _write_text(fp.join(bdir, _TEXT_DIR, batch.name), batch.text)
+    _write_text(fp.join(bdir, _MAP_DIR, batch.name),
+                json.dumps({'separator': batch.separator,
+                            'snippets': [[i, s, e] for i, (s, e)
+                                         in zip(batch.ids, batch.offsets)]}))
+
+
+def batch_text_dir(bdir):
+    """
+    Directory within a batch directory with the text for nimrodel
+    """
+    return fp.join(bdir, _TEXT_DIR)
+
+
+def load_batches(bdir):
+    """
+    Read the batches saved in a batch directory ::
+
+        FilePath -> Iterator Batch
+    """
+    for name in sorted(os.listdir(fp.join(bdir, _MAP_DIR))):
+        with codecs.open(fp.join(bdir, _TEXT_DIR, name), 'r',
+                         'utf-8') as stream:
+            text = stream.read()
+        with open(fp.join(bdir, _MAP_DIR, name)) as stream:
+            bmap = json.load(stream)
+        yield Batch(name=name,
+                    ids=[i for i, _, _ in bmap['snippets']],
+                    offsets=[(s, e) for _, s, e in bmap['snippets']],
+                    text=text,
+                    separator=bmap['separator'])
+
+
+def save_records(odir, pairs):
+    """
+    Write per-snippet records out as json files, like nimrodel would
+    have done for the snippets themselves ::
+
+        (FilePath, [(FilePath, [Record])]) -> IO ()
+    """
+    for subpath, subrecs in pairs:
+        _write_text(fp.join(odir, subpath),
+                    json.dumps(subrecs, ensure_ascii=False))
@@ -0,0 +1,181 @@
+"""
+Content-addressed cache of nimrodel results
+
+Most snippets do not change from one nimrodel run to the next, so we
+remember nimrodel's output for each snippet, keyed on a hash of the
+snippet text and of the nimrodel version (and any configuration that
+affects its output).  A run then only needs to send nimrodel the
+snippets it has not seen before, and can fill in the rest of the
+output from the cache.  Snippets with identical text (eg. across
+datasets) are only sent once.
+
+Cache directory layout ::
+
+    objects/KE/KEY  -- nimrodel's output (json) for a snippet
+
+where KEY is the sha1 hash of the version and snippet text
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+from .cli import walk_sorted
+from .nimrodel import make_jobs
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+def _read_bytes(filename):
+    "contents of a file"
+    with open(filename, 'rb') as stream:
+        return stream.read()
+
+
+def _write_bytes(filename, data):
+    "write a file (creating its directory if need be)"
+    _mkdirs(fp.dirname(filename))
+    with open(filename, 'wb') as stream:
+        stream.write(data)
+
+
+class ResultCache(object):
+    """
+    Nimrodel results for snippets, by snippet text
+
+    :param dirname: where the cache lives (can be shared between
+                    runs of different nimrodel versions)
+    :param version: nimrodel version and configuration (anything that
+                    changes its output should change this)
+    """
+    def __init__(self, dirname, version):
+        self.dirname = dirname
+        self.version = version
+
+    def key(self, text):
+        """
+        Cache key for a snippet (its text as bytes)
+        """
+        version = self.version
+        if isinstance(version, unicode):
+            version = version.encode('utf-8')
+        return hashlib.sha1(version + b'\0' + text).hexdigest()
+
+    def _path(self, key):
+        "where the result for a key lives"
+        return fp.join(self.dirname, 'objects', key[:2], key)
+
+    def get(self, key):
+        """
+        Cached nimrodel output for a key (None if we do not have it) ::
+
+            String -> IO (Maybe Bytes)
+        """
+        try:
+            return _read_bytes(self._path(key))
+        except IOError as oops:
+            if oops.errno != errno.ENOENT:
+                raise
+            return None
+
+    def put(self, key, data):
+        """
+        Remember the nimrodel output for a key
+        """
+        filename = self._path(key)
+        tmp_filename = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+        _write_bytes(tmp_filename, data)
+        os.rename(tmp_filename, filename)
+
+
+class CacheStats(namedtuple('CacheStats', 'hits misses duplicates')):
+    """
+    What happened in a cached run ::
+
+        hits       :: Int  -- input files we filled in from the cache
+        misses     :: Int  -- distinct snippets we sent to nimrodel
+        duplicates :: Int  -- input files sharing text with a miss
+    """
+    pass
+
+
+def run_cached(scheduler, cache, dirs, max_files):
+    """
+    Run nimrodel (via a `ttt.nimrodel.Scheduler`) on several input
+    dirs, only sending it the snippets that are not already in the
+    cache (each distinct one once), and filling in the output dirs
+    from the cache and the new results. Return a dictionary from
+    input files that failed to the reason why, along with
+    `CacheStats` ::
+
+        (Scheduler, ResultCache, [(FilePath, FilePath)], Int)
+        -> IO (Dict FilePath String, CacheStats)
+    """
+    # key -> [(output file, input file)]
+    wanted = {}
+    hits = 0
+    for idir, odir in dirs:
+        for subpath in walk_sorted(idir):
+            ifile = fp.join(idir, subpath)
+            ofile = fp.join(odir, subpath)
+            key = cache.key(_read_bytes(ifile))
+            result = cache.get(key)
+            if result is None:
+                wanted.setdefault(key, []).append((ofile, ifile))
+            else:
+                _write_bytes(ofile, result)
+                hits += 1
+    stats = CacheStats(hits=hits,
+                       misses=len(wanted),
+                       duplicates=sum(len(x) - 1 for x in wanted.values()))
+    if not wanted:
+        return {}, stats
+
+    # run nimrodel on one copy of each snippet, named by its key
+    tmpdir = tempfile.mkdtemp(prefix='ttt-cache-')
+    try:
+        scratch_in = fp.join(tmpdir, 'in')
+        scratch_out = fp.join(tmpdir, 'out')
+        for key, targets in wanted.items():
+            scratch_file = fp.join(scratch_in, key[:2], key)
+            _mkdirs(fp.dirname(scratch_file))
+            shutil.copyfile(targets[0][1], scratch_file)
+        jobs = make_jobs('new', scratch_in, scratch_out, max_files=max_files)
+        scratch_failures = scheduler.run(jobs)
+        failures = {}
+        for key, targets in wanted.items():
+            scratch_file = fp.join(scratch_in, key[:2], key)
+            if scratch_file in scratch_failures:
+                for _, ifile in targets:
+                    failures[ifile] = scratch_failures[scratch_file]
+                continue
+            result_file = fp.join(scratch_out, key[:2], key)
+            if not fp.exists(result_file):
+                # nimrodel exited happily but said nothing about it
+                for _, ifile in targets:
+                    failures[ifile] = 'nimrodel produced no output for '\
+                        '{}'.format(ifile)
+                continue
+            result = _read_bytes(result_file)
+            cache.put(key, result)
+            for ofile, _ in targets:
+                _write_bytes(ofile, result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return failures, stats
@@ -5,12 +5,47 @@ Helper functions for command-line tools
 # author: Eric Kow
 # license: Public domain
 
+from __future__ import print_function
 from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from os import path as fp
 import argparse
+import fnmatch
+import hashlib
 import json
-import glob
 import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+from .archive import (iter_tar_members, open_binary, read_member,
+                      split_tar_path, strip_compression)
+from .compact import compact_record
+from .corpus import Corpus, CorpusWriter, is_corpus
+from .lease import DEFAULT_TTL, WorkQueue, work_loop
+from .manifest import Manifest, StagedWorker
+from .packed import PackedRecords, is_packed
+from .pipeline import DEFAULT_DEPTH, Pipeline, Stages
+
+# optional speedups: a faster json decoder, and os.scandir
+# (which is only standard from Python 3.5)
+try:
+    from ujson import loads as _json_loads
+except ImportError:
+    try:
+        from simplejson import loads as _json_loads
+    except ImportError:
+        _json_loads = json.loads
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
 
 class CliConfig(namedtuple('CliConfig',
@@ -26,16 +61,91 @@ class CliConfig(namedtuple('CliConfig',
     """
 
 
-def iodir_argparser(cfg):
+class Shard(namedtuple('Shard', 'index count')):
+    """
+    One of `count` disjoint slices of the input files (numbered from 1),
+    assigned by a stable hash of their relative paths, so that the
+    same inputs always end up in the same slice
+
+    :param index: which slice (1 to count)
+    :param count: how many slices
+    """
+
+    def includes(self, subpath):
+        "if the (relative) path is in this slice"
+        if isinstance(subpath, unicode):
+            subpath = subpath.encode('utf-8')
+        digest = hashlib.md5(subpath.replace(os.sep, '/')).hexdigest()
+        return int(digest[:16], 16) % self.count == self.index - 1
+
+
+def shard_type(string):
+    """
+    argparse type for INDEX/COUNT shard specifications
+    """
+    try:
+        index, count = [int(x) for x in string.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected INDEX/COUNT, eg. 2/5')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('shard index must be between 1 '
+                                         'and the shard count')
+    return Shard(index, count)
+
+
+def add_shard_arg(psr):
+    """
+    Add a --shard option to an argument parser
+    """
+    psr.add_argument('--shard', metavar='INDEX/COUNT', type=shard_type,
+                     help='only process slice INDEX of COUNT of the inputs '
+                     '(eg. 1/4 on one machine, 2/4 on another...)')
+
+
+def iodir_argparser(cfg, run_options=True):
     """
     A CLI argument parser for a simple program that takes an input
     and output directory
+
+    Unless you set `run_options` to False, this includes the options
+    that `generic_main` understands
     """
     psr = argparse.ArgumentParser(description=cfg.description)
     psr.add_argument('input', metavar='DIR',
                      help='dir with ' + cfg.input_description)
     psr.add_argument('output', metavar='DIR',
                      help='output directory')
+    add_shard_arg(psr)
+    if not run_options:
+        return psr
+    psr.add_argument('--jobs', '-j', metavar='N', type=int, default=1,
+                     help='number of files to process in parallel')
+    psr.add_argument('--incremental', action='store_true',
+                     help='only process new or changed input files '
+                     '(and resume interrupted runs)')
+    psr.add_argument('--state-dir', metavar='DIR',
+                     help='where to keep track of incremental runs '
+                     '(default: OUTPUT.ttt-state)')
+    psr.add_argument('--queue', metavar='DIR',
+                     help='share the work with other runs (eg. on other '
+                     'machines) using this shared directory (a fresh '
+                     'one for each run; see ttt.lease). Not for '
+                     'tarball inputs')
+    psr.add_argument('--lease-ttl', metavar='SECONDS', type=int,
+                     default=DEFAULT_TTL,
+                     help='(with --queue) consider work abandoned if '
+                     'its worker has not been heard from in this long')
+    psr.add_argument('--pipeline', action='store_true',
+                     help='read, parse and write files in separate '
+                     'stages, concurrently (and report on their '
+                     'progress)')
+    psr.add_argument('--queue-depth', metavar='N', type=int,
+                     default=DEFAULT_DEPTH,
+                     help='(with --pipeline) how many files may wait '
+                     'between stages')
+    psr.add_argument('--corpus', action='store_true',
+                     help='write a single corpus file (see ttt.corpus) '
+                     'instead of an output directory')
     return psr
 
 
@@ -55,28 +165,573 @@ def generic_main(cfg, on_file, args):
                    -> IO ()
 
         (CliConfig, Worker, argparser.Namespace) -> IO ()
+
+    A worker that raises an exception does not stop the run; we carry
+    on with the other files and report all failures at the end (in
+    input order, so that parallel runs say the same thing as serial
+    ones), exiting with a non-zero status.
+
+    In incremental mode, we skip input files that have not changed
+    since the last run, and delete the outputs for any that have
+    since disappeared (see `ttt.manifest`)
+
+    The input may contain compressed files (the glob is matched against
+    their decompressed names), or be a tarball or a directory within
+    one (see `ttt.archive`)
+
+    If asked to, we only process one shard of the inputs (in incremental
+    mode, give each shard its own state dir).  Alternatively, we can pull
+    inputs from a work queue shared with other runs of the same command
+    on the same inputs and outputs (see `ttt.lease`); each run finishes
+    once every input has been dealt with by one of them.  The queue
+    directory remembers what it has done, so use a fresh one each time
+    (queues do not work with tarball inputs, which each run unpacks on
+    its own)
+
+    If the worker is broken up into `ttt.pipeline.Stages`, we can
+    instead run its stages as a pipeline (not in incremental or
+    queue mode though), and write its snippets to a single corpus
+    file rather than an output directory (see `ttt.corpus`)
     """
-    if not fp.exists(args.output):
+    pipeline = None
+    corpus = None
+    if (args.pipeline or args.corpus) and not isinstance(on_file, Stages):
+        sys.exit("This command does not support --pipeline or --corpus")
+    elif args.corpus and (args.incremental or args.queue):
+        sys.exit("--corpus does not work with --incremental or --queue")
+    elif args.corpus:
+        corpus = CorpusWriter(args.output)
+        pipeline = Pipeline(on_file._replace(write=corpus.write),
+                            jobs=args.jobs, depth=args.queue_depth)
+    elif args.queue and split_tar_path(args.input) is not None:
+        # tarball members are unpacked to a scratch dir of our own, so
+        # their queue entries (see `WorkQueue.item_name`) would not
+        # match those of runs on other machines
+        sys.exit("--queue does not work with tarball input (unpack "
+                 "it somewhere that all the runs can see first)")
+    elif args.pipeline and (args.incremental or args.queue):
+        print("--pipeline does not work with --incremental or "
+              "--queue; ignoring it", file=sys.stderr)
+    elif args.pipeline:
+        pipeline = Pipeline(on_file, jobs=args.jobs,
+                            depth=args.queue_depth)
+    if corpus is None and not fp.exists(args.output):
         os.makedirs(args.output)
-    for filename in glob.glob(fp.join(args.input, cfg.glob)):
-        subpath = fp.basename(filename)
-        on_file(args.input, args.output, subpath)
+    if args.incremental:
+        manifest = Manifest.load(args.output, state_dir=args.state_dir)
+        on_file = StagedWorker(on_file, manifest)
+    seen = []
+    num_changed = 0
+    failures = {}
+    for idir, subpaths in iter_inputs(args.input, cfg.glob,
+                                      batch_size=_BATCH_SIZE * args.jobs):
+        seen.extend(subpaths)
+        if args.shard is not None:
+            subpaths = [s for s in subpaths if args.shard.includes(s)]
+        if args.incremental:
+            subpaths, hashes = manifest.changed(idir, subpaths)
+            on_file.hashes.update(hashes)
+        num_changed += len(subpaths)
+        if pipeline is not None:
+            failures.update(pipeline.run(idir, args.output, subpaths))
+        elif args.queue:
+            queue = WorkQueue(args.queue, ttl=args.lease_ttl)
+            failures.update(run_queue(queue, on_file, idir, args.output,
+                                      subpaths, jobs=args.jobs))
+        else:
+            failures.update(run_jobs(on_file, idir, args.output, subpaths,
+                                     jobs=args.jobs))
+    if args.incremental:
+        print("{} of {} input files changed".format(num_changed,
+                                                     len(seen)),
+              file=sys.stderr)
+        manifest.replay_journal()
+        manifest.forget_missing(seen)
+        manifest.save()
+    if corpus is not None:
+        corpus.close()
+    if args.pipeline and pipeline is not None:
+        pipeline.report()
+    report_failures(failures)
+
+# ---------------------------------------------------------------------
+# inputs
+# ---------------------------------------------------------------------
+
+# how many input files per process to pull out of a tarball at a time
+_BATCH_SIZE = 8
+
+
+def _glob_match(pattern, subpath):
+    """
+    If a file matches a `generic_main` glob (ignoring any compression
+    suffix, and like the shell, not matching hidden files unless
+    asked to)
+    """
+    bname = fp.basename(subpath)
+    if bname.startswith('.') and not pattern.startswith('.'):
+        return False
+    return fnmatch.fnmatch(strip_compression(subpath), pattern)
+
+
+def iter_inputs(path, pattern, batch_size=_BATCH_SIZE):
+    """
+    Input files for `generic_main`, as pairs of a directory and a
+    list of subpaths within it that match the glob pattern ::
+
+        (FilePath, String, Int) -> Iterator (FilePath, [FilePath])
+
+    For an ordinary directory, there is just the one pair.  If the
+    path goes through a tarball, we unpack the matching members
+    `batch_size` at a time into a scratch directory, which is deleted
+    once you ask for the next batch
+    """
+    tar_path = split_tar_path(path)
+    if tar_path is None:
+        yield path, sorted(b for b in os.listdir(path)
+                           if _glob_match(pattern, b) and
+                           fp.isfile(fp.join(path, b)))
+        return
+
+    tarball, prefix = tar_path
+    want = lambda s: '/' not in s and _glob_match(pattern, s)
+    members = iter_tar_members(tarball, prefix, want=want)
+    scratch = tempfile.mkdtemp(prefix='ttt-')
+    try:
+        while True:
+            batch = []
+            for subpath, stream in members:
+                with open(fp.join(scratch, subpath), 'wb') as ofile:
+                    shutil.copyfileobj(stream, ofile)
+                batch.append(subpath)
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
+            yield scratch, sorted(batch)
+            for subpath in batch:
+                os.remove(fp.join(scratch, subpath))
+    finally:
+        shutil.rmtree(scratch)
+
+# ---------------------------------------------------------------------
+# running workers
+# ---------------------------------------------------------------------
+
+# a year, in seconds (see `run_jobs`)
+_FOREVER = 60 * 60 * 24 * 365
+
+# worker function for the current process pool; set in each child
+# by `_init_worker` (so that it does not need to be pickled)
+_WORKER = None
+
+
+def _init_worker(on_file):
+    "process pool initializer: remember the worker function"
+    global _WORKER  # pylint: disable=global-statement
+    _WORKER = on_file
+
+
+def _run_job(job):
+    """
+    Run the current worker on a single file, returning the
+    subpath and either None or a formatted traceback ::
+
+        (FilePath, FilePath, FilePath) -> (FilePath, Maybe String)
+    """
+    idir, odir, subpath = job
+    try:
+        _WORKER(idir, odir, subpath)
+        return subpath, None
+    except Exception:  # pylint: disable=broad-except
+        return subpath, traceback.format_exc()
+
+
+def largest_first(idir, subpaths):
+    """
+    Sort subpaths by decreasing file size (ties broken by name), so
+    that the big files do not get left until the end of a parallel
+    run ::
+
+        (FilePath, [FilePath]) -> [FilePath]
+    """
+    return sorted(subpaths,
+                  key=lambda s: (-fp.getsize(fp.join(idir, s)), s))
+
+
+def run_jobs(on_file, idir, odir, subpaths, jobs=1):
+    """
+    Run the worker on each subpath (in a pool of `jobs` processes
+    if there is more than one), returning a dictionary from the
+    subpaths that failed to their formatted tracebacks ::
+
+        (Worker, FilePath, FilePath, [FilePath], Int)
+        -> IO (Dict FilePath String)
+    """
+    if jobs <= 1:
+        _init_worker(on_file)
+        results = [_run_job((idir, odir, s)) for s in subpaths]
+    else:
+        todo = [(idir, odir, s) for s in largest_first(idir, subpaths)]
+        pool = Pool(processes=jobs,
+                    initializer=_init_worker,
+                    initargs=(on_file,))
+        try:
+            # waiting on the async result with a timeout (rather than
+            # just calling map) lets Python 2 notice KeyboardInterrupt
+            results = pool.map_async(_run_job, todo,
+                                     chunksize=1).get(_FOREVER)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return {s: err for s, err in results if err is not None}
+
+
+def _run_queue_worker(job):
+    "process pool worker for `run_queue`"
+    queue, idir, odir, subpaths = job
+    work_loop(queue, _WORKER, idir, odir, subpaths)
+
+
+def run_queue(queue, on_file, idir, odir, subpaths, jobs=1):
+    """
+    Like `run_jobs`, but taking our work from a shared `WorkQueue`.
+    Returns when all of the inputs have been processed, by us or
+    by other runs (including their failures) ::
+
+        (WorkQueue, Worker, FilePath, FilePath, [FilePath], Int)
+        -> IO (Dict FilePath String)
+    """
+    ordered = largest_first(idir, subpaths)
+    job = (queue, idir, odir, ordered)
+    if jobs <= 1:
+        _init_worker(on_file)
+        _run_queue_worker(job)
+    else:
+        pool = Pool(processes=jobs,
+                    initializer=_init_worker,
+                    initargs=(on_file,))
+        try:
+            pool.map_async(_run_queue_worker, [job] * jobs,
+                           chunksize=1).get(_FOREVER)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return queue.failures({queue.item_name(idir, s): s for s in subpaths})
+
+
+def report_failures(failures):
+    """
+    Print out any failures from `run_jobs` (sorted by subpath)
+    and exit if there were any
+    """
+    if not failures:
+        return
+    for subpath in sorted(failures):
+        print("ERROR processing {}".format(subpath), file=sys.stderr)
+        print(failures[subpath], file=sys.stderr)
+    print("{} file(s) failed".format(len(failures)), file=sys.stderr)
+    sys.exit(1)
 
 # ---------------------------------------------------------------------
 # json outputs
 # ---------------------------------------------------------------------
 
 
-def read_records(inputdir):
+def _as_record(subrecs):
+    """
+    Nimrodel json files hold either a single subrecord or a list of
+    them; we always want a list
+    """
+    return [subrecs] if isinstance(subrecs, dict) else subrecs
+
+
+def path_sort_key(path):
+    """
+    Sort key for relative paths that puts all the contents of a
+    directory together (the order that `walk_sorted` uses)
+    """
+    return path.split(os.sep)
+
+
+def _list_dir(dirname):
+    """
+    Names of the entries in a directory, along with whether they
+    are themselves (non-symlinked) directories ::
+
+        FilePath -> IO [(String, Bool)]
+    """
+    if _scandir is not None:
+        # avoids a stat call per file on most filesystems
+        return [(e.name, e.is_dir(follow_symlinks=False))
+                for e in _scandir(dirname)]
+    else:
+        return [(b, fp.isdir(fp.join(dirname, b)) and
+                 not fp.islink(fp.join(dirname, b)))
+                for b in os.listdir(dirname)]
+
+
+def walk_sorted(inputdir, subdir=''):
+    """
+    Relative paths to all files within a directory (recursively),
+    in `path_sort_key` order ::
+
+        FilePath -> Iterator FilePath
+    """
+    for bname, is_dir in sorted(_list_dir(fp.join(inputdir, subdir))):
+        subpath = fp.join(subdir, bname)
+        if is_dir:
+            for subsubpath in walk_sorted(inputdir, subpath):
+                yield subsubpath
+        else:
+            yield subpath
+
+
+def _read_bytes(filename):
+    "raw contents of a file (decompressed if need be)"
+    with open_binary(filename) as ifile:
+        return ifile.read()
+
+
+class RecordFilter(namedtuple('RecordFilter',
+                               ['fields',
+                                'files',
+                                'equals',
+                                'exists'])):
+    """
+    What parts of a json dir we are interested in (see `iter_records`).
+    Any of these may be None to mean "no restriction"
+
+    :param fields: only keep these attributes of each subrecord
+    :param files: only read files whose path matches one of these globs
+    :param equals: only keep subrecords where these (attribute, value)
+                   pairs all hold
+    :param exists: only keep subrecords where these attributes are all
+                   present (and non-empty)
+    """
+
+    def want_file(self, subpath):
+        "if we should read the given file at all"
+        return self.files is None or\
+            any(fnmatch.fnmatch(subpath, g) for g in self.files)
+
+    def want_subrecord(self, subrec):
+        "if we should keep the given subrecord"
+        return all(subrec.get(k) == v for k, v in self.equals or []) and\
+            all(subrec.get(k) for k in self.exists or [])
+
+    def project(self, subrec):
+        "just the wanted fields of a subrecord"
+        if self.fields is None:
+            return subrec
+        return {k: subrec[k] for k in self.fields if k in subrec}
+
+    def apply(self, subrecs):
+        "the wanted subrecords of a record, projected"
+        return [self.project(x) for x in subrecs
+                if self.want_subrecord(x)]
+
+
+def add_record_filter_args(psr, fields=True):
+    """
+    Add options to an argument parser for building a `RecordFilter`
+    (see `record_filter`). Set `fields` to False if the program
+    already knows what attributes it wants
+    """
+    if fields:
+        psr.add_argument('--fields', metavar='ATTR,ATTR',
+                         type=lambda x: x.split(','),
+                         help='only read these attributes')
+    psr.add_argument('--files', metavar='GLOB', action='append',
+                     help='only read files matching this glob '
+                     '(relative to the input dir; may repeat)')
+    psr.add_argument('--where', metavar='ATTR=VALUE', action='append',
+                     type=lambda x: tuple(x.split('=', 1)),
+                     help='only read records with this attribute value '
+                     '(may repeat)')
+    psr.add_argument('--has', metavar='ATTR', action='append',
+                     help='only read records with this attribute '
+                     '(may repeat)')
+
+
+def record_filter(args):
+    """
+    The `RecordFilter` for the command line arguments added with
+    `add_record_filter_args` (None if there is no restriction)
+    """
+    rfilter = RecordFilter(fields=getattr(args, 'fields', None),
+                           files=args.files,
+                           equals=args.where,
+                           exists=args.has)
+    if all(x is None for x in rfilter):
+        return None
+    return rfilter
+
+
+def _decode_record(text, rfilter=None):
+    "json string to record"
+    subrecs = _as_record(_json_loads(text))
+    return subrecs if rfilter is None else rfilter.apply(subrecs)
+
+
+def _chunks(items, size):
+    """
+    Split an iterator into lists of at most the given size ::
+
+        (Iterator a, Int) -> Iterator [a]
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_records_concurrently(inputdir, subpaths, rfilter,
+                               threads, processes):
+    """
+    `iter_records` on a plain directory, reading files in a thread
+    pool, and decoding them in a process pool (if processes > 1)
+
+    We work through the files one window at a time, so we never
+    have more than a few windows worth of records in memory
+    """
+    window = 64 * max(threads, processes)
+    decode = partial(_decode_record, rfilter=rfilter)
+    tpool = ThreadPool(threads)
+    ppool = Pool(processes) if processes > 1 else None
+    try:
+        for chunk in _chunks(subpaths, window):
+            texts = tpool.map(_read_bytes,
+                              [fp.join(inputdir, s) for s in chunk])
+            if ppool is None:
+                subrecs = [decode(t) for t in texts]
+            else:
+                subrecs = ppool.map(decode, texts,
+                                    chunksize=max(1, window // processes))
+            for subpath, subrec in zip(chunk, subrecs):
+                yield strip_compression(subpath), subrec
+    finally:
+        tpool.terminate()
+        if ppool is not None:
+            ppool.terminate()
+
+
+def _iter_raw_records(inputdir, rfilter=None, shard=None,
+                      threads=1, processes=1):
+    """
+    `iter_records` without any postprocessing
+    """
+    if rfilter is None and shard is None:
+        want = None
+    else:
+        want = lambda s: (rfilter is None or rfilter.want_file(s)) and\
+            (shard is None or shard.includes(s))
+    tar_path = split_tar_path(inputdir)
+    if tar_path is not None:
+        tarball, prefix = tar_path
+        want_member = None if want is None else\
+            lambda s: want(strip_compression(s))
+        for subpath, stream in iter_tar_members(tarball, prefix,
+                                                want_member):
+            yield strip_compression(subpath),\
+                _decode_record(read_member(subpath, stream), rfilter)
+        return
+    elif is_packed(inputdir):
+        for subpath, subrecs in PackedRecords(inputdir).records(want):
+            yield subpath, subrecs if rfilter is None\
+                else rfilter.apply(subrecs)
+        return
+    elif is_corpus(inputdir):
+        with Corpus(inputdir) as corpus:
+            for number, subpath in enumerate(corpus.ids()):
+                if want is None or want(subpath):
+                    yield subpath, _decode_record(corpus.raw(number),
+                                                  rfilter)
+        return
+    subpaths = walk_sorted(inputdir)
+    if want is not None:
+        subpaths = (s for s in subpaths if want(strip_compression(s)))
+    if threads > 1 or processes > 1:
+        for pair in _iter_records_concurrently(inputdir, subpaths,
+                                               rfilter,
+                                               max(threads, 1),
+                                               processes):
+            yield pair
+    else:
+        for subpath in subpaths:
+            text = _read_bytes(fp.join(inputdir, subpath))
+            yield strip_compression(subpath), _decode_record(text, rfilter)
+
+
+def iter_records(inputdir, rfilter=None, shard=None,
+                 threads=1, processes=1, compact=False):
+    """
+    Lazily read an input dir, yielding a (path, record) pair for each
+    json file in it, where the path is relative to the input dir. ::
+
+        FilePath -> Iterator (FilePath, [Subrecord])
+
+    Files are visited in `path_sort_key` order, and only one file is
+    held in memory at a time (or with `threads` or `processes` > 1,
+    a small window of files, which we read in a thread pool and
+    decode in a process pool respectively)
+
+    If you supply a `RecordFilter`, files, subrecords and attributes
+    that it rules out are dropped as soon as they are read (files
+    ruled out by name are not even opened). Likewise for files outside
+    of the given `Shard`
+
+    If `compact` is True, subrecords are `ttt.compact.CompactRecord`
+    instead of dictionaries (which saves a lot of memory if you are
+    going to hang on to them), sharing their values with the other
+    subrecords from the same call
+
+    The input dir may also be a packed record dir (see `ttt.packed`)
+    or a corpus of json snippets (see `ttt.corpus`), contain compressed
+    json files (we strip the compression suffix from their paths), or
+    be a tarball or a directory within one (in which case we read files
+    in archive order; see `ttt.archive`)
+    """
+    pairs = _iter_raw_records(inputdir, rfilter=rfilter, shard=shard,
+                              threads=threads, processes=processes)
+    interned = {}
+    for subpath, subrecs in pairs:
+        yield subpath, compact_record(subrecs, interned) if compact\
+            else subrecs
+
+
+def read_record(inputdir, subpath):
+    """
+    Read the records for just one file within an input dir
+    (which may be a packed record dir) ::
+
+        (FilePath, FilePath) -> IO [Subrecord]
+    """
+    if is_packed(inputdir):
+        return PackedRecords(inputdir).get(subpath)
+    return _decode_record(_read_bytes(fp.join(inputdir, subpath)))
+
+
+def read_records(inputdir, rfilter=None,
+                 threads=1, processes=1, compact=False):
     """
     Read input dir, return dictionary from filenames to json records
+
+    (see `iter_records` for the other parameters)
     """
-    records = {}
-    for root, _, files in os.walk(inputdir):
-        for bname in files:
-            filename = fp.join(root, bname)
-            with open(filename) as ifile:
-                subrecs = json.load(ifile)
-                records[bname] = [subrecs]\
-                    if isinstance(subrecs, dict) else subrecs
-    return records
+    return {fp.basename(path): subrecs
+            for path, subrecs in iter_records(inputdir,
+                                              rfilter=rfilter,
+                                              threads=threads,
+                                              processes=processes,
+                                              compact=compact)}
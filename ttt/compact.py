@@ -0,0 +1,181 @@
+"""
+Compact representation of nimrodel subrecords
+
+Big json dirs hold millions of little dictionaries, all with the same
+handful of keys, and with lots of repeated values (titles, roles,
+provenance...).  A `CompactRecord` stores just a tuple of values in a
+fixed key order (shared by all records, and seeded from
+`ttt.keys.KEYS`).  Records read together can also share their values
+through an intern table (a dictionary), which lives only as long as
+the read does (see `ttt.cli.iter_records`), so that we do not hang on
+to the values of every record we have ever seen.
+
+It behaves enough like a dictionary for the reporting and scoring
+code not to notice.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from .keys import KEYS
+
+# pylint: disable=invalid-name
+_MISSING = object()
+# pylint: enable=invalid-name
+
+
+def intern_value(value, values):
+    """
+    Return a shared copy of a (string) value from an intern table
+    (adding it if need be); other values are returned unchanged ::
+
+        (a, Dict String String) -> a
+    """
+    if isinstance(value, basestring):
+        return values.setdefault(value, value)
+    return value
+
+
+class _Schema(object):
+    """
+    The shared key order for all compact records (keys we have not
+    seen before are added to the end as they come along)
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, keys):
+        self.keys = []
+        self.slots = {}
+        for key in keys:
+            self.slot(key)
+
+    def slot(self, key):
+        """
+        Position of a key in the value tuples (allocating one if
+        need be)
+        """
+        idx = self.slots.get(key)
+        if idx is None:
+            idx = len(self.keys)
+            self.keys.append(key)
+            self.slots[key] = idx
+        return idx
+
+
+_SCHEMA = _Schema(KEYS)
+
+
+class CompactRecord(object):
+    """
+    Tuple-backed, dictionary-like subrecord. Construct it like you
+    would a dictionary (from a mapping or from key, value pairs)
+
+    :param interned: intern table to share values through (see
+                     `intern_value`; values are not shared if None)
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, items=(), interned=None):
+        if hasattr(items, 'items'):
+            items = items.items()
+        values = []
+        for key, value in items:
+            idx = _SCHEMA.slot(key)
+            if idx >= len(values):
+                values.extend([_MISSING] * (idx + 1 - len(values)))
+            values[idx] = value if interned is None else\
+                intern_value(value, interned)
+        self._values = tuple(values)
+
+    # state for copy/pickle (values only; the keys are shared)
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        CompactRecord.__init__(self, state)
+
+    def __getitem__(self, key):
+        idx = _SCHEMA.slots.get(key)
+        if idx is None or idx >= len(self._values) or\
+                self._values[idx] is _MISSING:
+            raise KeyError(key)
+        return self._values[idx]
+
+    def __setitem__(self, key, value):
+        idx = _SCHEMA.slot(key)
+        values = list(self._values)
+        if idx >= len(values):
+            values.extend([_MISSING] * (idx + 1 - len(values)))
+        values[idx] = value
+        self._values = tuple(values)
+
+    def __delitem__(self, key):
+        self[key]  # pylint: disable=pointless-statement
+        values = list(self._values)
+        values[_SCHEMA.slots[key]] = _MISSING
+        self._values = tuple(values)
+
+    def __contains__(self, key):
+        try:
+            self[key]  # pylint: disable=pointless-statement
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        "as for dictionaries"
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def iteritems(self):
+        "as for dictionaries (in schema order)"
+        keys = _SCHEMA.keys
+        for idx, value in enumerate(self._values):
+            if value is not _MISSING:
+                yield keys[idx], value
+
+    def items(self):
+        "as for dictionaries (in schema order)"
+        return list(self.iteritems())
+
+    def keys(self):
+        "as for dictionaries (in schema order)"
+        return [k for k, _ in self.iteritems()]
+
+    def values(self):
+        "as for dictionaries (in schema order)"
+        return [v for _, v in self.iteritems()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for v in self._values if v is not _MISSING)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactRecord):
+            other = dict(other.items())
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'CompactRecord({!r})'.format(dict(self.items()))
+
+
+def compact_record(subrecs, interned=None):
+    """
+    Compact version of a record (list of subrecords), sharing values
+    through an intern table (give the same one for all the records in
+    a read; if you do not give one, the values are only shared within
+    this record) ::
+
+        ([Dict String a], Dict String String) -> [CompactRecord]
+    """
+    if interned is None:
+        interned = {}
+    return [CompactRecord(x, interned=interned) for x in subrecs]
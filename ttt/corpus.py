@@ -0,0 +1,207 @@
+"""
+Single-file corpus of text snippets
+
+The converters break documents up into lots and lots of tiny
+snippets, which are slow to write out and read back one file at a
+time.  A corpus file instead holds
+
+* a header (magic, number of snippets, and where the other parts are)
+* all the snippets, UTF-8 encoded and concatenated together
+* an index of (start, end) byte offsets, one per snippet
+* the snippet ids (their relative paths in the classic directory
+  layout), one per line
+
+Snippets are indexed in `ttt.cli.path_sort_key` order.  Readers
+memory-map the file, so fetching a snippet by id only touches the
+bytes for that snippet (and its index entry).
+
+Nimrodel wants the classic directory layout, which you can get back
+with `export_corpus`.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from os import path as fp
+import mmap
+import os
+import struct
+
+from .pipeline import write_snippets
+
+_MAGIC = b'TTTCORP1'
+# magic, number of snippets, offset of index, offset of ids
+_HEADER = struct.Struct('<8sQQQ')
+_ENTRY = struct.Struct('<QQ')  # start, end
+
+
+def is_corpus(path):
+    """
+    True if the path is a corpus file
+    """
+    if not fp.isfile(path):
+        return False
+    with open(path, 'rb') as stream:
+        return stream.read(len(_MAGIC)) == _MAGIC
+
+
+def _sort_key(subpath):
+    "same as `ttt.cli.path_sort_key`"
+    return subpath.split(os.sep)
+
+
+class CorpusWriter(object):
+    """
+    Write snippets to a corpus file. Snippets are written out as soon
+    as they are added; the index is written when you close the corpus
+    (which you must do for the file to be readable).
+
+    If the same id is added twice, the last one wins.
+
+    Can be used as a context manager, and its `write` method as the
+    write stage for `ttt.pipeline.Stages`
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._tmp_filename = filename + '.tmp'
+        dirname = fp.dirname(fp.abspath(filename))
+        if not fp.exists(dirname):
+            os.makedirs(dirname)
+        self._stream = open(self._tmp_filename, 'wb')
+        self._stream.write(_HEADER.pack(_MAGIC, 0, 0, 0))
+        self._offset = _HEADER.size
+        self._entries = {}
+
+    def add(self, subpath, text):
+        """
+        Add a snippet to the corpus
+        """
+        if isinstance(subpath, bytes):
+            subpath = subpath.decode('utf-8')
+        if '\n' in subpath:
+            raise ValueError('snippet ids may not contain newlines: ' +
+                             repr(subpath))
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self._stream.write(text)
+        self._entries[subpath] = (self._offset, self._offset + len(text))
+        self._offset += len(text)
+
+    def write(self, _, snippets):
+        """
+        Add (id, text) snippets to the corpus (same signature as
+        `ttt.pipeline.write_snippets`, ignoring the output dir)
+        """
+        for subpath, text in snippets:
+            self.add(subpath, text)
+
+    def close(self):
+        """
+        Write out the index and move the corpus into place
+        """
+        ids = sorted(self._entries, key=_sort_key)
+        index_offset = self._offset
+        for subpath in ids:
+            self._stream.write(_ENTRY.pack(*self._entries[subpath]))
+        ids_offset = index_offset + _ENTRY.size * len(ids)
+        self._stream.write('\n'.join(ids).encode('utf-8'))
+        self._stream.seek(0)
+        self._stream.write(_HEADER.pack(_MAGIC, len(ids),
+                                        index_offset, ids_offset))
+        self._stream.close()
+        os.rename(self._tmp_filename, self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, trace):
+        if etype is None:
+            self.close()
+        else:
+            self._stream.close()
+            os.remove(self._tmp_filename)
+
+
+class Corpus(object):
+    """
+    Read-only, memory-mapped access to a corpus file.
+
+    Behaves like a mapping from snippet ids to (unicode) text;
+    iterating over it gives (id, text) pairs in id order
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as stream:
+            self._mmap = mmap.mmap(stream.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        magic, count, self._index_offset, ids_offset =\
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise IOError('{} does not look like a corpus'.format(filename))
+        if count:
+            self._ids = self._mmap[ids_offset:].decode('utf-8').split('\n')
+        else:
+            self._ids = []
+        self._numbers = {s: i for i, s in enumerate(self._ids)}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, subpath):
+        return subpath in self._numbers
+
+    def ids(self):
+        """
+        Ids of all the snippets (in order)
+        """
+        return list(self._ids)
+
+    def raw(self, number):
+        """
+        UTF-8 bytes of the snippet with the given number (its position
+        in `ids()`)
+        """
+        start, end = _ENTRY.unpack_from(self._mmap, self._index_offset +
+                                        _ENTRY.size * number)
+        return self._mmap[start:end]
+
+    def __getitem__(self, subpath):
+        return self.raw(self._numbers[subpath]).decode('utf-8')
+
+    def get(self, subpath, default=None):
+        "as for dictionaries"
+        if subpath in self._numbers:
+            return self[subpath]
+        return default
+
+    def __iter__(self):
+        for number, subpath in enumerate(self._ids):
+            yield subpath, self.raw(number).decode('utf-8')
+
+    def close(self):
+        "release the memory map"
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, trace):
+        self.close()
+
+
+def export_corpus(corpus, odir, want=None):
+    """
+    Write the snippets in a corpus out in the classic directory
+    layout (one file per snippet, relative to the output dir), for
+    tools like nimrodel that need it. If you supply a `want`
+    predicate on snippet ids, we only export the ones it accepts.
+    Return the number of snippets written ::
+
+        (Corpus, FilePath, Maybe (FilePath -> Bool)) -> IO Int
+    """
+    count = 0
+    for subpath, text in corpus:
+        if want is None or want(subpath):
+            write_snippets(odir, [(subpath, text)])
+            count += 1
+    return count
@@ -0,0 +1,382 @@
+"""
+Running tasks that depend on each other's outputs (like make)
+
+Each task reads some input files or directories and writes some
+output files or directories.  A task depends on the tasks that
+produce its inputs, so the tasks form a graph (which had better not
+have any cycles in it).  We run the tasks in a pool of worker
+threads, each task as soon as the tasks it depends on are done, so
+that independent tasks run in parallel.
+
+Before running a task, we take a fingerprint of its inputs (a hash of
+their contents, along with the task's command and salt).  If this
+is what it was the last time the task succeeded, and its outputs are
+still there, the task is up to date and we skip it.  As fingerprints
+are based on contents rather than timestamps, a task whose inputs
+were regenerated but came out the same is skipped too.
+
+Fingerprints are saved (as json) in a state file after each task.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from .cli import walk_sorted
+from .manifest import file_sha1
+
+DONE = 'done'
+UP_TO_DATE = 'up to date'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+class DagError(Exception):
+    """
+    Something is wrong with the task graph itself (eg. a cycle)
+    """
+    pass
+
+
+class Task(namedtuple('Task', 'name inputs outputs action salt')):
+    """
+    A step in a task graph ::
+
+        name    :: String
+        inputs  :: [FilePath]  -- files or directories
+        outputs :: [FilePath]  -- files or directories
+        action  :: [String] or (() -> IO ())
+        salt    :: String      -- anything else the outputs depend
+                                  on (eg. a program version)
+
+    The action is either a command to run, or a function to call
+    """
+    def describe(self):
+        """
+        What the task does (for fingerprinting and progress reports)
+        """
+        if callable(self.action):
+            return '{}.{}'.format(self.action.__module__,
+                                  self.action.__name__)
+        return ' '.join(self.action)
+
+
+def _as_bytes(text):
+    "utf-8 encoded text (leaving byte strings alone)"
+    return text.encode('utf-8') if isinstance(text, unicode) else text
+
+
+class Fingerprinter(object):
+    """
+    Hashes input files and directories, remembering the hash of each
+    file (by path, size and modification time) so that inputs shared
+    by many tasks are only read once
+    """
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _file_digest(self, filename):
+        "digest for a file (memoised)"
+        stat = os.stat(filename)
+        key = (filename, stat.st_size, stat.st_mtime)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = file_sha1(filename)
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def path_digest(self, path):
+        """
+        Digest for a file or directory (None if it does not exist) ::
+
+            FilePath -> IO (Maybe String)
+        """
+        if fp.isdir(path):
+            digest = hashlib.sha1()
+            for subpath in walk_sorted(path):
+                digest.update(_as_bytes(subpath) + b'\0')
+                digest.update(_as_bytes(self._file_digest(fp.join(path,
+                                                                 subpath))))
+                digest.update(b'\n')
+            return digest.hexdigest()
+        elif fp.exists(path):
+            return self._file_digest(path)
+        return None
+
+    def task_digest(self, task):
+        """
+        Fingerprint for a task (raising `DagError` if any of its
+        inputs is missing) ::
+
+            Task -> IO String
+        """
+        digest = hashlib.sha1()
+        digest.update(_as_bytes(task.describe()) + b'\0')
+        digest.update(_as_bytes(task.salt) + b'\0')
+        for path in task.inputs:
+            path_digest = self.path_digest(path)
+            if path_digest is None:
+                raise DagError('{}: missing input {}'.format(task.name,
+                                                             path))
+            digest.update(_as_bytes(path_digest) + b'\n')
+        return digest.hexdigest()
+
+
+def _under(path, parent):
+    "if a path is the parent path or is somewhere inside of it"
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def dependencies(tasks):
+    """
+    The names of the tasks that each task depends on, ie. the ones
+    that produce its inputs (or directories that contain them).
+    Raise `DagError` if two tasks produce the same output or if the
+    tasks have a cycle ::
+
+        [Task] -> Dict String (Set String)
+    """
+    producers = {}
+    for task in tasks:
+        for output in task.outputs:
+            if output in producers:
+                raise DagError('{} is produced by both {} and {}'
+                               .format(output, producers[output],
+                                       task.name))
+            producers[output] = task.name
+    deps = {}
+    for task in tasks:
+        deps[task.name] = set(producer for output, producer
+                              in producers.items()
+                              for path in task.inputs
+                              if _under(path, output)) - set([task.name])
+    # check for cycles (depth first search)
+    visiting = set()
+    visited = set()
+
+    def visit(name):
+        "raise DagError if we can get back to a task we are visiting"
+        if name in visiting:
+            raise DagError('cycle in task graph (through {})'.format(name))
+        if name in visited:
+            return
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.remove(name)
+        visited.add(name)
+
+    for name in sorted(deps):
+        visit(name)
+    return deps
+
+
+def _run_action(task):
+    "run a task's command or call its function"
+    if callable(task.action):
+        task.action()
+    else:
+        subprocess.check_call(task.action)
+
+
+class TaskRunner(object):
+    """
+    Run tasks (and the ones they depend on) in a pool of worker
+    threads, skipping the ones that are up to date
+
+    :param tasks: the task graph
+    :param state_file: where to save fingerprints between runs
+    :param jobs: how many tasks to run at a time
+    """
+    def __init__(self, tasks, state_file, jobs=1, verbose=True):
+        self.tasks = {t.name: t for t in tasks}
+        if len(self.tasks) != len(tasks):
+            raise DagError('task names must be unique')
+        self.deps = dependencies(tasks)
+        self.state_file = state_file
+        self.jobs = max(jobs, 1)
+        self.verbose = verbose
+        self.fingerprinter = Fingerprinter()
+        self._cond = threading.Condition()
+        self._state = {}
+
+    def _say(self, msg):
+        "progress report"
+        if self.verbose:
+            print(msg, file=sys.stderr)
+
+    def wanted(self, targets=None):
+        """
+        The names of the targets and all the tasks they depend on
+        (all tasks if no targets are given) ::
+
+            Maybe [String] -> Set String
+        """
+        if targets is None:
+            return set(self.tasks)
+        todo = list(targets)
+        wanted = set()
+        while todo:
+            name = todo.pop()
+            if name not in self.tasks:
+                raise DagError('no such task: {}'.format(name))
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(self.deps[name])
+        return wanted
+
+    def _load_state(self):
+        "fingerprints from the last run"
+        if not fp.exists(self.state_file):
+            return {}
+        with open(self.state_file) as stream:
+            return json.load(stream)
+
+    def _save_state(self):
+        "save fingerprints (call with the lock held)"
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as stream:
+            json.dump(self._state, stream, indent=1, sort_keys=True)
+        os.rename(tmp_file, self.state_file)
+
+    def _is_up_to_date(self, task, digest):
+        "if a task has already been run with this fingerprint"
+        with self._cond:
+            old_digest = self._state.get(task.name)
+        return old_digest == digest and all(fp.exists(x)
+                                            for x in task.outputs)
+
+    def _attempt(self, task, force):
+        "run a task if needed, returning its status"
+        try:
+            digest = self.fingerprinter.task_digest(task)
+            if not force and self._is_up_to_date(task, digest):
+                return UP_TO_DATE
+            self._say('{}: {}'.format(task.name, task.describe()))
+            start = time.time()
+            _run_action(task)
+        except Exception:  # pylint: disable=broad-except
+            self._say('{}: FAILED\n{}'.format(task.name,
+                                              traceback.format_exc()))
+            return FAILED
+        with self._cond:
+            self._state[task.name] = digest
+            self._save_state()
+        self._say('{}: done in {:.1f}s'.format(task.name,
+                                               time.time() - start))
+        return DONE
+
+    def run(self, targets=None, force=False):
+        """
+        Run the targets (all tasks by default) and the tasks they
+        depend on, skipping any that are up to date (unless we
+        force them). Return the status of each task we looked at:
+        `DONE`, `UP_TO_DATE`, `FAILED` or `BLOCKED` (if a task it
+        depends on failed) ::
+
+            (Maybe [String], Bool) -> IO (Dict String String)
+        """
+        wanted = self.wanted(targets)
+        self._state = self._load_state()
+        status = {}
+        running = set()
+
+        def next_task():
+            "a task that is ready to run (or None if there are none)"
+            for name in sorted(wanted):
+                if name in status or name in running:
+                    continue
+                dep_status = [status.get(d) for d in self.deps[name]]
+                if any(s in [FAILED, BLOCKED] for s in dep_status):
+                    status[name] = BLOCKED
+                    self._say('{}: blocked'.format(name))
+                    self._cond.notify_all()
+                elif all(s in [DONE, UP_TO_DATE] for s in dep_status):
+                    return name
+            return None
+
+        def worker():
+            "run tasks until there are none left"
+            while True:
+                with self._cond:
+                    name = next_task()
+                    while name is None and len(status) < len(wanted):
+                        self._cond.wait(1)
+                        name = next_task()
+                    if name is None:
+                        return
+                    running.add(name)
+                result = self._attempt(self.tasks[name], force)
+                with self._cond:
+                    running.remove(name)
+                    status[name] = result
+                    self._cond.notify_all()
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # joining with a timeout lets Python 2 notice Ctrl-C
+            while thread.is_alive():
+                thread.join(1)
+        return status
+
+    def stale(self, targets=None):
+        """
+        The names of the tasks that would be run (in a run without
+        forcing), assuming that running a task changes its outputs
+        (tasks with missing inputs count as stale) ::
+
+            Maybe [String] -> IO [String]
+        """
+        wanted = self.wanted(targets)
+        self._state = self._load_state()
+        stale = set()
+        for name in _topological(wanted, self.deps):
+            task = self.tasks[name]
+            if self.deps[name] & stale:
+                stale.add(name)
+                continue
+            try:
+                digest = self.fingerprinter.task_digest(task)
+            except DagError:
+                stale.add(name)
+                continue
+            if not self._is_up_to_date(task, digest):
+                stale.add(name)
+        return [x for x in _topological(wanted, self.deps) if x in stale]
+
+
+def _topological(names, deps):
+    "task names, dependencies first (ties broken by name)"
+    order = []
+    seen = set()
+
+    def visit(name):
+        "add a task after the tasks it depends on"
+        if name in seen:
+            return
+        seen.add(name)
+        for dep in sorted(deps[name] & names):
+            visit(dep)
+        order.append(name)
+
+    for name in sorted(names):
+        visit(name)
+    return order
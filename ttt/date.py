@@ -6,14 +6,26 @@ Stupid way of getting dates with coarse grained resolution
 # license: Public domain
 
 
+from calendar import monthrange
 from dateutil.parser import parse as dparse
 import datetime
 import itertools
+import multiprocessing
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # pylint: disable=invalid-name
 
 
 _FAR_AWAY = 9999
 _DEFAULT_DATE_1 = datetime.datetime(_FAR_AWAY, 1, 1)
 _DEFAULT_DATE_2 = datetime.datetime(_FAR_AWAY, 2, 15)
+_DEFAULTS = ((_FAR_AWAY, 1, 1), (_FAR_AWAY, 2, 15))
+
+# fewer distinct dates than this are not worth a process pool
+_MIN_PARALLEL = 2000
 
 
 def read_date(dstr, prefix=None, **kwargs):
@@ -34,43 +46,442 @@ def read_date(dstr, prefix=None, **kwargs):
 
     Note that we also accept dateutil.parse args (`fuzzy` may be of use)
 
-    The underlying implementation is a bit embarassing. We're using an
-    English date parser that only returns timestamps (you have to supply
-    a default for fields it does not know). The approach we use is to
-    parse the date *twice* and take the common prefix of their ISO
-    formatted representations. Sorry.
+    Most of the dates in our sources are simple enough ("14 July",
+    "Feb. 1521", "December 1432") for us to read them ourselves (see
+    `read_date_parts`); we only hand the rest over to dateutil
     """
+    return format_date_parts(read_date_parts(dstr, prefix=prefix, **kwargs))
+
 
-    def iso(stamp):
-        "iso format for the date part only"
-        return stamp.isoformat().split("T")[0]
+def read_date_parts(dstr, prefix=None, **kwargs):
+    """
+    type: `String -> Maybe (Int, Maybe Int, Maybe Int)`
 
-    def common_prefix(iso1, iso2):
-        "common prefix of two iso date strings"
-        parts1 = iso1.split("-")
-        parts2 = iso2.split("-")
-        return "-".join(p1 for p1, _ in
-                        itertools.takewhile(lambda (x, y): x == y,
-                                            zip(parts1, parts2)))
+    Like `read_date`, but return the date as a tuple of the year,
+    month and day, with only as many of these as we know (so its
+    length is the granularity of the date), eg.
+    `read_date_parts("December 1432") == (1432, 12)`
+    """
+    return read_date_parts_with(dstr, prefix_defaults(prefix), **kwargs)
 
 
-    if prefix is not None:
+def read_dates(dstrs, prefix=None, processes=1, min_parallel=_MIN_PARALLEL,
+               **kwargs):
+    """
+    type: `[String] -> [Maybe String]`
+
+    `read_date` for lots of strings with the same prefix and options,
+    returned in the same order. Each distinct string is only read
+    once, and if there are at least `min_parallel` of them (and you
+    ask for more than one process), in a process pool
+    """
+    defaults = prefix_defaults(prefix)
+    distinct = list(set(dstrs))
+    jobs = [(x, defaults, kwargs) for x in distinct]
+    if processes > 1 and len(jobs) >= min_parallel:
+        pool = multiprocessing.Pool(processes)
         try:
-            default1 = dparse(prefix, default=_DEFAULT_DATE_1)
-            default2 = dparse(prefix, default=_DEFAULT_DATE_2)
-        except TypeError as _:
-            raise ValueError("Could not parse prefix date {}".format(prefix))
+            results = pool.map(_read_date_job, jobs,
+                               chunksize=len(jobs) // (processes * 4) + 1)
+        finally:
+            pool.terminate()
     else:
-        default1 = _DEFAULT_DATE_1
-        default2 = _DEFAULT_DATE_2
-	
+        results = [_read_date_job(j) for j in jobs]
+    dates = dict(zip(distinct, results))
+    return [dates[x] for x in dstrs]
+
+
+def _read_date_job(job):
+    "read a date for `read_dates` (maybe in a pool worker)"
+    dstr, defaults, kwargs = job
+    return format_date_parts(read_date_parts_with(dstr, defaults, **kwargs))
+
+
+def read_date_parts_with(dstr, defaults, **kwargs):
+    """
+    type: `(String, PrefixDefaults) -> Maybe (Int, Maybe Int, Maybe Int)`
+
+    `read_date_parts` with the defaults for its prefix worked out in
+    advance (see `prefix_defaults`), for when we have lots of dates
+    with the same prefix
+    """
+    if set(kwargs) - set(['fuzzy']):
+        return _read_date_dateutil(dstr, defaults, **kwargs)
+    fields = _scan(dstr, kwargs.get('fuzzy', False))
+    if fields is _UNKNOWN:
+        return _read_date_dateutil(dstr, defaults, **kwargs)
+    elif fields is None:
+        return None
+    return _resolve(fields, *defaults)
+
+
+def format_date_parts(parts):
+    """
+    type: `Maybe (Int, Maybe Int, Maybe Int) -> Maybe String`
+
+    The ISO formatted partial date for some date parts
+    """
+    if parts is None:
+        return None
+    return "-".join([str(parts[0]).zfill(4)] +
+                    [str(x).zfill(2) for x in parts[1:]])
+
+
+# ---------------------------------------------------------------------
+# reading dates ourselves
+# ---------------------------------------------------------------------
+
+_UNKNOWN = object()
+
+_MONTHS = {}
+for _num, _names in enumerate([('jan', 'january'), ('feb', 'february'),
+                               ('mar', 'march'), ('apr', 'april'),
+                               ('may',), ('jun', 'june'),
+                               ('jul', 'july'), ('aug', 'august'),
+                               ('sep', 'sept', 'september'),
+                               ('oct', 'october'), ('nov', 'november'),
+                               ('dec', 'december')]):
+    for _name in _names:
+        _MONTHS[_name] = _num + 1
+
+# words that are ignored, even when not fuzzy
+_SKIP_WORDS = frozenset(['at', 'on', 'and', 'ad'])
+_ORDINALS = frozenset(['st', 'nd', 'rd', 'th'])
+# words that mean something to dateutil (weekdays, times,
+# timezones, "of"); we leave strings with these to it
+_DATEUTIL_WORDS = frozenset(['mon', 'monday', 'tue', 'tuesday',
+                             'wed', 'wednesday', 'thu', 'thursday',
+                             'fri', 'friday', 'sat', 'saturday',
+                             'sun', 'sunday',
+                             'h', 'hour', 'hours', 'm', 'minute',
+                             'minutes', 's', 'second', 'seconds', 't',
+                             'utc', 'gmt', 'z', 'of'])
+# harmless to dateutil unless there is a number for them to go with
+_AMPM_WORDS = frozenset(['am', 'a', 'pm', 'p'])
+
+_ISO_DATE = re.compile(r'^(\d{4})-(\d\d)(?:-(\d\d))?$')
+# dateutil reads "1521,14" as a decimal number
+_DECIMAL = re.compile(r'\d,\d')
+_TOKEN = re.compile(r'(\s+|,|;)|(\d+)|([A-Za-z]+)|(\.)|(.)', re.UNICODE)
+
+
+def _scan(dstr, fuzzy):
+    """
+    The (year, month, day) fields in a date string (None for fields
+    that are not there); None if it is definitely not a date, or
+    `_UNKNOWN` if we do not know how to read it
+    """
+    if not isinstance(dstr, basestring):
+        return _UNKNOWN
+    match = _ISO_DATE.match(dstr.strip())
+    if match:
+        year, month, day = [None if x is None else int(x)
+                            for x in match.groups()]
+        if year < 1000 or not 1 <= month <= 12 or\
+                not (day is None or 1 <= day <= 31):
+            return _UNKNOWN
+        return (year, month, day)
+    elif _DECIMAL.search(dstr):
+        return _UNKNOWN
+
+    year = month = day = None
+    numbers = []
+    ampm = False
+    prev = None  # type of the previous token ('sep', 'num', 'word')
+    for match in _TOKEN.finditer(dstr):
+        sep, num, word, dot, other = match.groups()
+        if other is not None:
+            return _UNKNOWN
+        elif sep is not None:
+            prev = 'sep'
+        elif dot is not None:
+            # only after words (eg. "Feb."), and before a separator
+            end = match.end()
+            if prev != 'word' or (end < len(dstr) and
+                                  not _TOKEN.match(dstr, end).group(1)):
+                return _UNKNOWN
+            prev = 'sep'
+        elif num is not None:
+            if prev in ['num', 'word']:
+                return _UNKNOWN
+            if len(num) == 4 and 1000 <= int(num) and year is None:
+                year = int(num)
+            elif len(num) <= 2 and 0 < int(num) <= 31:
+                numbers.append(int(num))
+            else:
+                return _UNKNOWN
+            prev = 'num'
+        else:
+            lword = word.lower()
+            if prev == 'num':
+                # ordinal suffix, eg. 14th
+                if lword not in _ORDINALS:
+                    return _UNKNOWN
+            elif prev == 'word':
+                return _UNKNOWN
+            elif lword in _MONTHS:
+                if month is not None:
+                    return _UNKNOWN
+                month = _MONTHS[lword]
+            elif lword in _DATEUTIL_WORDS:
+                return _UNKNOWN
+            elif lword in _AMPM_WORDS:
+                ampm = True
+            elif not (fuzzy or lword in _SKIP_WORDS or lword in _ORDINALS):
+                return None
+            prev = 'word'
+
+    if len(numbers) > 1 or (numbers and month is None and year is not None):
+        # ambiguous (day or month?)
+        return _UNKNOWN
+    elif ampm and (numbers or year is not None):
+        # could be a time
+        return _UNKNOWN
+    elif ampm and not fuzzy:
+        return None
+    elif numbers:
+        day = numbers[0]
+    if year is None and month is None and day is None:
+        return None
+    return (year, month, day)
+
+
+def prefix_defaults(prefix):
+    """
+    type: `Maybe String -> PrefixDefaults`
+
+    The (year, month, day) defaults that `read_date` uses for unknown
+    parts of a date, given a prefix date (ValueError if it is not a
+    date)
+    """
+    if prefix is None:
+        return _DEFAULTS
+    fields = _scan(prefix, False)
+    if fields is not None and fields is not _UNKNOWN:
+        defaults = _fill(fields, _DEFAULTS[0]), _fill(fields, _DEFAULTS[1])
+        if None not in defaults:
+            return defaults
+    try:
+        stamps = (dparse(prefix, default=_DEFAULT_DATE_1),
+                  dparse(prefix, default=_DEFAULT_DATE_2))
+    except TypeError as _:
+        raise ValueError("Could not parse prefix date {}".format(prefix))
+    return tuple((s.year, s.month, s.day) for s in stamps)
+
+
+def _fill(fields, default):
+    """
+    A date with missing fields taken from the default (like dateutil,
+    we use the last day of the month if the default day is too big);
+    None if the date is invalid
+    """
+    year, month, day = fields
+    year = default[0] if year is None else year
+    month = default[1] if month is None else month
+    if day is None:
+        day = min(default[2], monthrange(year, month)[1])
+    try:
+        datetime.date(year, month, day)
+    except ValueError as _:
+        return None
+    return (year, month, day)
+
+
+def _resolve(fields, default1, default2):
+    """
+    The date parts that come out the same whichever default we use
+    """
+    date1 = _fill(fields, default1)
+    date2 = _fill(fields, default2)
+    if date1 is None or date2 is None:
+        return None
+    return _common_parts(date1, date2)
+
+
+def _common_parts(date1, date2):
+    """
+    The date parts that two dates have in common (None if just the
+    far-away default year)
+    """
+    parts = tuple(x for x, _ in itertools.takewhile(lambda (x, y): x == y,
+                                                    zip(date1, date2)))
+    if not parts or parts == (_FAR_AWAY,):
+        return None
+    return parts
+
+
+# ---------------------------------------------------------------------
+# dateutil
+# ---------------------------------------------------------------------
+
+
+def _read_date_dateutil(dstr, defaults, **kwargs):
+    """
+    `read_date_parts` for anything we do not know how to read
+    ourselves.
+
+    The underlying implementation is a bit embarassing. We're using an
+    English date parser that only returns timestamps (you have to supply
+    a default for fields it does not know). The approach we use is to
+    parse the date *twice* and take the common prefix of the parts
+    """
+    default1, default2 = [datetime.datetime(*d) for d in defaults]
     try:
         stamp1 = dparse(dstr, default=default1, **kwargs)
         stamp2 = dparse(dstr, default=default2, **kwargs)
     except (TypeError, ValueError) as _:
         return None
+    return _common_parts((stamp1.year, stamp1.month, stamp1.day),
+                         (stamp2.year, stamp2.month, stamp2.day))
+
+
+# ---------------------------------------------------------------------
+# packed dates
+# ---------------------------------------------------------------------
+
+# A packed date is an int with the year, month, day and granularity
+# (the number of parts we know) in its bits, from most to least
+# significant, and zeros for the parts we do not know ::
+#
+#     year << 11 | month << 7 | day << 2 | granularity
+#
+# so packed dates sort like their ISO forms ("1521" < "1521-07" <
+# "1521-07-01" < "1521-08"), and fit in 32 bits (or numpy int64s).
+# NO_DATE (0) stands for a missing date, and sorts before the rest.
+
+NO_DATE = 0
+YEAR = 1
+MONTH = 2
+DAY = 3
+
+_YEAR_SHIFT = 11
+_MONTH_SHIFT = 7
+_DAY_SHIFT = 2
+_GRANULARITY_MASK = 3
+_ISO_PARTIAL_DATE = re.compile(r'^(\d{4})(?:-(\d\d)(?:-(\d\d))?)?$')
+
+
+def pack_date(parts):
+    """
+    type: `Maybe (Int, Maybe Int, Maybe Int) -> Int`
+
+    The packed form of some date parts (eg. from `read_date_parts`)
+    """
+    if not parts:
+        return NO_DATE
+    year, month, day = tuple(parts) + (0,) * (3 - len(parts))
+    return (year << _YEAR_SHIFT | month << _MONTH_SHIFT |
+            day << _DAY_SHIFT | len(parts))
+
+
+def unpack_date(packed):
+    """
+    type: `Int -> Maybe (Int, Maybe Int, Maybe Int)`
+
+    The date parts for a packed date
+    """
+    packed = int(packed)
+    if packed == NO_DATE:
+        return None
+    parts = (packed >> _YEAR_SHIFT,
+             packed >> _MONTH_SHIFT & 0xf,
+             packed >> _DAY_SHIFT & 0x1f)
+    return parts[:packed & _GRANULARITY_MASK]
+
 
-    res = common_prefix(iso(stamp1), iso(stamp2))
-    if res == str(_FAR_AWAY):
-        res = None
-    return res
+def date_granularity(packed):
+    """
+    type: `Int -> Int`
+
+    How much we know about a packed date: `YEAR`, `MONTH`, `DAY`,
+    (or `NO_DATE`). This works on numpy arrays too
+    """
+    return packed & _GRANULARITY_MASK
+
+
+def pack_iso(dstr):
+    """
+    type: `Maybe String -> Int`
+
+    The packed form of an ISO partial date (eg. from `read_date`);
+    ValueError if it is not one
+    """
+    if dstr is None:
+        return NO_DATE
+    match = _ISO_PARTIAL_DATE.match(dstr)
+    if not match:
+        raise ValueError('not an ISO partial date: {}'.format(dstr))
+    parts = tuple(int(x) for x in match.groups() if x is not None)
+    try:
+        datetime.date(*(parts + (1, 1)[len(parts) - 1:]))
+    except ValueError:
+        raise ValueError('no such date: {}'.format(dstr))
+    return pack_date(parts)
+
+
+def unpack_iso(packed):
+    """
+    type: `Int -> Maybe String`
+
+    The ISO form of a packed date
+    """
+    return format_date_parts(unpack_date(packed))
+
+
+def pack_isos(dstrs):
+    """
+    type: `[Maybe String] -> Array Int`
+
+    Packed forms of lots of ISO partial dates (a numpy int64 array, or
+    a list if we do not have numpy)
+    """
+    packed = [pack_iso(x) for x in dstrs]
+    if numpy is None:
+        return packed
+    return numpy.array(packed, dtype=numpy.int64)
+
+
+def unpack_isos(packed):
+    """
+    type: `Array Int -> [Maybe String]`
+
+    ISO forms of lots of packed dates (each distinct one is only
+    unpacked once)
+    """
+    if numpy is not None:
+        distinct, inverse = numpy.unique(packed, return_inverse=True)
+        isos = [unpack_iso(x) for x in distinct]
+        return [isos[i] for i in inverse]
+    return [unpack_iso(x) for x in packed]
+
+
+def date_ranges(groups, packed, num_groups):
+    """
+    type: `(Array Int, Array Int, Int) -> (Array Int, Array Int)`
+
+    The earliest and latest packed date in each group, given the
+    group (0 to `num_groups - 1`) of each date. Missing dates are
+    ignored, and groups without any dates get `NO_DATE`
+    """
+    if numpy is None:
+        lows = [NO_DATE] * num_groups
+        highs = [NO_DATE] * num_groups
+        for group, date in zip(groups, packed):
+            if date == NO_DATE:
+                continue
+            if lows[group] == NO_DATE or date < lows[group]:
+                lows[group] = date
+            highs[group] = max(highs[group], date)
+        return lows, highs
+    groups = numpy.asarray(groups, dtype=numpy.int64)
+    packed = numpy.asarray(packed, dtype=numpy.int64)
+    known = packed != NO_DATE
+    groups = groups[known]
+    packed = packed[known]
+    lows = numpy.full(num_groups, numpy.iinfo(numpy.int64).max,
+                      dtype=numpy.int64)
+    highs = numpy.zeros(num_groups, dtype=numpy.int64)
+    numpy.minimum.at(lows, groups, packed)
+    numpy.maximum.at(highs, groups, packed)
+    lows[highs == NO_DATE] = NO_DATE
+    return lows, highs
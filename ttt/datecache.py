@@ -0,0 +1,266 @@
+"""
+Memoised date reading (see `ttt.date`)
+
+The same date strings ("Feb.", "December", a section's heading year)
+come up over and over again in our sources, often with the same
+prefix.  A `DateCache` remembers
+
+* the dates it has read, keyed on the string, prefix and options
+  (the most recently used ones, up to a limit)
+* the defaults for each prefix, so that a prefix shared by a whole
+  section is only read once
+
+It can also keep the dates it reads in a directory, so that they can
+be shared between runs (and between processes in the same run) ::
+
+    objects/KE/KEY  -- json date parts (or null)
+
+where KEY is the sha1 hash of the string, prefix, options and
+`CACHE_VERSION` (which should change whenever `ttt.date` starts to
+read things differently)
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple, OrderedDict
+from os import path as fp
+import errno
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+
+from .date import format_date_parts, prefix_defaults, read_date_parts_with
+
+CACHE_VERSION = '1'
+DEFAULT_SIZE = 100000
+DEFAULT_PREFIX_SIZE = 1000
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+class CacheStats(namedtuple('CacheStats',
+                            'hits disk_hits misses evictions')):
+    """
+    How well a date cache is doing ::
+
+        hits      :: Int  -- dates we already had in memory
+        disk_hits :: Int  -- dates we found in the cache dir
+        misses    :: Int  -- dates we had to read
+        evictions :: Int  -- dates we forgot to make room for others
+    """
+    pass
+
+
+class _LRU(object):
+    """
+    A dictionary that only keeps its most recently used `size`
+    entries (not thread-safe)
+    """
+    def __init__(self, size):
+        self.size = size
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        "value for a key, marking it as recently used"
+        if key not in self._items:
+            return default
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        "add a key, forgetting the least recently used if need be"
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._items)
+
+
+_MISSING = object()
+
+
+class DateCache(object):
+    """
+    `ttt.date.read_date` and `ttt.date.read_date_parts`, with
+    memoisation (thread-safe)
+
+    :param dirname: where to share dates between runs/processes
+                    (optional)
+    :param size: how many dates to keep in memory
+    :param prefix_size: how many prefix defaults to keep in memory
+    """
+    def __init__(self, dirname=None, size=DEFAULT_SIZE,
+                 prefix_size=DEFAULT_PREFIX_SIZE):
+        self.dirname = dirname
+        self._dates = _LRU(size)
+        self._defaults = _LRU(prefix_size)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def stats(self):
+        """
+        Hit/miss counts so far ::
+
+            () -> CacheStats
+        """
+        with self._lock:
+            return CacheStats(hits=self._hits,
+                              disk_hits=self._disk_hits,
+                              misses=self._misses,
+                              evictions=self._dates.evictions)
+
+    def prefix_defaults(self, prefix):
+        """
+        `ttt.date.prefix_defaults` (memoised)
+        """
+        with self._lock:
+            defaults = self._defaults.get(prefix)
+        if defaults is None:
+            defaults = prefix_defaults(prefix)
+            with self._lock:
+                self._defaults.put(prefix, defaults)
+        return defaults
+
+    def read_date(self, dstr, prefix=None, **kwargs):
+        """
+        `ttt.date.read_date` (memoised)
+        """
+        return format_date_parts(self.read_date_parts(dstr, prefix=prefix,
+                                                      **kwargs))
+
+    def read_dates(self, dstrs, prefix=None, **kwargs):
+        """
+        `ttt.date.read_dates` (memoised, and not in parallel, as the
+        converters already read files in parallel)
+        """
+        self.prefix_defaults(prefix)  # bad prefix, even if no dstrs
+        distinct = set(dstrs)
+        dates = {x: self.read_date(x, prefix=prefix, **kwargs)
+                 for x in distinct}
+        return [dates[x] for x in dstrs]
+
+    def read_date_parts(self, dstr, prefix=None, **kwargs):
+        """
+        `ttt.date.read_date_parts` (memoised)
+        """
+        key = (dstr, prefix, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # eg. dateutil tzinfos; no way to remember these
+            return read_date_parts_with(dstr, self.prefix_defaults(prefix),
+                                        **kwargs)
+        with self._lock:
+            parts = self._dates.get(key, _MISSING)
+            if parts is not _MISSING:
+                self._hits += 1
+                return parts
+        parts = self._disk_get(key)
+        if parts is _MISSING:
+            parts = read_date_parts_with(dstr, self.prefix_defaults(prefix),
+                                         **kwargs)
+            self._disk_put(key, parts)
+            with self._lock:
+                self._misses += 1
+        else:
+            with self._lock:
+                self._disk_hits += 1
+        with self._lock:
+            self._dates.put(key, parts)
+        return parts
+
+    def _path(self, key):
+        """
+        where the date for a key lives in the cache dir (None if we
+        cannot save it there)
+        """
+        if self.dirname is None:
+            return None
+        try:
+            text = json.dumps([CACHE_VERSION] + list(key))
+        except TypeError:
+            return None
+        digest = hashlib.sha1(text).hexdigest()
+        return fp.join(self.dirname, 'objects', digest[:2], digest)
+
+    def _disk_get(self, key):
+        "date parts from the cache dir (`_MISSING` if not there)"
+        filename = self._path(key)
+        if filename is None:
+            return _MISSING
+        try:
+            with open(filename) as stream:
+                parts = json.load(stream)
+        except IOError as oops:
+            if oops.errno != errno.ENOENT:
+                raise
+            return _MISSING
+        return None if parts is None else tuple(parts)
+
+    def _disk_put(self, key, parts):
+        "save date parts to the cache dir (if we have one)"
+        filename = self._path(key)
+        if filename is None:
+            return
+        _mkdirs(fp.dirname(filename))
+        tmp_filename = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+        with open(tmp_filename, 'w') as stream:
+            json.dump(parts, stream)
+        os.rename(tmp_filename, filename)
+
+
+def add_date_cache_args(psr):
+    """
+    Add --date-cache and --date-cache-stats options to an argument
+    parser
+    """
+    psr.add_argument('--date-cache', metavar='DIR',
+                     help='share the dates we read with other runs '
+                     '(and processes) through this directory')
+    psr.add_argument('--date-cache-stats', action='store_true',
+                     help='say how well the date cache did (not with '
+                     '--jobs, as the dates are then read in the worker '
+                     'processes)')
+
+
+def check_date_cache_args(psr, args):
+    """
+    Complain (through the argument parser) about date cache options
+    that do not make sense with the others (see `add_date_cache_args`)
+    """
+    if args.date_cache_stats and getattr(args, 'jobs', 1) > 1:
+        psr.error('--date-cache-stats does not work with --jobs (the '
+                  'dates are read in the worker processes, whose '
+                  'caches we cannot see)')
+
+
+def report_date_cache(cache, args):
+    """
+    Print the date cache stats if asked to (see `add_date_cache_args`)
+    """
+    if not args.date_cache_stats:
+        return
+    stats = cache.stats()
+    print('dates: {} hits, {} from cache dir, {} misses, {} evictions'
+          .format(stats.hits, stats.disk_hits, stats.misses,
+                  stats.evictions),
+          file=sys.stderr)
@@ -0,0 +1,323 @@
+"""
+Index of the records in a json dir by date
+
+Each subrecord with an `appearanceDate` (or, in condensed records, an
+`appearanceDate (min)` and `appearanceDate (max)`) covers a range of
+days: a partial date like 1521-07 is the whole of July 1521.  The
+index holds these ranges in a few sorted arrays, so that we can find
+the subrecords that overlap a range of dates without reading (or
+even listing) the rest of the json dir.
+
+The ranges are sorted by their first day.  As we also know the
+longest range in the index, a query for the subrecords overlapping
+[start, end] only needs to look at those that begin between
+`start - longest` and `end`, which we find by binary search.  This is
+fast as long as the ranges are short (a year at most for single
+partial dates); a few very long ranges make every query slower.
+
+The index for a json dir (or packed record dir) records the size and
+modification time of its files, so that we can tell when it is out of
+date (see `DateIndex.is_current`); it then needs to be built again.
+
+Index file layout (little-endian) ::
+
+    header   -- magic, number of entries, longest, size of files
+    starts   -- first day of each range (int32, proleptic ordinal)
+    ends     -- last day of each range (int32)
+    files    -- which file each subrecord is in (uint32)
+    records  -- position of each subrecord in its file (uint32)
+    files    -- json: {paths, sources, state} (see `DateIndex`)
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from array import array
+from calendar import monthrange
+from os import path as fp
+import bisect
+import datetime
+import json
+import os
+import struct
+import sys
+
+from .archive import strip_compression
+from .cli import iter_records, path_sort_key, read_record, walk_sorted
+from .date import pack_iso, unpack_date
+from .packed import INDEX_NAME, is_packed
+
+DATE_COL = u'appearanceDate'
+DATE_COL_MIN = u'appearanceDate (min)'
+DATE_COL_MAX = u'appearanceDate (max)'
+INDEX_SUFFIX = '.date-index'
+
+_MAGIC = b'TTTDATE2'
+_HEADER = struct.Struct('<8sIiI')  # magic, entries, longest, files size
+
+
+def default_index_path(inputdir):
+    """
+    Where we keep the date index for a json dir by default (next
+    to it, so that it is not mistaken for one of its files)
+    """
+    return fp.normpath(inputdir) + INDEX_SUFFIX
+
+
+def date_range(dstr):
+    """
+    The first and last day (as ordinals) of an ISO partial date
+    (ValueError if it is not one) ::
+
+        String -> (Int, Int)
+    """
+    parts = unpack_date(pack_iso(dstr))
+    year = parts[0]
+    first_month = parts[1] if len(parts) > 1 else 1
+    last_month = parts[1] if len(parts) > 1 else 12
+    first_day = parts[2] if len(parts) > 2 else 1
+    last_day = parts[2] if len(parts) > 2 else\
+        monthrange(year, last_month)[1]
+    return (datetime.date(year, first_month, first_day).toordinal(),
+            datetime.date(year, last_month, last_day).toordinal())
+
+
+def subrecord_range(subrec):
+    """
+    The first and last day (as ordinals) that a subrecord covers
+    (None if it has no date, or one we cannot read) ::
+
+        Subrecord -> Maybe (Int, Int)
+    """
+    try:
+        if DATE_COL in subrec:
+            return date_range(subrec[DATE_COL])
+        elif DATE_COL_MIN in subrec and DATE_COL_MAX in subrec:
+            return (date_range(subrec[DATE_COL_MIN])[0],
+                    date_range(subrec[DATE_COL_MAX])[1])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def window_range(start=None, end=None):
+    """
+    The first and last day (as ordinals) of a window from one ISO
+    partial date to another (both inclusive, and either optional;
+    eg. 1290 to 1310 is from 1290-01-01 to 1310-12-31) ::
+
+        (Maybe String, Maybe String) -> (Int, Int)
+    """
+    first = 0 if start is None else date_range(start)[0]
+    last = datetime.date.max.toordinal() if end is None else\
+        date_range(end)[1]
+    return first, last
+
+
+def _native(values):
+    "an array in native byte order, from or to little-endian"
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _as_unicode(path):
+    "a path as unicode (decoding utf-8 byte strings)"
+    return path.decode('utf-8') if isinstance(path, bytes) else path
+
+
+def dir_state(inputdir):
+    """
+    The size and modification time of each file in a json dir (or
+    of the index of a packed record dir), by relative path ::
+
+        FilePath -> IO (Dict FilePath [Number])
+    """
+    if is_packed(inputdir):
+        names = [INDEX_NAME]
+    elif fp.isdir(inputdir):
+        names = walk_sorted(inputdir)
+    else:
+        raise IOError('{}: can only index json dirs and packed record '
+                      'dirs'.format(inputdir))
+    state = {}
+    for name in names:
+        stat = os.stat(fp.join(inputdir, name))
+        state[_as_unicode(name).replace(os.sep, '/')] =\
+            [stat.st_size, stat.st_mtime]
+    return state
+
+
+def index_dir(inputdir, threads=1, processes=1):
+    """
+    Index the records in a json dir or packed record dir (see
+    `ttt.cli.iter_records` for the other parameters) ::
+
+        FilePath -> IO DateIndex
+    """
+    # before reading, so that changes made while we read make the
+    # index look out of date rather than the other way around
+    state = dir_state(inputdir)
+    index = DateIndex.build(iter_records(inputdir,
+                                         threads=threads,
+                                         processes=processes))
+    index.state = state
+    if not is_packed(inputdir):
+        sources = {strip_compression(_as_unicode(k)): k for k in state}
+        index.sources = [sources[p.replace(os.sep, '/')]
+                         for p in index.paths]
+    return index
+
+
+class DateIndex(object):
+    """
+    Subrecords by date range (see module docs); create with `build`,
+    `index_dir` or `load`
+
+    :param paths: the files that the subrecords are in (as from
+                  `ttt.cli.iter_records`)
+    :param sources: the relative paths of these files in the dir
+                    (which may have a compression suffix), or None for
+                    packed record dirs (or if we do not know)
+    :param state: see `dir_state` (empty if we do not know)
+    """
+    def __init__(self, paths, starts, ends, files, records, longest,
+                 sources=None, state=None):
+        self.paths = paths
+        self.starts = starts
+        self.ends = ends
+        self.files = files
+        self.records = records
+        self.longest = longest
+        self.sources = sources
+        self.state = state or {}
+
+    @classmethod
+    def build(cls, pairs):
+        """
+        Index some records, eg. from `ttt.cli.iter_records` (this should
+        be all of the records, unfiltered, for the record positions
+        to make sense). Use `index_dir` to index a json dir that you
+        want to query later on ::
+
+            Iterator (FilePath, [Subrecord]) -> DateIndex
+        """
+        paths = []
+        entries = []
+        for subpath, subrecs in pairs:
+            file_id = len(paths)
+            paths.append(_as_unicode(subpath))
+            for i, subrec in enumerate(subrecs):
+                span = subrecord_range(subrec)
+                if span is not None:
+                    entries.append((span[0], span[1], file_id, i))
+        entries.sort()
+        return cls(paths,
+                   array('i', [e[0] for e in entries]),
+                   array('i', [e[1] for e in entries]),
+                   array('I', [e[2] for e in entries]),
+                   array('I', [e[3] for e in entries]),
+                   max([e[1] - e[0] for e in entries] or [0]))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read an index saved with `save` ::
+
+            FilePath -> IO DateIndex
+        """
+        with open(filename, 'rb') as ifile:
+            magic, num_entries, longest, files_size =\
+                _HEADER.unpack(ifile.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise IOError('{} does not look like a date index (or is '
+                              'from an older version)'.format(filename))
+            columns = []
+            for typecode in 'iiII':
+                column = array(typecode)
+                column.fromfile(ifile, num_entries)
+                columns.append(_native(column))
+            files = json.loads(ifile.read(files_size).decode('utf-8'))
+        return cls(files['paths'], *(columns + [longest]),
+                   sources=files['sources'], state=files['state'])
+
+    def save(self, filename):
+        """
+        Write the index to a file
+        """
+        files = json.dumps({'paths': self.paths,
+                            'sources': self.sources,
+                            'state': self.state}).encode('utf-8')
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as ofile:
+            ofile.write(_HEADER.pack(_MAGIC, len(self), self.longest,
+                                     len(files)))
+            for column in [self.starts, self.ends, self.files, self.records]:
+                _native(array(column.typecode, column)).tofile(ofile)
+            ofile.write(files)
+        os.rename(tmp_filename, filename)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_current(self, inputdir):
+        """
+        If the index is for the json dir as it is now (ie. none of
+        its files have been added, removed or modified since we
+        indexed it) ::
+
+            FilePath -> IO Bool
+        """
+        try:
+            return bool(self.state) and dir_state(inputdir) == self.state
+        except (IOError, OSError):
+            return False
+
+    def query(self, start=None, end=None):
+        """
+        The subrecords whose dates overlap a window (see `window_range`),
+        as (file path, position in file) pairs, in order of their first
+        day ::
+
+            (Maybe String, Maybe String) -> Iterator (FilePath, Int)
+        """
+        first, last = window_range(start, end)
+        low = bisect.bisect_left(self.starts, first - self.longest)
+        high = bisect.bisect_right(self.starts, last)
+        for i in xrange(low, high):
+            if self.ends[i] >= first:
+                yield self.paths[self.files[i]], self.records[i]
+
+    def query_files(self, start=None, end=None):
+        """
+        The positions of the subrecords whose dates overlap a window
+        (see `query`), by file, as a list of (path, positions) pairs
+        in path order ::
+
+            (Maybe String, Maybe String) -> [(FilePath, [Int])]
+        """
+        positions = {}
+        for subpath, i in self.query(start, end):
+            positions.setdefault(subpath, []).append(i)
+        return [(p, sorted(positions[p]))
+                for p in sorted(positions, key=path_sort_key)]
+
+    def read_window(self, inputdir, start=None, end=None):
+        """
+        The subrecords whose dates overlap a window, read from the
+        json dir that we indexed, by file (in path order). Only the
+        files with such subrecords are read. Check that the index is
+        current (see `is_current`) first ::
+
+            (FilePath, Maybe String, Maybe String)
+            -> Iterator (FilePath, [Subrecord])
+        """
+        sources = None if self.sources is None else\
+            dict(zip(self.paths, self.sources))
+        for subpath, positions in self.query_files(start, end):
+            if sources is None:
+                subrecs = read_record(inputdir, subpath.encode('utf-8'))
+            else:
+                subrecs = read_record(inputdir, sources[subpath])
+            yield subpath, [subrecs[i] for i in positions]
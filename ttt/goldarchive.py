@@ -0,0 +1,258 @@
+"""
+Chunked (and incremental) archives of the GOLD working dir
+
+Instead of one big tarball, an archive is a directory of smaller
+tarballs (chunks), each compressed independently, so that they can
+be compressed (and extracted) in parallel.  A manifest lists every
+file in the archive, along with which chunk holds it.
+
+An archive can be incremental: given the previous archive, we only
+put the files that have changed since then in the chunks, and the
+manifest points at the chunks of earlier archives for the rest.  An
+incremental archive is thus only usable alongside the archives in
+its chain, which must live in the same directory as it.  Any archive
+in a chain can be restored, or read directly (see `ttt.archive`).
+
+Archive layout ::
+
+    MANIFEST.json        -- see below
+    chunk-NNNN.tar.bz2   -- files relative to the archived dir
+
+Manifest ::
+
+    name    :: String        -- archive dir name
+    parent  :: Maybe String  -- previous archive (name)
+    created :: String        -- timestamp
+    chunks  :: [String]      -- chunks in this archive
+    files   :: Dict FilePath { sha1, size, mtime, archive, chunk }
+
+Files are considered unchanged if they have the same size and
+modification time as in the previous archive (or else the same
+contents)
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import errno
+import json
+import multiprocessing
+import os
+import shutil
+import tarfile
+import time
+
+from .archive import (CHUNKED_MANIFEST, chunk_locations, iter_tar_members,
+                      read_chunked_manifest)
+from .cli import walk_sorted
+from .manifest import file_sha1
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+_COMPRESSION_SUFFIXES = {'bz2': '.tar.bz2', 'gz': '.tar.gz'}
+
+
+class ArchiveError(Exception):
+    """
+    Problem building or restoring an archive
+    """
+    pass
+
+
+class BuildStats(namedtuple('BuildStats', 'files changed chunks size')):
+    """
+    What went into an archive ::
+
+        files   :: Int  -- files in the archive (including earlier ones)
+        changed :: Int  -- files stored in this archive's own chunks
+        chunks  :: Int  -- chunks in this archive
+        size    :: Int  -- bytes (uncompressed) in this archive's chunks
+    """
+    pass
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+def _manifest_key(subpath):
+    "how a file is named in the manifest (unicode, slash-separated)"
+    if isinstance(subpath, bytes):
+        subpath = subpath.decode('utf-8')
+    return subpath.replace(os.sep, '/')
+
+
+def _write_chunk(job):
+    "tar up some files (in a pool worker)"
+    src, filename, compression, subpaths = job
+    tmp_filename = filename + '.tmp'
+    # dereference, so that hard links (eg. snapshot checkouts, see
+    # `ttt.snapshot`) are stored as the files they are
+    tar = tarfile.open(tmp_filename, 'w:' + compression, dereference=True)
+    try:
+        for subpath in subpaths:
+            tar.add(fp.join(src, subpath), arcname=subpath, recursive=False)
+    finally:
+        tar.close()
+    os.rename(tmp_filename, filename)
+
+
+def _extract_chunk(job):
+    "extract some files from a chunk (in a pool worker)"
+    chunk, dst, mtimes = job
+    count = 0
+    for subpath, stream in iter_tar_members(chunk,
+                                            want=mtimes.__contains__):
+        filename = fp.join(dst, subpath)
+        _mkdirs(fp.dirname(filename))
+        with open(filename, 'wb') as ofile:
+            shutil.copyfileobj(stream, ofile)
+        os.utime(filename, (mtimes[subpath], mtimes[subpath]))
+        count += 1
+    return count
+
+
+def _split_chunks(sizes, chunk_size, jobs):
+    """
+    Cut a list of (subpath, size) into consecutive groups of about
+    `chunk_size` bytes (smaller if that helps keep the workers busy)
+    """
+    total = sum(s for _, s in sizes)
+    chunk_size = max(min(chunk_size, total // max(jobs, 1)), 1)
+    chunks = []
+    current = []
+    current_size = 0
+    for subpath, size in sizes:
+        if current and current_size + size > chunk_size:
+            chunks.append(current)
+            current = []
+            current_size = 0
+        current.append(subpath)
+        current_size += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _map(func, jobs, processes):
+    "map over some jobs, in a process pool if we have more than one"
+    if processes <= 1 or len(jobs) <= 1:
+        return [func(j) for j in jobs]
+    pool = multiprocessing.Pool(min(processes, len(jobs)))
+    try:
+        return pool.map(func, jobs)
+    finally:
+        pool.terminate()
+
+
+def build_archive(src, archive, parent=None, processes=1,
+                  chunk_size=DEFAULT_CHUNK_SIZE, compression='bz2'):
+    """
+    Archive a directory, either in full or (given a previous archive
+    in the same directory) just the files that changed since then ::
+
+        (FilePath, FilePath, Maybe FilePath, Int, Int, String)
+        -> IO BuildStats
+    """
+    if fp.exists(archive):
+        raise ArchiveError('{} already exists'.format(archive))
+    if compression not in _COMPRESSION_SUFFIXES:
+        raise ArchiveError('unknown compression: {}'.format(compression))
+    name = fp.basename(fp.normpath(archive))
+    old_files = {}
+    if parent is not None:
+        if fp.dirname(fp.abspath(parent)) != fp.dirname(fp.abspath(archive)):
+            raise ArchiveError('{} should be in the same directory as {}'
+                               .format(parent, archive))
+        old_files = read_chunked_manifest(parent)['files']
+
+    files = {}
+    changed = []
+    for subpath in walk_sorted(src):
+        key = _manifest_key(subpath)
+        stat = os.stat(fp.join(src, subpath))
+        old = old_files.get(key)
+        if old is not None and old['size'] == stat.st_size and\
+                old['mtime'] == stat.st_mtime:
+            files[key] = old
+            continue
+        sha1 = file_sha1(fp.join(src, subpath))
+        if old is not None and old['sha1'] == sha1:
+            files[key] = dict(old, mtime=stat.st_mtime)
+            continue
+        files[key] = {'sha1': sha1,
+                      'size': stat.st_size,
+                      'mtime': stat.st_mtime,
+                      'archive': name}
+        changed.append((subpath, stat.st_size))
+
+    os.makedirs(archive)
+    suffix = _COMPRESSION_SUFFIXES[compression]
+    jobs = []
+    for num, subpaths in enumerate(_split_chunks(changed, chunk_size,
+                                                 processes)):
+        chunk = 'chunk-{:04}{}'.format(num, suffix)
+        for subpath in subpaths:
+            files[_manifest_key(subpath)]['chunk'] = chunk
+        jobs.append((src, fp.join(archive, chunk), compression, subpaths))
+    _map(_write_chunk, jobs, processes)
+
+    if parent is not None:
+        parent = fp.basename(fp.normpath(parent))
+    manifest = {'name': name,
+                'parent': parent,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'chunks': [fp.basename(j[1]) for j in jobs],
+                'files': files}
+    tmp_filename = fp.join(archive, CHUNKED_MANIFEST + '.tmp')
+    with open(tmp_filename, 'w') as stream:
+        json.dump(manifest, stream, indent=1, sort_keys=True)
+    os.rename(tmp_filename, fp.join(archive, CHUNKED_MANIFEST))
+    return BuildStats(files=len(files),
+                      changed=len(changed),
+                      chunks=len(jobs),
+                      size=sum(s for _, s in changed))
+
+
+def archive_chain(archive):
+    """
+    The names of the archives that an archive needs (itself and
+    those it was built on, most recent first) ::
+
+        FilePath -> IO [String]
+    """
+    parent_dir = fp.dirname(fp.abspath(archive))
+    name = fp.basename(fp.normpath(archive))
+    chain = []
+    while name is not None:
+        if name in chain:
+            raise ArchiveError('archive chain loops at {}'.format(name))
+        chain.append(name)
+        mfile = fp.join(parent_dir, name, CHUNKED_MANIFEST)
+        if not fp.exists(mfile):
+            raise ArchiveError('missing archive in chain: {}'.format(name))
+        name = read_chunked_manifest(fp.join(parent_dir, name))['parent']
+    return chain
+
+
+def restore_archive(archive, dst, processes=1):
+    """
+    Extract all the files in an archive (from the chunks of all the
+    archives in its chain), returning how many there were ::
+
+        (FilePath, FilePath, Int) -> IO Int
+    """
+    archive_chain(archive)
+    files = read_chunked_manifest(archive)['files']
+    jobs = []
+    for chunk, subpaths in chunk_locations(archive):
+        mtimes = {s: files[_manifest_key(s)]['mtime'] for s in subpaths}
+        jobs.append((chunk, dst, mtimes))
+    return sum(_map(_extract_chunk, jobs, processes))
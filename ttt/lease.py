@@ -0,0 +1,293 @@
+"""
+A work queue for `ttt.cli.generic_main` that several machines can
+share, using nothing more than a shared directory.
+
+Workers walk through the list of inputs (biggest first), and take out
+a lease on the next one that nobody has finished or is working on.
+Leases are files, created atomically with `os.link` (which is safe
+even over NFS), and kept alive by a heartbeat thread that touches them
+every so often.  A lease that has not been touched for a while belongs
+to a dead worker, so somebody else may take it over.  Finished inputs
+get a marker file (recording the failure if there was one).
+
+Queue directory layout ::
+
+    leases/NAME   -- input currently being worked on
+    done/NAME     -- input that has been processed
+    failed/NAME   -- traceback for an input that could not be processed
+
+where NAME is a hash of the input path, size and modification time
+(so that a changed input is processed again).
+
+The done markers are never cleared, so a queue directory belongs to a
+single run (of the same command on the same inputs and outputs, on
+however many machines): use a fresh one for each run.  Reusing one
+resumes the run it was made for, skipping whatever that run finished
+(even if its outputs have since been deleted, or the other options
+have changed, eg. whether the run is incremental).
+
+If a worker loses its lease (because it was too slow to heartbeat and
+somebody else took the input over), it throws away its result and
+leaves the input to its new owner.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from os import path as fp
+import errno
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+DEFAULT_TTL = 120
+_POLL_INTERVAL = 1
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+def _write_atomically(filename, text):
+    "write a file to the side, then move it into place"
+    tmp_filename = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+    with open(tmp_filename, 'w') as stream:
+        stream.write(text)
+    os.rename(tmp_filename, filename)
+
+
+class Lease(object):
+    """
+    A lease on an input, which is kept alive by a heartbeat thread
+    until you release it.
+
+    `lost` becomes True if we find that somebody else has taken it
+    over (which should only happen if we were too slow to heartbeat)
+    """
+    def __init__(self, filename, token, ttl):
+        self.filename = filename
+        self.token = token
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat,
+                                        args=(ttl / 4.0,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _owned(self):
+        "if the lease file is still ours"
+        try:
+            with open(self.filename) as stream:
+                return json.load(stream).get('token') == self.token
+        except (IOError, ValueError):
+            return False
+
+    def _heartbeat(self, interval):
+        "touch the lease file every so often"
+        while not self._stop.wait(interval):
+            if not self._owned():
+                self.lost = True
+                return
+            try:
+                os.utime(self.filename, None)
+            except OSError:
+                self.lost = True
+                return
+
+    def held(self):
+        """
+        If the lease is still ours (checking now, rather than waiting
+        for the next heartbeat)
+        """
+        if not self.lost and not self._owned():
+            self.lost = True
+        return not self.lost
+
+    def release(self):
+        "stop heartbeating and delete the lease"
+        self._stop.set()
+        self._thread.join()
+        if self._owned():
+            os.remove(self.filename)
+
+
+class WorkQueue(object):
+    """
+    Shared directory based work queue
+
+    :param dirname: the queue directory (shared by all workers)
+    :param ttl: seconds after which a lease that has not been touched
+                is considered to belong to a dead worker
+    """
+    def __init__(self, dirname, ttl=DEFAULT_TTL):
+        self.dirname = dirname
+        self.ttl = ttl
+        self._lease_dir = fp.join(dirname, 'leases')
+        self._done_dir = fp.join(dirname, 'done')
+        self._failed_dir = fp.join(dirname, 'failed')
+        for subdir in [self._lease_dir, self._done_dir, self._failed_dir]:
+            _mkdirs(subdir)
+
+    @staticmethod
+    def item_name(idir, subpath):
+        """
+        Queue entry name for an input file
+        """
+        stat = os.stat(fp.join(idir, subpath))
+        key = '{}\t{}\t{}'.format(subpath, stat.st_size, stat.st_mtime)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.md5(key).hexdigest()
+
+    def _now(self):
+        """
+        The current time according to the shared filesystem (which
+        is what lease modification times are measured against; the
+        clocks on different machines may not agree)
+        """
+        clock = fp.join(self.dirname, 'clock')
+        with open(clock, 'a'):
+            os.utime(clock, None)
+        return os.stat(clock).st_mtime
+
+    def _is_stale(self, filename, now):
+        "if a lease has not been touched in a while"
+        try:
+            return now - os.stat(filename).st_mtime > self.ttl
+        except OSError:
+            return False
+
+    def is_done(self, name):
+        "if the queue entry has been processed"
+        return fp.exists(fp.join(self._done_dir, name))
+
+    def claim(self, name):
+        """
+        Try to take out a lease on a queue entry; return None if
+        somebody else has it ::
+
+            String -> IO (Maybe Lease)
+        """
+        lease_file = fp.join(self._lease_dir, name)
+        token = uuid.uuid4().hex
+        tmp_file = '{}.{}.tmp'.format(lease_file, token)
+        with open(tmp_file, 'w') as stream:
+            json.dump({'token': token,
+                       'host': socket.gethostname(),
+                       'pid': os.getpid()}, stream)
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_file, lease_file)
+                    return Lease(lease_file, token, self.ttl)
+                except OSError as oops:
+                    if oops.errno != errno.EEXIST:
+                        raise
+                if not self._reap(lease_file):
+                    return None
+            return None
+        finally:
+            os.remove(tmp_file)
+
+    def _reap(self, lease_file):
+        """
+        Remove a lease if it is stale, returning True if we did.
+
+        We move it aside first so that only one worker can reap it; if
+        it turns out the lease we moved was fresh (somebody reaped and
+        reclaimed it under our nose), we try to put it back
+        """
+        if not self._is_stale(lease_file, self._now()):
+            return False
+        grave = '{}.{}.dead'.format(lease_file, uuid.uuid4().hex)
+        try:
+            os.rename(lease_file, grave)
+        except OSError:
+            return False
+        try:
+            if self._is_stale(grave, self._now()):
+                return True
+            try:
+                os.link(grave, lease_file)
+            except OSError:
+                pass
+            return False
+        finally:
+            os.remove(grave)
+
+    def finish(self, name, subpath, failure=None):
+        """
+        Mark a queue entry as done (with the formatted traceback if it
+        failed)
+        """
+        if failure is not None:
+            _write_atomically(fp.join(self._failed_dir, name),
+                              json.dumps({'input': subpath,
+                                          'error': failure}))
+        _write_atomically(fp.join(self._done_dir, name), subpath)
+
+    def failures(self, names):
+        """
+        Failures recorded for the given queue entries (by any worker) ::
+
+            Dict String FilePath -> IO (Dict FilePath String)
+        """
+        failures = {}
+        for name in names:
+            filename = fp.join(self._failed_dir, name)
+            if fp.exists(filename):
+                with open(filename) as stream:
+                    failures[names[name]] = json.load(stream)['error']
+        return failures
+
+
+def work_loop(queue, on_file, idir, odir, subpaths):
+    """
+    Keep claiming and processing inputs until all of them are done
+    (by us or by somebody else), reclaiming the leases of dead
+    workers as we go.  Inputs are tried in the order given ::
+
+        (WorkQueue, Worker, FilePath, FilePath, [FilePath]) -> IO ()
+    """
+    names = [(queue.item_name(idir, s), s) for s in subpaths]
+    while True:
+        # entries that other workers are busy with
+        pending = []
+        for name, subpath in names:
+            if queue.is_done(name):
+                continue
+            lease = queue.claim(name)
+            if lease is None:
+                pending.append((name, subpath))
+                continue
+            try:
+                if queue.is_done(name):  # finished while we were looking
+                    continue
+                try:
+                    on_file(idir, odir, subpath)
+                    failure = None
+                except Exception:  # pylint: disable=broad-except
+                    failure = traceback.format_exc()
+                if lease.held():
+                    queue.finish(name, subpath, failure)
+                else:
+                    # taken over by somebody else, whose result is the
+                    # one that counts; wait for them like any other
+                    pending.append((name, subpath))
+            finally:
+                lease.release()
+        if not pending:
+            return
+        names = pending
+        time.sleep(_POLL_INTERVAL)
@@ -0,0 +1,325 @@
+"""
+Bookkeeping for incremental runs of `ttt.cli.generic_main`
+
+We keep a manifest for the output dir recording, for each input file,
+its size, modification time and content hash, along with the output
+files it produced.  On the next run, we only need to rerun the worker
+on inputs that have changed (and clean up after ones that have gone).
+
+Workers write into a private staging dir, and their outputs are only
+moved into place (and journaled) once they succeed, so an interrupted
+run can pick up where it left off.
+
+All of this lives in a state dir next to the output dir (by default,
+`OUTPUT.ttt-state`) so as not to be mistaken for output by nimrodel.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from collections import namedtuple
+from os import path as fp
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+STATE_SUFFIX = '.ttt-state'
+_MANIFEST_NAME = 'manifest.json'
+_JOURNAL_DIR = 'journal'
+_STAGING_DIR = 'staging'
+_MANIFEST_VERSION = 1
+_BLOCK_SIZE = 1 << 16
+
+
+class Fingerprint(namedtuple('Fingerprint', 'size mtime sha1')):
+    """
+    What we know about an input file
+
+    :param size: size in bytes
+    :param mtime: modification time (seconds since epoch)
+    :param sha1: hex digest of the file contents
+    """
+
+
+def file_sha1(filename):
+    """
+    Hex sha1 digest of a file's contents ::
+
+        FilePath -> IO String
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as stream:
+        for block in iter(lambda: stream.read(_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(filename, sha1=None):
+    """
+    Fingerprint for a file (computing its hash if you don't
+    already know it) ::
+
+        FilePath -> IO Fingerprint
+    """
+    stat = os.stat(filename)
+    return Fingerprint(size=stat.st_size,
+                       mtime=stat.st_mtime,
+                       sha1=sha1 or file_sha1(filename))
+
+
+def _remove_output(odir, subpath):
+    """
+    Delete an output file, along with any directories that
+    this leaves empty (up to, but not including the output dir)
+    """
+    filename = fp.join(odir, subpath)
+    if fp.exists(filename):
+        os.remove(filename)
+    parent = fp.dirname(subpath)
+    while parent:
+        try:
+            os.rmdir(fp.join(odir, parent))
+        except OSError:
+            break
+        parent = fp.dirname(parent)
+
+
+def default_state_dir(odir):
+    """
+    Where we keep the manifest for an output dir if not told otherwise
+    """
+    return fp.normpath(odir) + STATE_SUFFIX
+
+
+def _journal_name(subpath):
+    "name of the journal file for an input"
+    if isinstance(subpath, unicode):
+        subpath = subpath.encode('utf-8')
+    return hashlib.sha1(subpath).hexdigest() + '.json'
+
+
+def _read_json(filename):
+    "read a json file"
+    with open(filename) as stream:
+        return json.load(stream)
+
+
+def _write_json(filename, obj):
+    "write a json file atomically (write to the side, then rename)"
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as stream:
+        json.dump(obj, stream, indent=1, sort_keys=True)
+    os.rename(tmp_filename, filename)
+
+
+class Manifest(object):
+    """
+    Record of the inputs processed for an output dir, and of the
+    outputs that each of them produced.
+
+    Entries are dictionaries with the fields of a `Fingerprint`
+    plus a list of `outputs` (paths relative to the output dir)
+
+    :param odir: output dir
+    :param state_dir: where to keep the manifest and work in progress
+    """
+    def __init__(self, odir, state_dir):
+        self.odir = odir
+        self.entries = {}
+        self.state_dir = state_dir
+        self._journal_dir = fp.join(state_dir, _JOURNAL_DIR)
+        self.staging_dir = fp.join(state_dir, _STAGING_DIR)
+
+    @classmethod
+    def load(cls, odir, state_dir=None):
+        """
+        Read the manifest for an output dir (an empty one if it does
+        not exist yet), replaying any work journaled by an earlier
+        run that did not get to finish ::
+
+            (FilePath, Maybe FilePath) -> IO Manifest
+        """
+        state_dir = state_dir or default_state_dir(odir)
+        manifest = cls(odir, state_dir)
+        filename = fp.join(state_dir, _MANIFEST_NAME)
+        if fp.exists(filename):
+            manifest.entries = _read_json(filename)['inputs']
+        manifest.replay_journal()
+        # partial outputs from an interrupted worker
+        if fp.exists(manifest.staging_dir):
+            shutil.rmtree(manifest.staging_dir)
+        return manifest
+
+    def save(self):
+        """
+        Write the manifest out (and clear the journal, which it now
+        subsumes)
+        """
+        if not fp.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        _write_json(fp.join(self.state_dir, _MANIFEST_NAME),
+                    {'version': _MANIFEST_VERSION,
+                     'inputs': self.entries})
+        if fp.exists(self._journal_dir):
+            shutil.rmtree(self._journal_dir)
+
+    def replay_journal(self):
+        """
+        Fold the journaled entries into the manifest, deleting the
+        outputs that a changed input no longer produces
+        """
+        journaled = glob.glob(fp.join(self._journal_dir, '*.json'))
+        for jfile in sorted(journaled):
+            jentry = _read_json(jfile)
+            subpath = jentry.pop('input')
+            self.update(subpath, jentry)
+
+    def update(self, subpath, entry):
+        """
+        Record a new entry for an input
+        """
+        old_entry = self.entries.get(subpath)
+        self.entries[subpath] = entry
+        if old_entry is not None:
+            self._remove_outputs(frozenset(old_entry['outputs']) -
+                                 frozenset(entry['outputs']))
+
+    def journal(self, subpath, entry):
+        """
+        Durably record a new entry for an input, without having to
+        rewrite the whole manifest (safe to call from worker processes)
+        """
+        if not fp.exists(self._journal_dir):
+            try:
+                os.makedirs(self._journal_dir)
+            except OSError:
+                # another worker got there first
+                if not fp.isdir(self._journal_dir):
+                    raise
+        jentry = dict(entry)
+        jentry['input'] = subpath
+        _write_json(fp.join(self._journal_dir, _journal_name(subpath)),
+                    jentry)
+
+    def _remove_outputs(self, outputs):
+        """
+        Delete the given outputs, except any that are still claimed
+        by a live entry
+        """
+        if not outputs:
+            return
+        claimed = frozenset(o for e in self.entries.values()
+                            for o in e['outputs'])
+        for output in sorted(outputs - claimed):
+            _remove_output(self.odir, output)
+
+    def forget_missing(self, subpaths):
+        """
+        Drop (and delete the outputs of) all inputs except the given
+        ones ::
+
+            [FilePath] -> IO [FilePath]
+
+        Return the inputs that were dropped
+        """
+        live = frozenset(subpaths)
+        missing = sorted(s for s in self.entries if s not in live)
+        outputs = frozenset(o for s in missing
+                            for o in self.entries[s]['outputs'])
+        for subpath in missing:
+            del self.entries[subpath]
+        self._remove_outputs(outputs)
+        return missing
+
+    def changed(self, idir, subpaths):
+        """
+        Return the inputs which have changed since we last saw them,
+        along with the fingerprints we had to compute to find out ::
+
+            (FilePath, [FilePath]) -> IO ([FilePath], Dict FilePath String)
+
+        Inputs with the same size and modification time as before are
+        assumed unchanged; otherwise we compare content hashes.
+        """
+        changed = []
+        hashes = {}
+        for subpath in subpaths:
+            filename = fp.join(idir, subpath)
+            entry = self.entries.get(subpath)
+            stat = os.stat(filename)
+            if entry is not None and\
+                    entry['size'] == stat.st_size and\
+                    entry['mtime'] == stat.st_mtime:
+                continue
+            sha1 = file_sha1(filename)
+            hashes[subpath] = sha1
+            if entry is not None and entry['sha1'] == sha1:
+                # touched but not really changed
+                entry['size'] = stat.st_size
+                entry['mtime'] = stat.st_mtime
+            else:
+                changed.append(subpath)
+        return changed, hashes
+
+
+def _move_tree(src_dir, dst_dir):
+    """
+    Move all files from one dir into another (replacing any existing
+    files), returning their paths relative to the two dirs ::
+
+        (FilePath, FilePath) -> IO [FilePath]
+    """
+    moved = []
+    for root, _, files in os.walk(src_dir):
+        for bname in files:
+            src = fp.join(root, bname)
+            subpath = fp.relpath(src, src_dir)
+            dst = fp.join(dst_dir, subpath)
+            if not fp.exists(fp.dirname(dst)):
+                try:
+                    os.makedirs(fp.dirname(dst))
+                except OSError:
+                    if not fp.isdir(fp.dirname(dst)):
+                        raise
+            os.rename(src, dst)
+            moved.append(subpath)
+    return sorted(moved)
+
+
+class StagedWorker(object):
+    """
+    Wrap a `generic_main` worker so that it writes to a staging
+    dir; once it succeeds, move its outputs into the real output
+    dir and journal them in the manifest.
+
+    :param on_file: the actual worker
+    :param manifest: manifest for the output dir
+    :param hashes: content hashes for inputs that we already know
+                   (you can add to these as you go along)
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, on_file, manifest, hashes=None):
+        self.on_file = on_file
+        self.manifest = manifest
+        self.hashes = dict(hashes or {})
+
+    def __call__(self, idir, odir, subpath):
+        # fingerprint before running so that any changes during the
+        # run are spotted next time around
+        fprint = fingerprint(fp.join(idir, subpath),
+                             sha1=self.hashes.get(subpath))
+        staging = fp.join(self.manifest.staging_dir,
+                          _journal_name(subpath)[:-5])
+        if fp.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        try:
+            self.on_file(idir, staging, subpath)
+            outputs = _move_tree(staging, odir)
+        finally:
+            shutil.rmtree(staging)
+        entry = fprint._asdict()
+        entry['outputs'] = outputs
+        self.manifest.journal(subpath, dict(entry))
@@ -0,0 +1,187 @@
+"""
+Near-duplicate detection for snippets (MinHash and LSH)
+
+Lots of snippets are formulaic and nearly identical to each other.
+To find them without comparing every pair, we
+
+1. turn each snippet into a set of shingles (runs of `k` words)
+2. summarise each set as a MinHash signature (the minimum of each of
+   a family of hash functions over the shingles); the proportion of
+   positions on which two signatures agree estimates the Jaccard
+   similarity of their sets
+3. cut signatures into bands and put snippets into buckets by band;
+   snippets that share a bucket in any band are candidates
+4. keep the candidates whose signatures agree at least `threshold`
+   of the time, and group them into clusters (transitively)
+
+With `bands` bands of `rows` rows each, snippets with similarity `s`
+become candidates with probability `1 - (1 - s^rows)^bands`, which
+rises sharply around `(1/bands)^(1/rows)`.
+
+NumPy is used for the signatures if it is installed
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+import random
+import re
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # pylint: disable=invalid-name
+
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class LshConfig(namedtuple('LshConfig',
+                           'shingle_size bands rows threshold seed')):
+    """
+    Parameters for near-duplicate detection ::
+
+        shingle_size :: Int    -- words per shingle
+        bands        :: Int    -- number of LSH bands
+        rows         :: Int    -- signature entries per band
+        threshold    :: Float  -- estimated Jaccard similarity above
+                                  which candidates count as duplicates
+        seed         :: Int    -- for the hash functions
+    """
+    @property
+    def num_hashes(self):
+        "length of the signatures"
+        return self.bands * self.rows
+
+
+DEFAULT_CONFIG = LshConfig(shingle_size=3, bands=20, rows=5,
+                           threshold=0.7, seed=42)
+
+
+def shingles(text, k):
+    """
+    Hashed word k-shingles for a text (lowercased, punctuation
+    ignored). Texts shorter than k words are a single shingle ::
+
+        (Text, Int) -> Set Int
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < k:
+        words = [u' '.join(words)]
+        k = 1
+    return set(zlib.crc32(u' '.join(words[i:i + k]).encode('utf-8'))
+               & 0xffffffff
+               for i in range(len(words) - k + 1))
+
+
+class MinHasher(object):
+    """
+    Computes MinHash signatures (tuples of ints) with a fixed family
+    of hash functions `(a * x + b) mod p`
+    """
+    def __init__(self, num_hashes, seed=0):
+        rng = random.Random(seed)
+        self.coeffs = [(rng.randint(1, _PRIME - 1),
+                        rng.randint(0, _PRIME - 1))
+                       for _ in range(num_hashes)]
+        if numpy is not None:
+            self._a = numpy.array([a for a, _ in self.coeffs],
+                                  dtype=numpy.uint64)
+            self._b = numpy.array([b for _, b in self.coeffs],
+                                  dtype=numpy.uint64)
+
+    def signature(self, hashes):
+        """
+        MinHash signature for a set of (32 bit) shingle hashes
+        """
+        if not hashes:
+            return tuple([_PRIME] * len(self.coeffs))
+        if numpy is not None:
+            xs = numpy.fromiter(hashes, dtype=numpy.uint64,
+                                count=len(hashes))
+            values = (numpy.outer(self._a, xs) + self._b[:, None]) % _PRIME
+            return tuple(int(x) for x in values.min(axis=1))
+        return tuple(min((a * x + b) % _PRIME for x in hashes)
+                     for a, b in self.coeffs)
+
+
+def similarity(sig1, sig2):
+    """
+    Estimated Jaccard similarity of the sets behind two signatures
+    """
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / float(len(sig1))
+
+
+class _UnionFind(object):
+    "disjoint sets of items"
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        "representative for an item's set"
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.find(parent)
+            self.parent[item] = parent
+        return parent
+
+    def union(self, item1, item2):
+        "merge the sets of two items (the smaller one represents both)"
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 != root2:
+            self.parent[max(root1, root2)] = min(root1, root2)
+
+
+def find_clusters(snippets, config=DEFAULT_CONFIG):
+    """
+    Group near-duplicate snippets together. Return a dictionary from
+    each snippet id to the id of its cluster's representative (the
+    first snippet of the cluster in input order; for a snippet with
+    no near-duplicates, itself) ::
+
+        (Iterable (FilePath, Text), LshConfig) -> Dict FilePath FilePath
+    """
+    hasher = MinHasher(config.num_hashes, seed=config.seed)
+    ids = []
+    signatures = []
+    buckets = [{} for _ in range(config.bands)]
+    clusters = _UnionFind()
+    for subpath, text in snippets:
+        num = len(ids)
+        sig = hasher.signature(shingles(text, config.shingle_size))
+        ids.append(subpath)
+        signatures.append(sig)
+        clusters.find(num)
+        seen = set()
+        for band, bucket in enumerate(buckets):
+            key = sig[band * config.rows:(band + 1) * config.rows]
+            members = bucket.setdefault(key, [])
+            joined = False
+            for other in members:
+                if other in seen:
+                    continue
+                seen.add(other)
+                if similarity(sig, signatures[other]) >= config.threshold:
+                    clusters.union(num, other)
+                    joined = True
+            # buckets only need one member per cluster (which keeps
+            # big clusters of near-identical snippets from making
+            # this quadratic)
+            if not joined:
+                members.append(num)
+    return {ids[n]: ids[clusters.find(n)] for n in range(len(ids))}
+
+
+def cluster_sizes(cluster_map):
+    """
+    Number of snippets in each cluster (by representative) ::
+
+        Dict FilePath FilePath -> Dict FilePath Int
+    """
+    sizes = {}
+    for rep in cluster_map.values():
+        sizes[rep] = sizes.get(rep, 0) + 1
+    return sizes
@@ -0,0 +1,309 @@
+"""
+Running nimrodel as an external command
+
+Besides running it on a single directory or batch (see `ttt.batch`),
+we can schedule runs over several datasets at once: the input files
+of each dataset are divided up into jobs, which are run (biggest
+first) by a pool of workers, each running `nimrodel dir` on a scratch
+copy of its job's input files.  Jobs that crash or time out are split
+in half and tried again, down to individual files if need be, so one
+bad file does not cost us the others.
+
+Nimrodel itself is just a command, so anything that behaves like
+`nimrodel dir INPUT OUTPUT` can stand in for it.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import codecs
+import errno
+import heapq
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .batch import BatchError
+from .cli import walk_sorted
+
+DEFAULT_JOB_FILES = 200
+_POLL_INTERVAL = 0.1
+
+
+def run_dir(command, idir, odir, log=None, timeout=None):
+    """
+    Run `nimrodel dir` on an input directory, raising `BatchError`
+    if it fails, or if it has not finished after `timeout` seconds
+    (in which case we kill it). Its output goes to the log file if
+    you supply one ::
+
+        ([String], FilePath, FilePath, Maybe FilePath, Maybe Float)
+        -> IO ()
+    """
+    stream = None if log is None else open(log, 'w')
+    try:
+        # in its own process group, so that on timeout we can kill
+        # nimrodel along with the wrapper script that started it
+        proc = subprocess.Popen(command + ['dir', idir, odir],
+                                stdout=stream,
+                                stderr=None if stream is None
+                                else subprocess.STDOUT,
+                                preexec_fn=os.setsid)
+        deadline = None if timeout is None else time.time() + timeout
+        while proc.poll() is None:
+            if deadline is not None and time.time() > deadline:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+                raise BatchError('nimrodel timed out after {}s'
+                                 .format(timeout) + _log_tail(log))
+            time.sleep(_POLL_INTERVAL)
+    finally:
+        if stream is not None:
+            stream.close()
+    if proc.returncode != 0:
+        raise BatchError('nimrodel exited with status {}'
+                         .format(proc.returncode) + _log_tail(log))
+
+
+def _log_tail(log, lines=5):
+    "the last few lines of a log file (if any) for error messages"
+    if log is None or not fp.exists(log):
+        return ''
+    with open(log) as stream:
+        tail = stream.read().rstrip().split('\n')[-lines:]
+    return ''.join('\n    ' + x for x in tail if x)
+
+
+def batch_runner(command, timeout=None):
+    """
+    A function that runs nimrodel on a `ttt.batch.Batch` (in a
+    scratch directory) and splits its output up by snippet
+    (raising `BatchError` if anything goes wrong). For use with
+    `ttt.batch.run_bisecting` ::
+
+        ([String], Maybe Float) -> (Batch -> IO [(FilePath, [Record])])
+    """
+    def run(batch):
+        "run nimrodel on a single batch"
+        tmpdir = tempfile.mkdtemp(prefix='ttt-nimrodel-')
+        try:
+            idir = fp.join(tmpdir, 'in')
+            odir = fp.join(tmpdir, 'out')
+            os.makedirs(idir)
+            os.makedirs(odir)
+            with codecs.open(fp.join(idir, batch.name), 'w',
+                             'utf-8') as stream:
+                stream.write(batch.text)
+            run_dir(command, idir, odir,
+                    log=fp.join(tmpdir, 'nimrodel.log'),
+                    timeout=timeout)
+            try:
+                with open(fp.join(odir, batch.name)) as stream:
+                    records = json.load(stream)
+            except (IOError, ValueError) as oops:
+                raise BatchError('no usable output for {}: {}'
+                                 .format(batch.name, oops))
+            return batch.unpack(records)
+        finally:
+            shutil.rmtree(tmpdir)
+    return run
+
+
+# ---------------------------------------------------------------------
+# scheduling
+# ---------------------------------------------------------------------
+
+
+class Job(namedtuple('Job', 'name idir odir subpaths size')):
+    """
+    Some input files to run nimrodel on in one go ::
+
+        name     :: String      -- for progress reports
+        idir     :: FilePath
+        odir     :: FilePath
+        subpaths :: [FilePath]  -- relative to idir (and odir)
+        size     :: Int         -- total input size in bytes
+    """
+    def halves(self):
+        """
+        Split a job into two (with half the files each)
+        """
+        middle = len(self.subpaths) // 2
+        return [self._sized(self.name + suffix, part)
+                for suffix, part in [('a', self.subpaths[:middle]),
+                                     ('b', self.subpaths[middle:])]]
+
+    def _sized(self, name, subpaths):
+        "a job like this one but with different input files"
+        size = sum(fp.getsize(fp.join(self.idir, s)) for s in subpaths)
+        return self._replace(name=name, subpaths=subpaths, size=size)
+
+
+def make_jobs(name, idir, odir, max_files=DEFAULT_JOB_FILES):
+    """
+    Divide the input files in a directory into jobs of up to
+    `max_files` files each ::
+
+        (String, FilePath, FilePath, Int) -> [Job]
+    """
+    subpaths = list(walk_sorted(idir))
+    jobs = []
+    for start in range(0, len(subpaths), max_files):
+        chunk = subpaths[start:start + max_files]
+        job = Job(name='{}#{}'.format(name, len(jobs)),
+                  idir=idir, odir=odir, subpaths=chunk, size=0)
+        jobs.append(job._sized(job.name, chunk))
+    return jobs
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+def _copy_or_link(src, dst):
+    "hard link a file if we can, copy it otherwise"
+    _mkdirs(fp.dirname(dst))
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def run_job(command, job, timeout=None):
+    """
+    Run nimrodel on the input files for a job (in a scratch directory),
+    and move its outputs into the job's output directory. Raise
+    `BatchError` if nimrodel fails or takes longer than `timeout`
+    seconds
+    """
+    tmpdir = tempfile.mkdtemp(prefix='ttt-nimrodel-')
+    try:
+        idir = fp.join(tmpdir, 'in')
+        odir = fp.join(tmpdir, 'out')
+        os.makedirs(idir)
+        os.makedirs(odir)
+        for subpath in job.subpaths:
+            _copy_or_link(fp.join(job.idir, subpath),
+                          fp.join(idir, subpath))
+        run_dir(command, idir, odir,
+                log=fp.join(tmpdir, 'nimrodel.log'),
+                timeout=timeout)
+        for subpath in walk_sorted(odir):
+            dst = fp.join(job.odir, subpath)
+            _mkdirs(fp.dirname(dst))
+            shutil.move(fp.join(odir, subpath), dst)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class Scheduler(object):
+    """
+    Run nimrodel jobs in a pool of worker threads (each of which
+    runs one nimrodel process at a time), biggest jobs first.
+    Failed jobs are split in half and put back in the queue
+
+    :param command: how to run nimrodel (eg. `['bash', 'bin/nimrodel']`)
+    :param workers: how many nimrodel processes to run at a time
+    :param timeout: seconds after which to give up on a job (None for
+                    no limit)
+    """
+    def __init__(self, command, workers=1, timeout=None, verbose=False):
+        self.command = command
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self.verbose = verbose
+        self._heap = []
+        self._counter = 0
+        self._pending = 0
+        self._cond = threading.Condition()
+        self.failures = {}
+
+    def _push(self, job):
+        "queue a job (call with the lock held)"
+        heapq.heappush(self._heap, (-job.size, self._counter, job))
+        self._counter += 1
+        self._pending += 1
+
+    def _say(self, msg):
+        "progress report"
+        if self.verbose:
+            print(msg, file=sys.stderr)
+
+    def _worker(self):
+        "run jobs until there are none left"
+        while True:
+            with self._cond:
+                while not self._heap and self._pending:
+                    self._cond.wait(1)
+                if not self._heap:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            try:
+                self._attempt(job)
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def _attempt(self, job):
+        "run a job, splitting it or recording failures if it fails"
+        start = time.time()
+        splittable = True
+        try:
+            run_job(self.command, job, timeout=self.timeout)
+            error = None
+        except BatchError as oops:
+            error = str(oops)
+        except Exception as oops:  # pylint: disable=broad-except
+            # eg. the nimrodel command does not exist; this is not
+            # about the inputs, so splitting the job would not help
+            error = '{}: {}'.format(type(oops).__name__, oops)
+            splittable = False
+        with self._cond:
+            if error is None:
+                self._say('{}: {} files in {:.1f}s'.format(
+                    job.name, len(job.subpaths), time.time() - start))
+            elif splittable and len(job.subpaths) > 1:
+                self._say('{}: {} (splitting it)'.format(job.name, error))
+                for half in job.halves():
+                    self._push(half)
+            else:
+                self._say('{}: {}'.format(job.name, error))
+                for subpath in job.subpaths:
+                    self.failures[fp.join(job.idir, subpath)] = error
+
+    def run(self, jobs):
+        """
+        Run all the jobs, returning a dictionary from input files
+        that we gave up on to the reason why ::
+
+            [Job] -> IO (Dict FilePath String)
+        """
+        with self._cond:
+            for job in jobs:
+                if job.subpaths:
+                    self._push(job)
+        threads = [threading.Thread(target=self._worker)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # joining with a timeout lets Python 2 notice Ctrl-C
+            while thread.is_alive():
+                thread.join(1)
+        return self.failures
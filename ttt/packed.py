@@ -0,0 +1,167 @@
+"""
+Packed representation of a directory of json records
+
+Nimrodel output dirs consist of lots and lots of tiny json files,
+which are slow to walk and open one by one (especially over network
+filesystems).  A packed dir instead holds
+
+* a handful of shards (`records-NNNNN.jsonl`), each line of which is
+  a json `[path, record]` pair for one of the original files
+* a binary index (`index.bin`) from the original relative paths to
+  their shard and byte range within it, so that a single file's
+  records can be fetched without reading anything else
+
+Entries are stored in `ttt.cli.path_sort_key` order.  Paths in the
+index are utf-8 byte strings (like tar member names), and you can look
+them up either as such or as unicode.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from os import path as fp
+import json
+import os
+import struct
+
+INDEX_NAME = 'index.bin'
+_SHARD_TEMPLATE = 'records-{:05}.jsonl'
+_MAGIC = b'TTTPACK1'
+_HEADER = struct.Struct('<8sI')  # magic, number of entries
+_ENTRY = struct.Struct('<HQIH')  # shard, offset, length, path length
+
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+
+def is_packed(dirname):
+    """
+    True if the directory looks like a packed record dir
+    """
+    return fp.isfile(fp.join(dirname, INDEX_NAME))
+
+
+def _as_bytes(subpath):
+    "a path as a (utf-8) byte string, as we keep it in the index"
+    return subpath.encode('utf-8') if isinstance(subpath, unicode)\
+        else subpath
+
+
+def _shard_name(dirname, shard):
+    "path to the shard file with the given number"
+    return fp.join(dirname, _SHARD_TEMPLATE.format(shard))
+
+
+def pack_records(records, odir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Write a stream of records (eg. from `ttt.cli.iter_records`) as a
+    packed record dir, starting a new shard whenever the current one
+    grows past `shard_size` bytes. Return the number of entries ::
+
+        (Iterator (FilePath, [Record]), FilePath, Int) -> IO Int
+    """
+    if not fp.exists(odir):
+        os.makedirs(odir)
+    entries = []
+    shard = 0
+    offset = 0
+    sfile = open(_shard_name(odir, shard), 'wb')
+    try:
+        for subpath, subrecs in records:
+            if offset >= shard_size:
+                sfile.close()
+                shard += 1
+                offset = 0
+                sfile = open(_shard_name(odir, shard), 'wb')
+            line = json.dumps([subpath, subrecs]) + '\n'
+            sfile.write(line)
+            entries.append((subpath, shard, offset, len(line)))
+            offset += len(line)
+    finally:
+        sfile.close()
+
+    with open(fp.join(odir, INDEX_NAME), 'wb') as ifile:
+        ifile.write(_HEADER.pack(_MAGIC, len(entries)))
+        for subpath, shard, offset, length in entries:
+            bpath = _as_bytes(subpath)
+            ifile.write(_ENTRY.pack(shard, offset, length, len(bpath)))
+            ifile.write(bpath)
+    return len(entries)
+
+
+class PackedRecords(object):
+    """
+    Read-only access to a packed record dir.
+
+    Loads the index when created; records are only read on demand
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self._paths = []
+        self._locations = []
+        with open(fp.join(dirname, INDEX_NAME), 'rb') as ifile:
+            magic, num_entries = _HEADER.unpack(ifile.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise IOError('{} does not look like a packed record '
+                              'index'.format(fp.join(dirname, INDEX_NAME)))
+            for _ in range(num_entries):
+                shard, offset, length, path_len =\
+                    _ENTRY.unpack(ifile.read(_ENTRY.size))
+                self._paths.append(ifile.read(path_len))
+                self._locations.append((shard, offset, length))
+        self._index = {p: i for i, p in enumerate(self._paths)}
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, subpath):
+        return _as_bytes(subpath) in self._index
+
+    def paths(self):
+        """
+        Relative paths of all the files packed in here (in order)
+        """
+        return list(self._paths)
+
+    def get(self, subpath):
+        """
+        The records for a single file (without reading the others;
+        KeyError if there is no such file) ::
+
+            FilePath -> IO [Record]
+        """
+        index = self._index[_as_bytes(subpath)]
+        shard, offset, length = self._locations[index]
+        with open(_shard_name(self.dirname, shard), 'rb') as sfile:
+            sfile.seek(offset)
+            _, subrecs = json.loads(sfile.read(length))
+        return subrecs
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, want=None):
+        """
+        All (path, record) pairs, reading each shard sequentially.
+        If you supply a `want` predicate on paths, we only read and
+        decode the records for the paths it accepts ::
+
+            Maybe (FilePath -> Bool) -> Iterator (FilePath, [Record])
+        """
+        current = None
+        sfile = None
+        try:
+            for subpath, (shard, offset, length) in\
+                    zip(self._paths, self._locations):
+                if want is not None and not want(subpath):
+                    continue
+                if shard != current:
+                    if sfile is not None:
+                        sfile.close()
+                    sfile = open(_shard_name(self.dirname, shard), 'rb')
+                    current = shard
+                sfile.seek(offset)
+                _, subrecs = json.loads(sfile.read(length))
+                yield subpath, subrecs
+        finally:
+            if sfile is not None:
+                sfile.close()
@@ -0,0 +1,296 @@
+"""
+Staged workers for `ttt.cli.generic_main`
+
+A converter normally does everything for a file in one go: read it,
+parse it, and write out lots of little snippets.  If instead it
+provides these steps separately as `Stages`, we can run them as a
+pipeline, with reader, parser and writer threads connected by bounded
+queues: the next file gets parsed while the snippets for the previous
+one are being written.  Parsing can also be farmed out to a process
+pool.
+
+We keep track of how full each queue gets and how long each stage
+spends waiting for work (starved) or for room to put its results
+(stalled), which tells you where the bottleneck is.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from multiprocessing import Pool
+from os import path as fp
+import codecs
+import os
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+DEFAULT_DEPTH = 4
+
+
+class Stages(namedtuple('Stages', 'read parse write')):
+    """
+    A `generic_main` worker broken into stages ::
+
+        read  :: (FilePath, FilePath) -> IO a
+                 -- input dir, subpath
+        parse :: (FilePath, a) -> [(FilePath, Text)]
+                 -- subpath, output of read -> snippets
+        write :: (FilePath, [(FilePath, Text)]) -> IO ()
+                 -- output dir, snippets
+
+    Snippets are pairs of output paths (relative to the output dir)
+    and text. The parse stage should not do any IO, and its inputs
+    and outputs should be picklable.
+
+    You can also use this as an ordinary worker function
+    """
+
+    def __call__(self, idir, odir, subpath):
+        self.write(odir, self.parse(subpath, self.read(idir, subpath)))
+
+
+def write_snippets(odir, snippets):
+    """
+    Write snippets out as UTF-8 text files (the usual write stage)
+    """
+    for subpath, text in snippets:
+        filename = fp.join(odir, subpath)
+        dirname = fp.dirname(filename)
+        if not fp.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not fp.isdir(dirname):
+                    raise
+        with codecs.open(filename, 'w', 'utf-8') as stream:
+            stream.write(text)
+
+
+# ---------------------------------------------------------------------
+# instrumented queues
+# ---------------------------------------------------------------------
+
+
+class StageStats(object):
+    """
+    What a stage spent its time doing
+
+    :param busy: seconds spent doing actual work
+    :param starved: seconds spent waiting for input
+    :param stalled: seconds spent waiting for room in the output queue
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.stalled = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **kwargs):
+        "add to the counters (thread-safe)"
+        with self._lock:
+            for key, val in kwargs.items():
+                setattr(self, key, getattr(self, key) + val)
+
+
+class BoundedQueue(object):
+    """
+    A bounded queue which keeps track of its depth, and of the time
+    spent blocking on it
+    """
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self._queue = Queue.Queue(maxsize=depth)
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        self._depth_total = 0
+        self._samples = 0
+
+    def put(self, item, stats):
+        "put an item in the queue (recording time stalled)"
+        start = time.time()
+        self._queue.put(item)
+        stats.add(stalled=time.time() - start)
+        with self._lock:
+            size = self._queue.qsize()
+            self.max_depth = max(self.max_depth, size)
+            self._depth_total += size
+            self._samples += 1
+
+    def get(self, stats):
+        "get an item from the queue (recording time starved)"
+        start = time.time()
+        item = self._queue.get()
+        stats.add(starved=time.time() - start)
+        return item
+
+    def mean_depth(self):
+        "average queue depth just after we put something in it"
+        return float(self._depth_total) / self._samples\
+            if self._samples else 0.0
+
+
+# ---------------------------------------------------------------------
+# running the pipeline
+# ---------------------------------------------------------------------
+
+_DONE = None
+
+# parse function for the process pool (see `ttt.cli._init_worker`)
+_PARSE = None
+
+
+def _init_parser(parse):
+    "process pool initializer: remember the parse function"
+    global _PARSE  # pylint: disable=global-statement
+    _PARSE = parse
+
+
+def _run_parse(job):
+    "run the current parse function in a pool process"
+    subpath, raw = job
+    return _PARSE(subpath, raw)
+
+
+class Pipeline(object):
+    """
+    Reader, parser and writer threads connected by bounded queues
+
+    :param stages: what to do
+    :param jobs: number of parser threads (and if more than one, the
+                 number of processes that they hand the parsing to)
+    :param depth: maximum number of items in each queue
+    """
+    def __init__(self, stages, jobs=1, depth=DEFAULT_DEPTH):
+        self.stages = stages
+        self.jobs = max(jobs, 1)
+        self.read_q = BoundedQueue('read->parse', depth)
+        self.write_q = BoundedQueue('parse->write', depth)
+        self.stats = [StageStats('read'),
+                      StageStats('parse'),
+                      StageStats('write')]
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def _fail(self, subpath):
+        "record the current exception for an input"
+        with self._lock:
+            self.failures[subpath] = traceback.format_exc()
+
+    def _reader(self, idir, subpaths):
+        "read stage"
+        stats = self.stats[0]
+        for subpath in subpaths:
+            start = time.time()
+            try:
+                raw = self.stages.read(idir, subpath)
+            except Exception:  # pylint: disable=broad-except
+                self._fail(subpath)
+                continue
+            finally:
+                stats.add(items=1, busy=time.time() - start)
+            self.read_q.put((subpath, raw), stats)
+        for _ in range(self.jobs):
+            self.read_q.put(_DONE, stats)
+
+    def _parser(self, pool):
+        "parse stage"
+        stats = self.stats[1]
+        while True:
+            item = self.read_q.get(stats)
+            if item is _DONE:
+                break
+            subpath, raw = item
+            start = time.time()
+            try:
+                if pool is None:
+                    snippets = self.stages.parse(subpath, raw)
+                else:
+                    snippets = pool.apply(_run_parse, [(subpath, raw)])
+            except Exception:  # pylint: disable=broad-except
+                self._fail(subpath)
+                continue
+            finally:
+                stats.add(items=1, busy=time.time() - start)
+            self.write_q.put((subpath, snippets), stats)
+        self.write_q.put(_DONE, stats)
+
+    def _writer(self, odir):
+        "write stage"
+        stats = self.stats[2]
+        remaining = self.jobs
+        while remaining:
+            item = self.write_q.get(stats)
+            if item is _DONE:
+                remaining -= 1
+                continue
+            subpath, snippets = item
+            start = time.time()
+            try:
+                self.stages.write(odir, snippets)
+            except Exception:  # pylint: disable=broad-except
+                self._fail(subpath)
+            finally:
+                stats.add(items=1, busy=time.time() - start)
+
+    def run(self, idir, odir, subpaths):
+        """
+        Run the stages on all the inputs, returning a dictionary from
+        the subpaths that failed to their formatted tracebacks ::
+
+            (FilePath, FilePath, [FilePath]) -> IO (Dict FilePath String)
+        """
+        pool = None
+        if self.jobs > 1:
+            pool = Pool(processes=self.jobs,
+                        initializer=_init_parser,
+                        initargs=(self.stages.parse,))
+        threads = [threading.Thread(target=self._reader,
+                                    args=(idir, subpaths)),
+                   threading.Thread(target=self._writer, args=(odir,))]
+        threads.extend(threading.Thread(target=self._parser, args=(pool,))
+                       for _ in range(self.jobs))
+        try:
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                # joining with a timeout lets Python 2 notice Ctrl-C
+                while thread.is_alive():
+                    thread.join(1)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return self.failures
+
+    def report(self, stream=sys.stderr):
+        """
+        Print per-stage and per-queue statistics
+        """
+        print("{:<8} {:>7} {:>9} {:>9} {:>9}".format('stage', 'items',
+                                                     'busy', 'starved',
+                                                     'stalled'),
+              file=stream)
+        for stats in self.stats:
+            print("{:<8} {:>7} {:>8.2f}s {:>8.2f}s {:>8.2f}s"
+                  .format(stats.name, stats.items, stats.busy,
+                          stats.starved, stats.stalled),
+                  file=stream)
+        for queue in [self.read_q, self.write_q]:
+            print("queue {}: max depth {}/{}, mean depth {:.2f}"
+                  .format(queue.name, queue.max_depth, queue.depth,
+                          queue.mean_depth()),
+                  file=stream)
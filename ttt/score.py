@@ -5,9 +5,12 @@ Scoring against human judgements
 from __future__ import print_function
 from collections import namedtuple
 from itertools import chain
+from os import path as fp
 
 import nltk.metrics
 
+from .cli import path_sort_key
+
 # author: Eric Kow
 # license: Public domain
 
@@ -141,3 +144,172 @@ def score_records(reference, test):
     tst_pairs = aggregate(tst_cmp)
     aggregate_scores = score_scrutis(ref_pairs, tst_pairs)
     return aggregate_scores, individual_scores
+
+
+# ---------------------------------------------------------------------
+# streaming
+# ---------------------------------------------------------------------
+
+
+class _Tally(object):
+    """
+    Running sizes of the reference, test, and common sets for
+    texts and attributes (enough to compute aggregate scores
+    without holding onto the sets themselves)
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.texts = [0, 0, 0]
+        self.attrs = [0, 0, 0]
+
+    def add(self, ref, tst):
+        "add the sets for one file"
+        for field in Scrutis._fields:
+            sizes = getattr(self, field)
+            s_ref = getattr(ref, field)
+            s_tst = getattr(tst, field)
+            sizes[0] += len(s_ref)
+            sizes[1] += len(s_tst)
+            sizes[2] += len(s_ref & s_tst)
+
+    def scores(self):
+        """
+        Same as `score_scrutis` over the aggregated sets ::
+
+            _Tally -> Scores
+        """
+        def ratio(common, total):
+            "nltk style precision/recall"
+            return None if total == 0 else float(common) / total
+
+        def f_measure(prec, rec, alpha=0.5):
+            "nltk style f_measure"
+            if prec is None or rec is None:
+                return None
+            elif prec == 0 or rec == 0:
+                return 0
+            return 1.0 / (alpha / prec + (1 - alpha) / rec)
+
+        t_ref, t_tst, t_common = self.texts
+        a_ref, _, a_common = self.attrs
+        t_prec = ratio(t_common, t_tst)
+        t_rec = ratio(t_common, t_ref)
+        return {_KEY_T_PREC: t_prec,
+                _KEY_T_REC: t_rec,
+                _KEY_T_F: f_measure(t_prec, t_rec),
+                _KEY_A_REC: ratio(a_common, a_ref)}
+
+
+class RunningScores(object):
+    """
+    Aggregate scores for test records that come in one file at a
+    time, in any order, against reference records that we hold in
+    memory (keyed on basename, like `ttt.cli.read_records`).
+
+    Until you ask for the final scores, reference files that we have
+    not yet seen test records for are left out of the count
+    """
+    def __init__(self, reference):
+        self._reference = extract_scrutis(reference)
+        self._tally = _Tally()
+        self._seen = set()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, path, records):
+        """
+        Score the test records for one file
+        """
+        key = fp.basename(path)
+        self._seen.add(key)
+        self._tally.add(self._reference.get(key, Scrutis.empty()),
+                        extract_scrutis({key: records})[key])
+
+    def scores(self, final=False):
+        """
+        Scores so far, or with `final`, counting everything that we
+        have not seen test records for as missed ::
+
+            Bool -> Scores
+        """
+        if not final:
+            return self._tally.scores()
+        tally = _Tally()
+        tally.texts = list(self._tally.texts)
+        tally.attrs = list(self._tally.attrs)
+        for key, ref in self._reference.items():
+            if key not in self._seen:
+                tally.add(ref, Scrutis.empty())
+        return tally.scores()
+
+
+def _merge_sorted(reference, test):
+    """
+    Pair up the entries of two streams of records that are sorted
+    on their path (with `path_sort_key`) ::
+
+        (Iterator (FilePath, a), Iterator (FilePath, a))
+        -> Iterator (FilePath, Maybe a, Maybe a)
+    """
+    done = object()
+    ref_iter = iter(reference)
+    tst_iter = iter(test)
+    ref = next(ref_iter, done)
+    tst = next(tst_iter, done)
+    while ref is not done or tst is not done:
+        if tst is done or\
+                (ref is not done and
+                 path_sort_key(ref[0]) < path_sort_key(tst[0])):
+            yield ref[0], ref[1], None
+            ref = next(ref_iter, done)
+        elif ref is done or path_sort_key(tst[0]) < path_sort_key(ref[0]):
+            yield tst[0], None, tst[1]
+            tst = next(tst_iter, done)
+        else:
+            yield ref[0], ref[1], tst[1]
+            ref = next(ref_iter, done)
+            tst = next(tst_iter, done)
+
+
+def iter_scores(reference, test):
+    """
+    Streaming version of `score_records`: given two streams of
+    records (eg. from `ttt.cli.iter_records`), both sorted on their
+    paths, yield the scores for each path as we go along.
+
+    Once the stream is exhausted, you can ask the returned tally
+    for the aggregate scores with its `scores` method ::
+
+        (Iterator (FilePath, [Record]), Iterator (FilePath, [Record]))
+        -> (_Tally, Iterator (FilePath, Scores))
+    """
+    tally = _Tally()
+    empty = Scrutis.empty()
+
+    def scrutis(path, recs):
+        "evaluable items for a single file"
+        return empty if recs is None else extract_scrutis({path: recs})[path]
+
+    def inner():
+        "scores per path"
+        for path, ref_recs, tst_recs in _merge_sorted(reference, test):
+            ref_mini = scrutis(path, ref_recs)
+            tst_mini = scrutis(path, tst_recs)
+            tally.add(ref_mini, tst_mini)
+            yield path, score_scrutis(ref_mini, tst_mini)
+
+    return tally, inner()
+
+
+def score_streams(reference, test):
+    """
+    Like `score_records` but on streams of records (sorted on their
+    paths), keeping only one file's worth of records in memory ::
+
+        (Iterator (FilePath, [Record]), Iterator (FilePath, [Record]))
+        -> (Scores, Dict FilePath Scores)
+    """
+    tally, scores = iter_scores(reference, test)
+    individual_scores = dict(scores)
+    return tally.scores(), individual_scores
@@ -0,0 +1,248 @@
+"""
+Content-addressed snapshots of directories (eg. blessed nimrodel
+results)
+
+Each file is stored once, under the hash of its contents, and a
+snapshot is just a manifest saying which file goes where.  Saving a
+snapshot of a directory only copies the files whose contents the
+store has not seen before; files that have not changed since an
+earlier snapshot of the same directory (same size and modification
+time) are not even read.  Old snapshots are cheap to keep around,
+and `SnapshotStore.gc` gets rid of files that no snapshot uses.
+
+A snapshot can be checked out as a tree of hard links to the stored
+files (which are read-only, so as not to be modified through them),
+or as copies if hard links are not possible.  Checking out over an
+earlier checkout only touches the files that differ.
+
+Store layout ::
+
+    objects/KE/KEY   -- file contents (KEY is their sha1)
+    snapshots/NAME   -- json manifest: {subpath: [key, size, mtime]}
+
+Snapshot names may contain slashes (eg. DATASET/YYYY-MM-DD-HHMMSS)
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import errno
+import json
+import os
+import shutil
+import stat
+import uuid
+
+from .cli import walk_sorted
+from .manifest import file_sha1
+
+_OBJECTS = 'objects'
+_SNAPSHOTS = 'snapshots'
+
+
+class SnapshotError(Exception):
+    """
+    No such snapshot, or some other problem with the store
+    """
+    pass
+
+
+class Entry(namedtuple('Entry', 'key size mtime')):
+    """
+    A file in a snapshot ::
+
+        key   :: String  -- sha1 of its contents
+        size  :: Int     -- of the original file
+        mtime :: Float   -- of the original file
+    """
+    pass
+
+
+class SaveStats(namedtuple('SaveStats', 'files hashed stored')):
+    """
+    What happened when we saved a snapshot ::
+
+        files  :: Int  -- files in the snapshot
+        hashed :: Int  -- files we had to read (new or changed)
+        stored :: Int  -- files whose contents were new to the store
+    """
+    pass
+
+
+def _mkdirs(dirname):
+    "create a directory if it does not already exist (race-safe)"
+    try:
+        os.makedirs(dirname)
+    except OSError as oops:
+        if oops.errno != errno.EEXIST:
+            raise
+
+
+class SnapshotStore(object):
+    """
+    A directory of snapshots (created as needed)
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def object_path(self, key):
+        """
+        Where the contents for a key live
+        """
+        return fp.join(self.dirname, _OBJECTS, key[:2], key)
+
+    def _manifest_path(self, name):
+        "where the manifest for a snapshot lives"
+        if not name or name.startswith('/') or '..' in name.split('/'):
+            raise SnapshotError('bad snapshot name: {}'.format(name))
+        return fp.join(self.dirname, _SNAPSHOTS, *name.split('/'))
+
+    def snapshots(self, prefix=''):
+        """
+        Names of the snapshots in the store (in order), optionally
+        just those that start with a prefix ::
+
+            String -> IO [String]
+        """
+        sdir = fp.join(self.dirname, _SNAPSHOTS)
+        if not fp.exists(sdir):
+            return []
+        names = [subpath.replace(os.sep, '/') for subpath in walk_sorted(sdir)]
+        return sorted(n for n in names if n.startswith(prefix))
+
+    def latest(self, prefix=''):
+        """
+        The last snapshot (in name order) that starts with a prefix
+        (None if there is none) ::
+
+            String -> IO (Maybe String)
+        """
+        names = self.snapshots(prefix)
+        return names[-1] if names else None
+
+    def manifest(self, name):
+        """
+        The files in a snapshot ::
+
+            String -> IO (Dict FilePath Entry)
+        """
+        mfile = self._manifest_path(name)
+        if not fp.exists(mfile):
+            raise SnapshotError('no such snapshot: {}'.format(name))
+        with open(mfile) as stream:
+            return {k: Entry(*v) for k, v in json.load(stream).items()}
+
+    def _store(self, filename, key):
+        "copy a file into the store (if we do not already have it)"
+        opath = self.object_path(key)
+        if fp.exists(opath):
+            return False
+        _mkdirs(fp.dirname(opath))
+        tmp_path = '{}.{}.tmp'.format(opath, uuid.uuid4().hex)
+        shutil.copyfile(filename, tmp_path)
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(tmp_path, opath)
+        return True
+
+    def save(self, name, src, previous=None):
+        """
+        Save a snapshot of a directory. Files that have the same size
+        and modification time as in the previous snapshot (if any) are
+        assumed not to have changed ::
+
+            (String, FilePath, Maybe String) -> IO SaveStats
+        """
+        mfile = self._manifest_path(name)
+        if fp.exists(mfile):
+            raise SnapshotError('snapshot already exists: {}'.format(name))
+        old = {} if previous is None else self.manifest(previous)
+        entries = {}
+        hashed = 0
+        stored = 0
+        for subpath in walk_sorted(src):
+            filename = fp.join(src, subpath)
+            info = os.stat(filename)
+            key = subpath.replace(os.sep, '/')
+            entry = old.get(key)
+            if entry is None or entry.size != info.st_size or\
+                    entry.mtime != info.st_mtime or\
+                    not fp.exists(self.object_path(entry.key)):
+                digest = file_sha1(filename)
+                hashed += 1
+                if self._store(filename, digest):
+                    stored += 1
+                entry = Entry(digest, info.st_size, info.st_mtime)
+            entries[key] = entry
+        _mkdirs(fp.dirname(mfile))
+        tmp_file = '{}.{}.tmp'.format(mfile, uuid.uuid4().hex)
+        with open(tmp_file, 'w') as stream:
+            json.dump({k: list(v) for k, v in entries.items()}, stream,
+                      indent=0, sort_keys=True)
+        os.rename(tmp_file, mfile)
+        return SaveStats(files=len(entries), hashed=hashed, stored=stored)
+
+    def checkout(self, name, dst, link=True):
+        """
+        Make a directory look like a snapshot: hard links to the
+        stored files (or copies, if `link` is False or linking fails),
+        leaving alone any that are already links to the right file.
+        Return the number of files that we had to link or copy ::
+
+            (String, FilePath, Bool) -> IO Int
+        """
+        entries = self.manifest(name)
+        if fp.exists(dst):
+            for subpath in walk_sorted(dst):
+                if subpath.replace(os.sep, '/') not in entries:
+                    os.remove(fp.join(dst, subpath))
+        changed = 0
+        for key, entry in sorted(entries.items()):
+            opath = self.object_path(entry.key)
+            target = fp.join(dst, *key.split('/'))
+            if fp.exists(target):
+                if link and fp.samefile(opath, target):
+                    continue
+                if not link and file_sha1(target) == entry.key:
+                    continue
+                os.remove(target)
+            _mkdirs(fp.dirname(target))
+            try:
+                if not link:
+                    raise OSError('not linking')
+                os.link(opath, target)
+            except OSError:
+                shutil.copyfile(opath, target)
+            changed += 1
+        return changed
+
+    def drop(self, name):
+        """
+        Forget a snapshot (its files stay in the store until `gc`)
+        """
+        mfile = self._manifest_path(name)
+        if not fp.exists(mfile):
+            raise SnapshotError('no such snapshot: {}'.format(name))
+        os.remove(mfile)
+
+    def gc(self):
+        """
+        Delete stored files that no snapshot refers to, returning how
+        many there were ::
+
+            () -> IO Int
+        """
+        live = set()
+        for name in self.snapshots():
+            live.update(e.key for e in self.manifest(name).values())
+        odir = fp.join(self.dirname, _OBJECTS)
+        if not fp.exists(odir):
+            return 0
+        removed = 0
+        for subpath in walk_sorted(odir):
+            if fp.basename(subpath) not in live:
+                os.remove(fp.join(odir, subpath))
+                removed += 1
+        return removed
@@ -0,0 +1,242 @@
+"""
+Streaming convert -> nimrodel -> score runs
+
+Rather than converting everything, then running nimrodel on
+everything, then scoring everything, we can do all three at once:
+
+* a converter thread runs a converter's `ttt.pipeline.Stages` over
+  its inputs, writing the snippets out as it goes, and handing them
+  over in jobs of a few files at a time
+* a pool of worker threads each runs one nimrodel process at a time
+  on these jobs (as for `ttt.nimrodel.Scheduler`, jobs that fail are
+  split in half and tried again)
+* whenever a job is done, its results are scored against the
+  reference (see `ttt.score.RunningScores`), so that running scores
+  are available long before the end
+
+The jobs queue is bounded, so conversion does not race too far
+ahead of nimrodel.  The whole run should take about as long as its
+slowest part.
+"""
+
+# author: Eric Kow
+# license: Public domain
+
+from __future__ import print_function
+from os import path as fp
+import imp
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+from .batch import BatchError
+from .cli import iter_inputs, read_record
+from .nimrodel import DEFAULT_JOB_FILES, Job, run_job
+from .score import RunningScores
+
+_DONE = None
+
+
+class StreamingRun(object):
+    """
+    A streaming run of a converter and nimrodel, with scoring
+
+    :param stages: converter stages (see `ttt.pipeline`)
+    :param command: how to run nimrodel
+    :param text_dir: where to write the converter output
+    :param json_dir: where to write the nimrodel output
+    :param reference: reference records for scoring (keyed on basename,
+                      as from `ttt.cli.read_records`), or None
+    :param workers: how many nimrodel processes to run at a time
+    :param job_files: how many snippets to give nimrodel at a time
+    :param timeout: seconds after which to give up on (and split) a job
+    """
+    def __init__(self, stages, command, text_dir, json_dir,
+                 reference=None, workers=1, job_files=DEFAULT_JOB_FILES,
+                 timeout=None):
+        self.stages = stages
+        self.command = command
+        self.text_dir = text_dir
+        self.json_dir = json_dir
+        self.workers = max(workers, 1)
+        self.job_files = job_files
+        self.timeout = timeout
+        self.scores = None if reference is None\
+            else RunningScores(reference)
+        # inputs (for the converter) and snippets (for nimrodel)
+        # that we could not process
+        self.convert_failures = {}
+        self.failures = {}
+        self.converted = 0
+        self.processed = 0
+        self._jobs = Queue.Queue(maxsize=self.workers * 2)
+        self._lock = threading.Lock()
+
+    def _convert(self, inputs, glob):
+        "converter thread: convert inputs and hand out jobs"
+        try:
+            self._convert_inputs(inputs, glob)
+        finally:
+            for _ in range(self.workers):
+                self._jobs.put(_DONE)
+
+    def _convert_inputs(self, inputs, glob):
+        "convert inputs, putting jobs in the queue as they fill up"
+        pending = []
+        num_jobs = 0
+        for idir, subpaths in iter_inputs(inputs, glob):
+            for subpath in subpaths:
+                try:
+                    raw = self.stages.read(idir, subpath)
+                    snippets = self.stages.parse(subpath, raw)
+                    self.stages.write(self.text_dir, snippets)
+                except Exception:  # pylint: disable=broad-except
+                    self.convert_failures[subpath] = traceback.format_exc()
+                    continue
+                with self._lock:
+                    self.converted += len(snippets)
+                pending.extend(s for s, _ in snippets)
+                while len(pending) >= self.job_files:
+                    self._jobs.put(self._job(num_jobs,
+                                             pending[:self.job_files]))
+                    pending = pending[self.job_files:]
+                    num_jobs += 1
+        if pending:
+            self._jobs.put(self._job(num_jobs, pending))
+
+    def _job(self, num, subpaths):
+        "nimrodel job for some snippets"
+        return Job(name='#{}'.format(num), idir=self.text_dir,
+                   odir=self.json_dir, subpaths=subpaths, size=0)
+
+    def _run(self, job):
+        "run a job, splitting it on failure"
+        try:
+            run_job(self.command, job, timeout=self.timeout)
+        except BatchError as oops:
+            if len(job.subpaths) == 1:
+                self._fail(job.subpaths, str(oops))
+                return
+            for half in job.halves():
+                self._run(half)
+            return
+        except Exception as oops:  # pylint: disable=broad-except
+            # eg. the nimrodel command does not exist; this is not
+            # about the inputs, so splitting the job would not help
+            self._fail(job.subpaths, '{}: {}'.format(type(oops).__name__,
+                                                     oops))
+            return
+        for subpath in job.subpaths:
+            try:
+                records = read_record(self.json_dir, subpath)
+            except IOError:
+                # nimrodel exited happily but said nothing about it
+                self._fail([subpath], 'nimrodel produced no output for '
+                           '{}'.format(subpath))
+                continue
+            except ValueError as oops:
+                self._fail([subpath], 'could not read nimrodel output '
+                           'for {}: {}'.format(subpath, oops))
+                continue
+            with self._lock:
+                self.processed += 1
+                if self.scores is not None:
+                    self.scores.add(subpath, records)
+
+    def _fail(self, subpaths, error):
+        "record snippets that we could not process"
+        with self._lock:
+            for subpath in subpaths:
+                self.failures[subpath] = error
+
+    def _worker(self):
+        "worker thread: run nimrodel on jobs until there are none left"
+        while True:
+            job = self._jobs.get()
+            if job is _DONE:
+                return
+            # whatever happens, keep taking jobs, or the converter
+            # thread could block forever on a full queue
+            try:
+                self._run(job)
+            except Exception:  # pylint: disable=broad-except
+                self._fail(job.subpaths, traceback.format_exc())
+
+    def progress(self):
+        """
+        Snippets converted and processed so far, and the running
+        scores (None if we are not scoring) ::
+
+            () -> (Int, Int, Maybe Scores)
+        """
+        with self._lock:
+            scores = None if self.scores is None else self.scores.scores()
+            return self.converted, self.processed, scores
+
+    def run(self, inputs, glob, on_progress=None, interval=60):
+        """
+        Convert the inputs (files matching the glob) and run nimrodel
+        on them, calling `on_progress` with the output of `progress`
+        every `interval` seconds. Return the final scores (if we are
+        scoring) ::
+
+            (FilePath, String, Maybe (Progress -> IO ()), Float)
+            -> IO (Maybe Scores)
+        """
+        threads = [threading.Thread(target=self._convert,
+                                    args=(inputs, glob))]
+        threads.extend(threading.Thread(target=self._worker)
+                       for _ in range(self.workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        last = time.time()
+        for thread in threads:
+            # joining with a timeout lets Python 2 notice Ctrl-C
+            while thread.is_alive():
+                thread.join(1)
+                if on_progress is not None and\
+                        time.time() - last >= interval:
+                    on_progress(self.progress())
+                    last = time.time()
+        if self.scores is None:
+            return None
+        return self.scores.scores(final=True)
+
+
+def print_progress(progress, stream=sys.stderr):
+    """
+    Report on the progress of a streaming run (see
+    `StreamingRun.progress`)
+    """
+    converted, processed, scores = progress
+    msg = '{} snippets converted, {} processed'.format(converted,
+                                                        processed)
+    if scores is not None:
+        msg += ''.join('; {} {}'.format(k, _fmt_score(v))
+                       for k, v in sorted(scores.items()))
+    print(msg, file=stream)
+
+
+def _fmt_score(score):
+    "score as a percentage (if defined)"
+    return '--' if score is None else '{:.1f}%'.format(100. * score)
+
+
+def load_stages(script):
+    """
+    The `STAGES` and `CONFIG` of a converter script (see
+    `ttt.pipeline.Stages` and `ttt.cli.CliConfig`) ::
+
+        FilePath -> IO (Stages, CliConfig)
+    """
+    name = 'ttt_converter_' + fp.splitext(fp.basename(script))[0]\
+        .replace('-', '_')
+    module = imp.load_source(name, script)
+    return module.STAGES, module.CONFIG
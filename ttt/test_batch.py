@@ -0,0 +1,101 @@
+"""
+Test suite for batching snippets up for nimrodel
+"""
+
+from os import path as fp
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from ttt.batch import (BatchError, load_batches, pack_snippets,
+                       run_bisecting, save_batch)
+from ttt.nimrodel import batch_runner
+
+# stand-in for nimrodel: every capitalised word is a name, and it
+# falls over on anything mentioning a CRASH (or gets stuck on
+# anything that is SLOW)
+FAKE_NIMRODEL = textwrap.dedent("""
+    import json, os, re, sys, time
+    _, idir, odir = sys.argv[1:]
+    for root, _, names in os.walk(idir):
+      for name in names:
+        path = os.path.relpath(os.path.join(root, name), idir)
+        with open(os.path.join(idir, path)) as stream:
+            text = stream.read()
+        if 'CRASH' in text:
+            sys.exit(1)
+        if 'SLOW' in text:
+            time.sleep(60)
+        records = [{'origOccurrence': m}
+                   for m in re.findall(r'\\b[A-Z][a-z]+', text)]
+        if not os.path.exists(os.path.dirname(os.path.join(odir, path))):
+            os.makedirs(os.path.dirname(os.path.join(odir, path)))
+        with open(os.path.join(odir, path), 'w') as stream:
+            json.dump(records, stream)
+    """)
+
+SNIPPETS = [(u'a/1', u'2013-01-02\n\nAlice met Bob\n'),
+            (u'a/2', u'  nobody here '),
+            (u'b/1', u'Bob again, CRASH'),
+            (u'b/2', u'Carol')]
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class BatchTest(unittest.TestCase):
+    "tests for ttt.batch"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.nimrodel = fp.join(self.tmpdir, 'nimrodel.py')
+        with open(self.nimrodel, 'w') as stream:
+            stream.write(FAKE_NIMRODEL)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pack(self):
+        "snippets are packed into batches within the size limit"
+        batches = list(pack_snippets(SNIPPETS, max_size=30))
+        self.assertEqual([[u'a/1'], [u'a/2', u'b/1'], [u'b/2']],
+                         [b.ids for b in batches])
+        self.assertEqual([(u'a/2', u'nobody here'),
+                          (u'b/1', u'Bob again, CRASH')],
+                         batches[1].snippets())
+        save_batch(batches[1], self.tmpdir)
+        self.assertEqual([batches[1]], list(load_batches(self.tmpdir)))
+
+    def test_unpack(self):
+        "records are given back to the snippets they came from"
+        batch = list(pack_snippets(SNIPPETS))[0]
+        records = [{u'origOccurrence': x}
+                   for x in [u'Alice', u'Bob', u'Bob', u'Carol']]
+        self.assertEqual([(u'a/1', records[:2]),
+                          (u'a/2', []),
+                          (u'b/1', records[2:3]),
+                          (u'b/2', records[3:])],
+                         batch.unpack(records))
+        self.assertRaises(BatchError, batch.unpack,
+                          [{u'origOccurrence': u'Dave'}])
+        self.assertRaises(BatchError, batch.unpack,
+                          [{u'origOccurrence': u'Carol'},
+                           {u'origOccurrence': u'Alice'}])
+
+    def test_bisect(self):
+        "batches that nimrodel crashes on are bisected"
+        batch = list(pack_snippets(SNIPPETS))[0]
+        run = batch_runner([sys.executable, self.nimrodel])
+        results = {}
+        failures = []
+        for piece, pairs, error in run_bisecting(batch, run):
+            if error is None:
+                results.update(pairs)
+            else:
+                failures.extend(piece.ids)
+        self.assertEqual([u'b/1'], failures)
+        self.assertEqual({u'a/1': [{u'origOccurrence': u'Alice'},
+                                   {u'origOccurrence': u'Bob'}],
+                          u'a/2': [],
+                          u'b/2': [{u'origOccurrence': u'Carol'}]},
+                         results)
@@ -0,0 +1,91 @@
+"""
+Test suite for the nimrodel result cache (using a stand-in for it)
+"""
+
+from os import path as fp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ttt.cache import ResultCache, run_cached
+from ttt.nimrodel import Scheduler
+from ttt.test_batch import FAKE_NIMRODEL
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class CacheTest(unittest.TestCase):
+    "tests for ttt.cache"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        nimrodel = fp.join(self.tmpdir, 'nimrodel.py')
+        with open(nimrodel, 'w') as stream:
+            stream.write(FAKE_NIMRODEL)
+        self.scheduler = lambda: Scheduler([sys.executable, nimrodel])
+        self.dirs = []
+        for name, contents in [('ds1', {'a': 'Alice', 'b': 'Bob',
+                                        'c': 'CRASH'}),
+                               ('ds2', {'x/1': 'Alice', 'x/2': 'Carol'})]:
+            idir = fp.join(self.tmpdir, name, 'unannotated')
+            for subpath, text in contents.items():
+                if not fp.exists(fp.dirname(fp.join(idir, subpath))):
+                    os.makedirs(fp.dirname(fp.join(idir, subpath)))
+                with open(fp.join(idir, subpath), 'w') as stream:
+                    stream.write(text)
+            self.dirs.append((idir, fp.join(self.tmpdir, name, 'json')))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def outputs(self):
+        "names found in each output file"
+        results = {}
+        for _, odir in self.dirs:
+            for root, _, names in os.walk(odir):
+                for name in names:
+                    with open(fp.join(root, name)) as stream:
+                        results[fp.relpath(fp.join(root, name),
+                                           self.tmpdir)] =\
+                            [x['origOccurrence'] for x in json.load(stream)]
+        return results
+
+    def run_cached(self, version):
+        "run with a fresh output dir"
+        for _, odir in self.dirs:
+            shutil.rmtree(odir, ignore_errors=True)
+        cache = ResultCache(fp.join(self.tmpdir, 'cache'), version)
+        return run_cached(self.scheduler(), cache, self.dirs, max_files=2)
+
+    def test_run_cached(self):
+        "only new snippets go to nimrodel; the rest come from the cache"
+        expected = {'ds1/json/a': ['Alice'],
+                    'ds1/json/b': ['Bob'],
+                    'ds2/json/x/1': ['Alice'],
+                    'ds2/json/x/2': ['Carol']}
+        failures, stats = self.run_cached('v1')
+        self.assertEqual([fp.join(self.dirs[0][0], 'c')], list(failures))
+        self.assertEqual((0, 4, 1), stats)
+        self.assertEqual(expected, self.outputs())
+
+        failures, stats = self.run_cached('v1')
+        self.assertEqual(1, len(failures))
+        self.assertEqual((4, 1, 0), stats)
+        self.assertEqual(expected, self.outputs())
+
+        _, stats = self.run_cached('v2')
+        self.assertEqual((0, 4, 1), stats)
+
+    def test_no_output(self):
+        "snippets that nimrodel says nothing about are failures"
+        nimrodel = fp.join(self.tmpdir, 'silent.py')
+        with open(nimrodel, 'w') as stream:
+            stream.write('import sys\n')
+        self.scheduler = lambda: Scheduler([sys.executable, nimrodel])
+        failures, stats = self.run_cached('v1')
+        self.assertEqual(5, len(failures))
+        self.assertEqual((0, 4, 1), stats)
+        self.assertTrue(all('no output' in x for x in failures.values()))
+        self.assertEqual({}, self.outputs())
@@ -0,0 +1,410 @@
+"""
+Test suite for command line helpers
+"""
+
+from os import path as fp
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tarfile
+import time
+import tempfile
+import unittest
+
+from ttt.cli import (CliConfig, RecordFilter, Shard, shard_type,
+                     generic_main, run_jobs,
+                     iter_records, read_record, read_records)
+from ttt.archive import open_text, strip_compression
+from ttt.corpus import Corpus
+from ttt.lease import WorkQueue, work_loop
+from ttt.packed import PackedRecords, pack_records
+from ttt.pipeline import Pipeline, Stages, write_snippets
+
+
+def _copy_upper(idir, odir, subpath):
+    "toy worker: uppercase the input file"
+    with open(fp.join(idir, subpath)) as ifile:
+        text = ifile.read()
+    if text.startswith('bad'):
+        raise ValueError('bad input: ' + subpath)
+    with open(fp.join(odir, subpath), 'w') as ofile:
+        ofile.write(text.upper())
+
+
+def _copy_upper_compressed(idir, odir, subpath):
+    "toy worker: uppercase the (possibly compressed) input file"
+    with open_text(fp.join(idir, subpath), 'utf-8') as ifile:
+        text = ifile.read()
+    with open(fp.join(odir, strip_compression(subpath)), 'w') as ofile:
+        ofile.write(text.upper())
+
+
+def _read_upper(idir, subpath):
+    "toy read stage"
+    with open(fp.join(idir, subpath)) as ifile:
+        return ifile.read()
+
+
+def _parse_upper(subpath, text):
+    "toy parse stage: uppercase the text into two snippets"
+    if text.startswith('bad'):
+        raise ValueError('bad input: ' + subpath)
+    return [(subpath, text.upper()),
+            (fp.join('lower', subpath), text.lower())]
+
+
+_STAGES = Stages(read=_read_upper, parse=_parse_upper,
+                 write=write_snippets)
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class CliTest(unittest.TestCase):
+    "tests for ttt.cli"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.idir = fp.join(self.tmpdir, 'input')
+        self.odir = fp.join(self.tmpdir, 'output')
+        self.write_inputs({'a.txt': 'a' * 10,
+                           'b.txt': 'b',
+                           'c.txt': 'c' * 100,
+                           'd.txt': 'bad news',
+                           'e.dat': 'ignored'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_inputs(self, contents):
+        "write some input files"
+        if not fp.exists(self.idir):
+            os.makedirs(self.idir)
+        for name, text in contents.items():
+            with open(fp.join(self.idir, name), 'w') as ofile:
+                ofile.write(text)
+
+    def read_output(self, name):
+        "contents of an output file"
+        with open(fp.join(self.odir, name)) as ifile:
+            return ifile.read()
+
+    def args(self, **kwargs):
+        "command line arguments for generic_main"
+        return argparse.Namespace(input=self.idir,
+                                  output=self.odir,
+                                  jobs=kwargs.get('jobs', 1),
+                                  incremental=kwargs.get('incremental',
+                                                         False),
+                                  state_dir=None,
+                                  shard=kwargs.get('shard'),
+                                  queue=kwargs.get('queue'),
+                                  lease_ttl=60,
+                                  pipeline=kwargs.get('pipeline', False),
+                                  corpus=kwargs.get('corpus', False),
+                                  queue_depth=2)
+
+    def test_run_jobs_serial_vs_parallel(self):
+        "parallel runs collect the same failures as serial ones"
+        os.makedirs(self.odir)
+        subpaths = ['a.txt', 'b.txt', 'c.txt', 'd.txt']
+        serial = run_jobs(_copy_upper, self.idir, self.odir, subpaths)
+        parallel = run_jobs(_copy_upper, self.idir, self.odir, subpaths,
+                            jobs=3)
+        self.assertEqual(['d.txt'], sorted(serial))
+        self.assertEqual(sorted(serial), sorted(parallel))
+        self.assertEqual('C' * 100, self.read_output('c.txt'))
+
+    def test_generic_main_failures(self):
+        "failing files do not stop the others"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        with self.assertRaises(SystemExit):
+            generic_main(cfg, _copy_upper, self.args(jobs=2))
+        self.assertEqual('A' * 10, self.read_output('a.txt'))
+        self.assertEqual('B', self.read_output('b.txt'))
+        self.assertFalse(fp.exists(fp.join(self.odir, 'd.txt')))
+        self.assertFalse(fp.exists(fp.join(self.odir, 'e.dat')))
+
+    def test_pipeline(self):
+        "pipelined stages do the same as running them in one go"
+        expected = {}
+        for subpath in ['a.txt', 'b.txt', 'c.txt']:
+            expected.update(_parse_upper(subpath,
+                                         _read_upper(self.idir, subpath)))
+        for jobs in [1, 3]:
+            shutil.rmtree(self.odir, ignore_errors=True)
+            os.makedirs(self.odir)
+            pipeline = Pipeline(_STAGES, jobs=jobs, depth=1)
+            failures = pipeline.run(self.idir, self.odir,
+                                    ['a.txt', 'b.txt', 'c.txt', 'd.txt'])
+            self.assertEqual(['d.txt'], list(failures))
+            for subpath, text in expected.items():
+                self.assertEqual(text, self.read_output(subpath))
+            self.assertEqual([4, 4, 3], [x.items for x in pipeline.stats])
+            self.assertTrue(pipeline.read_q.max_depth <= 1)
+
+        # through generic_main (or not, the results are the same)
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        for pipeline in [True, False]:
+            shutil.rmtree(self.odir)
+            with self.assertRaises(SystemExit):
+                generic_main(cfg, _STAGES,
+                             self.args(jobs=2, pipeline=pipeline))
+            for subpath, text in expected.items():
+                self.assertEqual(text, self.read_output(subpath))
+
+    def test_generic_main_corpus(self):
+        "stages can write to a corpus instead of a directory"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        with self.assertRaises(SystemExit):
+            generic_main(cfg, _STAGES, self.args(jobs=2))
+        expected = [(s, self.read_output(s)) for s in
+                    ['a.txt', 'b.txt', 'c.txt',
+                     'lower/a.txt', 'lower/b.txt', 'lower/c.txt']]
+        self.odir = fp.join(self.tmpdir, 'output.corpus')
+        with self.assertRaises(SystemExit):
+            generic_main(cfg, _STAGES, self.args(jobs=2, corpus=True))
+        with Corpus(self.odir) as corpus:
+            self.assertEqual(expected, list(corpus))
+
+    def test_generic_main_archives(self):
+        "compressed inputs and tarballs"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        os.remove(fp.join(self.idir, 'd.txt'))
+        gz_file = gzip.GzipFile(fp.join(self.idir, 'g.txt.gz'), 'wb')
+        gz_file.write('gzipped')
+        gz_file.close()
+        generic_main(cfg, _copy_upper_compressed, self.args())
+        self.assertEqual('GZIPPED', self.read_output('g.txt'))
+
+        tarball = fp.join(self.tmpdir, 'input.tar.bz2')
+        with tarfile.open(tarball, 'w:bz2') as tar:
+            tar.add(self.idir, arcname='top/input')
+        shutil.rmtree(self.odir)
+        args = self.args(jobs=2)
+        args.input = fp.join(tarball, 'top', 'input')
+        generic_main(cfg, _copy_upper_compressed, args)
+        self.assertEqual(['a.txt', 'b.txt', 'c.txt', 'g.txt'],
+                         sorted(os.listdir(self.odir)))
+        self.assertEqual('C' * 100, self.read_output('c.txt'))
+
+        # queue entries would differ from one machine to the next
+        args.queue = fp.join(self.tmpdir, 'queue')
+        self.assertRaises(SystemExit, generic_main, cfg,
+                          _copy_upper_compressed, args)
+        self.assertFalse(fp.exists(args.queue))
+
+    def test_generic_main_shards(self):
+        "shards partition the inputs"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        os.remove(fp.join(self.idir, 'd.txt'))
+        self.write_inputs({'{}.txt'.format(i): str(i) for i in range(20)})
+        outputs = []
+        for index in range(1, 4):
+            shutil.rmtree(self.odir, ignore_errors=True)
+            generic_main(cfg, _copy_upper,
+                         self.args(shard=shard_type('{}/3'.format(index))))
+            outputs.append(frozenset(os.listdir(self.odir)))
+        self.assertEqual(23, sum(len(x) for x in outputs))
+        self.assertEqual(23, len(frozenset.union(*outputs)))
+        self.assertEqual(outputs[1],
+                         frozenset(s for s in os.listdir(self.idir)
+                                   if s.endswith('.txt') and
+                                   Shard(2, 3).includes(s)))
+
+    def test_generic_main_queue(self):
+        "several runs sharing a work queue"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        queue_dir = fp.join(self.tmpdir, 'queue')
+        with self.assertRaises(SystemExit):
+            generic_main(cfg, _copy_upper, self.args(queue=queue_dir,
+                                                     jobs=3))
+        self.assertEqual(['a.txt', 'b.txt', 'c.txt'],
+                         sorted(os.listdir(self.odir)))
+        # a second run finds nothing left to do (but still reports the
+        # failures)
+        shutil.rmtree(self.odir)
+        with self.assertRaises(SystemExit):
+            generic_main(cfg, _copy_upper, self.args(queue=queue_dir))
+        self.assertEqual([], os.listdir(self.odir))
+
+    def test_queue_reclaims_stale_leases(self):
+        "leases from dead workers can be taken over"
+        queue = WorkQueue(fp.join(self.tmpdir, 'queue'), ttl=60)
+        lease = queue.claim('x')
+        self.assertTrue(lease is not None)
+        self.assertEqual(None, queue.claim('x'))
+        lease._stop.set()  # pylint: disable=protected-access
+        old = time.time() - 120
+        os.utime(lease.filename, (old, old))
+        lease2 = queue.claim('x')
+        self.assertTrue(lease2 is not None)
+        self.assertEqual(None, queue.claim('x'))
+        lease2.release()
+        self.assertTrue(queue.claim('x') is not None)
+
+    def test_queue_lost_lease(self):
+        "results from a worker that lost its lease are thrown away"
+        queue_dir = fp.join(self.tmpdir, 'queue')
+        queue = WorkQueue(queue_dir, ttl=1)
+        os.makedirs(self.odir)
+        calls = []
+
+        def steal(idir, odir, subpath):
+            "lose the lease the first time around"
+            calls.append(subpath)
+            if len(calls) == 1:
+                lease_file = fp.join(queue_dir, 'leases',
+                                     queue.item_name(idir, subpath))
+                with open(lease_file, 'w') as stream:
+                    json.dump({'token': 'somebody else'}, stream)
+                raise ValueError('not the result that counts')
+            _copy_upper(idir, odir, subpath)
+
+        work_loop(queue, steal, self.idir, self.odir, ['a.txt'])
+        self.assertEqual(['a.txt', 'a.txt'], calls)
+        name = queue.item_name(self.idir, 'a.txt')
+        self.assertEqual({}, queue.failures({name: 'a.txt'}))
+        self.assertEqual('A' * 10, self.read_output('a.txt'))
+
+    def test_generic_main_incremental(self):
+        "incremental mode only touches what changed"
+        cfg = CliConfig(description='test',
+                        input_description='text files',
+                        glob='*.txt')
+        os.remove(fp.join(self.idir, 'd.txt'))
+        generic_main(cfg, _copy_upper, self.args(incremental=True))
+        self.assertEqual('B', self.read_output('b.txt'))
+
+        # tamper with an output so we can tell if it gets rewritten
+        with open(fp.join(self.odir, 'a.txt'), 'w') as ofile:
+            ofile.write('untouched')
+        os.remove(fp.join(self.idir, 'b.txt'))
+        self.write_inputs({'c.txt': 'cc', 'f.txt': 'f'})
+        generic_main(cfg, _copy_upper, self.args(incremental=True,
+                                                 jobs=2))
+        self.assertEqual('untouched', self.read_output('a.txt'))
+        self.assertFalse(fp.exists(fp.join(self.odir, 'b.txt')))
+        self.assertEqual('CC', self.read_output('c.txt'))
+        self.assertEqual('F', self.read_output('f.txt'))
+        self.assertEqual(['a.txt', 'c.txt', 'f.txt'],
+                         sorted(os.listdir(self.odir)))
+
+
+class RecordsTest(unittest.TestCase):
+    "tests for reading json output dirs"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.contents = {'b': [{'origOccurrence': 'Bob'}],
+                         'a-c': [],
+                         fp.join('a', 'x'): {'origOccurrence': 'Xavier'},
+                         fp.join('a', 'y'): [{'origOccurrence': 'Y'},
+                                             {'surname': 'Yves'}]}
+        for subpath, recs in self.contents.items():
+            filename = fp.join(self.tmpdir, subpath)
+            if not fp.exists(fp.dirname(filename)):
+                os.makedirs(fp.dirname(filename))
+            with open(filename, 'w') as ofile:
+                json.dump(recs, ofile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_iter_records(self):
+        "lazy reading in sorted order"
+        expected = [(fp.join('a', 'x'), [{'origOccurrence': 'Xavier'}]),
+                    (fp.join('a', 'y'), self.contents[fp.join('a', 'y')]),
+                    ('a-c', []),
+                    ('b', self.contents['b'])]
+        self.assertEqual(expected, list(iter_records(self.tmpdir)))
+
+    def test_iter_records_concurrently(self):
+        "thread/process pools do not change what we read"
+        expected = list(iter_records(self.tmpdir))
+        self.assertEqual(expected,
+                         list(iter_records(self.tmpdir, threads=3)))
+        self.assertEqual(expected,
+                         list(iter_records(self.tmpdir, threads=2,
+                                           processes=2)))
+
+    def test_record_filter(self):
+        "projection and predicates"
+        rfilter = RecordFilter(fields=['origOccurrence'],
+                               files=['a/*'],
+                               equals=None,
+                               exists=['origOccurrence'])
+        expected = [(fp.join('a', 'x'), [{'origOccurrence': 'Xavier'}]),
+                    (fp.join('a', 'y'), [{'origOccurrence': 'Y'}])]
+        self.assertEqual(expected,
+                         list(iter_records(self.tmpdir, rfilter=rfilter)))
+        rfilter = RecordFilter(fields=None, files=None,
+                               equals=[('surname', 'Yves')], exists=None)
+        self.assertEqual([{'surname': 'Yves'}],
+                         read_records(self.tmpdir, rfilter=rfilter)['y'])
+
+    def test_iter_records_archives(self):
+        "compressed files and tarballs read the same as the original"
+        expected = list(iter_records(self.tmpdir))
+        tmpdir2 = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir2)
+        tarball = fp.join(tmpdir2, 'records.tar.gz')
+        with tarfile.open(tarball, 'w:gz') as tar:
+            tar.add(self.tmpdir, arcname='records')
+        self.assertEqual(sorted(expected),
+                         sorted(iter_records(fp.join(tarball, 'records'))))
+
+        bfile = fp.join(self.tmpdir, 'b')
+        with open(bfile) as ifile:
+            gz_file = gzip.GzipFile(bfile + '.gz', 'wb')
+            gz_file.write(ifile.read())
+            gz_file.close()
+        os.remove(bfile)
+        self.assertEqual(expected, list(iter_records(self.tmpdir)))
+
+        # compressed files in a tarball
+        tarball = fp.join(tmpdir2, 'records-gz.tar')
+        with tarfile.open(tarball, 'w') as tar:
+            tar.add(self.tmpdir, arcname='records')
+        self.assertEqual(sorted(expected),
+                         sorted(iter_records(fp.join(tarball, 'records'))))
+
+    def test_read_records(self):
+        "read_records is keyed on basenames"
+        records = read_records(self.tmpdir)
+        self.assertEqual(['a-c', 'b', 'x', 'y'], sorted(records))
+        self.assertEqual([{'origOccurrence': 'Xavier'}], records['x'])
+
+    def test_packed_records(self):
+        "packed dirs read the same as the original"
+        packed_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, packed_dir)
+        pack_records(iter_records(self.tmpdir), packed_dir, shard_size=30)
+        self.assertTrue(len(os.listdir(packed_dir)) > 2)
+        self.assertEqual(list(iter_records(self.tmpdir)),
+                         list(iter_records(packed_dir)))
+        self.assertEqual(read_records(self.tmpdir),
+                         read_records(packed_dir))
+        self.assertEqual(self.contents['b'],
+                         read_record(packed_dir, 'b'))
+
+        # non-ascii paths, looked up as unicode or as utf-8 bytes
+        pack_records([(u'caf\xe9', [{'origOccurrence': 'Zoe'}]),
+                      (u'z', [])], packed_dir)
+        packed = PackedRecords(packed_dir)
+        for subpath in [u'caf\xe9', u'caf\xe9'.encode('utf-8')]:
+            self.assertTrue(subpath in packed)
+            self.assertEqual([{'origOccurrence': 'Zoe'}],
+                             packed.get(subpath))
@@ -0,0 +1,53 @@
+"""
+Test suite for compact records
+"""
+
+import copy
+import pickle
+import unittest
+
+from ttt.compact import CompactRecord, compact_record
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class CompactTest(unittest.TestCase):
+    "tests for ttt.compact"
+
+    def test_dict_like(self):
+        "compact records behave like dictionaries"
+        orig = {u'surname': u'Smith',
+                u'origOccurrence': u'John Smith',
+                u'somethingNew': u'x'}
+        rec = CompactRecord(orig)
+        self.assertEqual(orig, rec)
+        self.assertEqual(orig, dict(rec))
+        self.assertEqual(sorted(orig.items()), sorted(rec.items()))
+        self.assertEqual(3, len(rec))
+        self.assertEqual(u'Smith', rec[u'surname'])
+        self.assertEqual(None, rec.get(u'forename'))
+        self.assertFalse(u'forename' in rec)
+        self.assertRaises(KeyError, lambda: rec[u'role'])
+
+    def test_mutation(self):
+        "setting and deleting keys (on a copy)"
+        rec = CompactRecord({u'surname': u'Smith'})
+        rec2 = copy.copy(rec)
+        rec2[u'count'] = 3
+        del rec2[u'surname']
+        self.assertEqual({u'count': 3}, rec2)
+        self.assertEqual({u'surname': u'Smith'}, rec)
+        self.assertEqual(rec, pickle.loads(pickle.dumps(rec, 2)))
+
+    def test_interning(self):
+        "equal values are shared (through the same intern table)"
+        interned = {}
+        rec1 = CompactRecord({u'role': u''.join([u'cler', u'k'])},
+                             interned=interned)
+        rec2, rec3 = compact_record([{u'role': u''.join([u'cle', u'rk'])},
+                                     {u'role': u''.join([u'cl', u'erk'])}],
+                                    interned)
+        self.assertTrue(rec1[u'role'] is rec2[u'role'])
+        self.assertTrue(rec1[u'role'] is rec3[u'role'])
+        self.assertEqual({u'clerk': u'clerk'}, interned)
+        rec4 = compact_record([{u'role': u''.join([u'c', u'lerk'])}])[0]
+        self.assertFalse(rec1[u'role'] is rec4[u'role'])
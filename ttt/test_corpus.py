@@ -0,0 +1,65 @@
+"""
+Test suite for single-file corpora
+"""
+
+from os import path as fp
+import json
+import shutil
+import tempfile
+import unittest
+
+from ttt.cli import iter_records
+from ttt.corpus import Corpus, CorpusWriter, export_corpus, is_corpus
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class CorpusTest(unittest.TestCase):
+    "tests for ttt.corpus"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = fp.join(self.tmpdir, 'snippets.corpus')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        "snippets come back by id and in id order"
+        snippets = {u'b/x-2': u'caf\xe9\n',
+                    u'a-1': u'',
+                    u'b/x-1': u'one\ntwo\n'}
+        with CorpusWriter(self.filename) as corpus:
+            corpus.write(None, sorted(snippets.items(), reverse=True))
+            corpus.add(u'a-1', u'replaced')
+        snippets[u'a-1'] = u'replaced'
+        self.assertTrue(is_corpus(self.filename))
+        self.assertFalse(is_corpus(self.tmpdir))
+        with Corpus(self.filename) as corpus:
+            self.assertEqual(3, len(corpus))
+            self.assertEqual([u'a-1', u'b/x-1', u'b/x-2'], corpus.ids())
+            self.assertEqual(u'caf\xe9\n', corpus[u'b/x-2'])
+            self.assertEqual(None, corpus.get(u'c'))
+            self.assertEqual(snippets, dict(corpus))
+
+            odir = fp.join(self.tmpdir, 'export')
+            self.assertEqual(2, export_corpus(corpus, odir,
+                                              want=lambda s: '/' in s))
+            with open(fp.join(odir, 'b', 'x-2')) as stream:
+                self.assertEqual(u'caf\xe9\n', stream.read().decode('utf-8'))
+            self.assertFalse(fp.exists(fp.join(odir, 'a-1')))
+
+    def test_empty(self):
+        "corpora can be empty"
+        CorpusWriter(self.filename).close()
+        with Corpus(self.filename) as corpus:
+            self.assertEqual([], list(corpus))
+
+    def test_iter_records(self):
+        "corpora of json snippets can be read as records"
+        records = {u'x/1': [{u'surname': u'Smith'}],
+                   u'x/2': []}
+        with CorpusWriter(self.filename) as corpus:
+            for subpath, subrecs in records.items():
+                corpus.add(subpath, json.dumps(subrecs))
+        self.assertEqual(sorted(records.items()),
+                         list(iter_records(self.filename)))
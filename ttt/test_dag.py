@@ -0,0 +1,109 @@
+"""
+Test suite for the task runner
+"""
+
+from os import path as fp
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from ttt.dag import (BLOCKED, DONE, FAILED, UP_TO_DATE,
+                     DagError, Task, TaskRunner, dependencies)
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class DagTest(unittest.TestCase):
+    "tests for ttt.dag"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.runs = []
+        self.write('src', 'hello')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        "file in the scratch dir"
+        return fp.join(self.tmpdir, name)
+
+    def write(self, name, text):
+        "write a file in the scratch dir"
+        with open(self.path(name), 'w') as stream:
+            stream.write(text)
+
+    def copier(self, name, src, dst, transform=lambda x: x):
+        "task that copies a file"
+        def action():
+            "copy the file"
+            self.runs.append(name)
+            with open(self.path(src)) as stream:
+                self.write(dst, transform(stream.read()))
+        return Task(name=name, inputs=[self.path(src)],
+                    outputs=[self.path(dst)], action=action, salt='')
+
+    def runner(self, tasks, jobs=1):
+        "task runner for tasks"
+        return TaskRunner(tasks, self.path('state.json'), jobs=jobs,
+                          verbose=False)
+
+    def test_dependencies(self):
+        "tasks depend on the tasks that produce their inputs"
+        tasks = [self.copier('b', 'a', 'b'),
+                 self.copier('a', 'src', 'a'),
+                 self.copier('c', 'src', 'c')]
+        self.assertEqual({'a': set(), 'b': set(['a']), 'c': set()},
+                         dependencies(tasks))
+        self.assertRaises(DagError, dependencies,
+                          [self.copier('a', 'b', 'a'),
+                           self.copier('b', 'a', 'b')])
+
+    def test_up_to_date(self):
+        "only run tasks whose inputs have changed"
+        tasks = [self.copier('b', 'a', 'b'),
+                 self.copier('a', 'src', 'a', transform=lambda x: str(len(x)))]
+        self.assertEqual({'a': DONE, 'b': DONE}, self.runner(tasks).run())
+        self.assertEqual(['a', 'b'], self.runs)
+        self.assertEqual({'a': UP_TO_DATE, 'b': UP_TO_DATE},
+                         self.runner(tasks).run())
+        self.assertEqual([], self.runner(tasks).stale())
+        # a's output is the same, so b need not run again
+        self.write('src', 'world')
+        self.assertEqual(['a', 'b'], self.runner(tasks).stale())
+        self.assertEqual({'a': DONE, 'b': UP_TO_DATE},
+                         self.runner(tasks).run())
+        # missing outputs
+        os.remove(self.path('b'))
+        self.assertEqual({'a': UP_TO_DATE, 'b': DONE},
+                         self.runner(tasks).run(['b']))
+        self.assertEqual(['a', 'b', 'a', 'b'], self.runs)
+        self.assertEqual({'a': DONE}, self.runner(tasks).run(['a'],
+                                                            force=True))
+
+    def test_failure(self):
+        "tasks that depend on failed tasks are not run"
+        tasks = [self.copier('b', 'a', 'b'),
+                 self.copier('a', 'missing', 'a'),
+                 self.copier('c', 'src', 'c')]
+        self.assertEqual({'a': FAILED, 'b': BLOCKED, 'c': DONE},
+                         self.runner(tasks, jobs=2).run())
+
+    def test_parallel(self):
+        "independent tasks run at the same time"
+        events = [threading.Event(), threading.Event()]
+
+        def waiter(mine, theirs):
+            "wait for the other task to start"
+            def action():
+                "signal, then wait"
+                events[mine].set()
+                if not events[theirs].wait(5):
+                    raise Exception('not in parallel')
+            return action
+        tasks = [Task(name=str(i), inputs=[self.path('src')], outputs=[],
+                      action=waiter(i, 1 - i), salt='')
+                 for i in range(2)]
+        self.assertEqual({'0': DONE, '1': DONE},
+                         self.runner(tasks, jobs=2).run())
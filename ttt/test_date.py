@@ -4,7 +4,11 @@ Test suite for date parser
 
 import unittest
 
-from ttt.date import read_date
+from ttt.date import (DAY, MONTH, NO_DATE, YEAR,
+                      date_granularity, date_ranges, pack_iso, pack_isos,
+                      read_date, read_date_parts, read_dates,
+                      unpack_iso, unpack_isos)
+import ttt.date
 
 # pylint: disable=too-many-public-methods, invalid-name
 class DateTest(unittest.TestCase):
@@ -37,3 +41,88 @@ class DateTest(unittest.TestCase):
         "robustness with junk"
         self.assertDateEqual(None, "Feb. (?)", prefix="1497")
         self.assertDateEqual("1497-02", "Feb. (?)", prefix="1497", fuzzy=True)
+
+    def test_read_date_common(self):
+        "formats we read without dateutil"
+        self.assertDateEqual("1521-02", "Feb. 1521")
+        self.assertDateEqual("1521-07-14", "14th July 1521")
+        self.assertDateEqual("1521-07-14", "1521-07-14")
+        self.assertDateEqual("1521-12-31", "December", prefix="1521-01-31")
+        self.assertDateEqual(None, "31 February 1521")
+        self.assertDateEqual(None, "Undated")
+        self.assertDateEqual(None, "14")
+
+    def test_read_date_fallback(self):
+        "formats we leave to dateutil"
+        self.assertDateEqual("1521-07-14", "Monday 14 July 1521")
+        self.assertDateEqual("1521-07-14", "1521/07/14")
+
+    def test_read_date_parts(self):
+        "granularity of date parts"
+        self.assertEqual((1521,), read_date_parts("1521"))
+        self.assertEqual((1521, 12), read_date_parts("December 1521"))
+        self.assertEqual((1521, 12, 3), read_date_parts("3 Dec. 1521"))
+        self.assertEqual(None, read_date_parts("preface"))
+
+    def test_read_dates(self):
+        "reading dates in bulk"
+        dstrs = ["July", "Undated", "14 July", "July"] * 600
+        expected = [read_date(x, prefix="1521") for x in dstrs]
+        self.assertEqual(expected, read_dates(dstrs, prefix="1521"))
+        self.assertEqual(expected, read_dates(dstrs, prefix="1521",
+                                              processes=2))
+        # only three distinct strings, so not worth a pool by default
+        self.assertEqual(expected, read_dates(dstrs, prefix="1521",
+                                              processes=2,
+                                              min_parallel=1))
+        self.assertEqual(expected, read_dates(dstrs, prefix="1521",
+                                              processes=2,
+                                              min_parallel=1,
+                                              fuzzy=False))
+        self.assertEqual([], read_dates([]))
+        self.assertRaises(ValueError, read_dates, ["July"],
+                          prefix="preface")
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class PackedDateTest(unittest.TestCase):
+    "tests for packed dates in ttt.date"
+
+    isos = ["1521-07-01", "1521", "1522", "1520-12-31", "1521-07",
+            "1521-08", "0999-01-31"]
+
+    def test_round_trip(self):
+        "packing and unpacking ISO dates"
+        for iso in self.isos:
+            self.assertEqual(iso, unpack_iso(pack_iso(iso)))
+        self.assertEqual(NO_DATE, pack_iso(None))
+        self.assertEqual(None, unpack_iso(NO_DATE))
+        self.assertEqual([YEAR, MONTH, DAY],
+                         [date_granularity(pack_iso(x))
+                          for x in ["1521", "1521-07", "1521-07-01"]])
+        for bad in ["1521-13", "1521-02-29", "21", "1521-7", "July"]:
+            self.assertRaises(ValueError, pack_iso, bad)
+
+    def test_order(self):
+        "packed dates sort like their ISO forms"
+        packed = sorted(pack_iso(x) for x in self.isos)
+        self.assertEqual(sorted(self.isos), [unpack_iso(x) for x in packed])
+
+    def test_ranges(self):
+        "earliest and latest dates in groups"
+        def check():
+            "with or without numpy"
+            packed = pack_isos(self.isos + [None])
+            self.assertEqual(self.isos + [None], unpack_isos(packed))
+            lows, highs = date_ranges([0, 0, 0, 1, 1, 1, 0, 1], packed, 3)
+            self.assertEqual(["0999-01-31", "1520-12-31", None],
+                             unpack_isos(lows))
+            self.assertEqual(["1522", "1521-08", None], unpack_isos(highs))
+
+        check()
+        numpy = ttt.date.numpy
+        ttt.date.numpy = None
+        try:
+            check()
+        finally:
+            ttt.date.numpy = numpy
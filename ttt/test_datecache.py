@@ -0,0 +1,83 @@
+"""
+Test suite for the memoised date reader
+"""
+
+import argparse
+import shutil
+import tempfile
+import unittest
+
+from ttt.date import read_date
+from ttt.datecache import (CacheStats, DateCache, add_date_cache_args,
+                           check_date_cache_args)
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class DateCacheTest(unittest.TestCase):
+    "tests for ttt.datecache"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_dates(self):
+        "cached dates are the dates we would have read anyway"
+        cache = DateCache()
+        for dstr, prefix, kwargs in [("December 1521", None, {}),
+                                     ("14 July", "1521", {}),
+                                     ("Feb. (?)", "1497", {'fuzzy': True}),
+                                     ("Feb. (?)", "1497", {}),
+                                     ("preface", None, {})]:
+            for _ in range(2):
+                self.assertEqual(read_date(dstr, prefix=prefix, **kwargs),
+                                 cache.read_date(dstr, prefix=prefix,
+                                                 **kwargs))
+        self.assertEqual(CacheStats(hits=5, disk_hits=0, misses=5,
+                                    evictions=0),
+                         cache.stats())
+
+    def test_eviction(self):
+        "only the most recently used dates are kept"
+        cache = DateCache(size=2)
+        cache.read_date("July")
+        cache.read_date("June")
+        cache.read_date("July")
+        cache.read_date("May")  # evicts June
+        cache.read_date("July")
+        cache.read_date("June")
+        self.assertEqual(CacheStats(hits=2, disk_hits=0, misses=4,
+                                    evictions=2),
+                         cache.stats())
+
+    def test_cache_dir(self):
+        "dates are shared through the cache dir"
+        DateCache(dirname=self.tmpdir).read_date("July", prefix="1521")
+        DateCache(dirname=self.tmpdir).read_date("Undated")
+        cache = DateCache(dirname=self.tmpdir)
+        self.assertEqual("1521-07", cache.read_date("July", prefix="1521"))
+        self.assertEqual(None, cache.read_date("Undated"))
+        self.assertEqual("1522-07", cache.read_date("July", prefix="1522"))
+        self.assertEqual(CacheStats(hits=0, disk_hits=2, misses=1,
+                                    evictions=0),
+                         cache.stats())
+
+    def test_bad_prefix(self):
+        "bad prefixes are still an error"
+        cache = DateCache()
+        for _ in range(2):
+            self.assertRaises(ValueError, cache.read_date, "July",
+                              prefix="preface")
+
+    def test_stats_args(self):
+        "cache stats are only on offer without --jobs"
+        psr = argparse.ArgumentParser()
+        psr.add_argument('--jobs', type=int, default=1)
+        add_date_cache_args(psr)
+        psr.error = self.fail
+        check_date_cache_args(psr, psr.parse_args(['--date-cache-stats']))
+        check_date_cache_args(psr, psr.parse_args(['--jobs', '4']))
+        args = psr.parse_args(['--jobs', '4', '--date-cache-stats'])
+        self.assertRaises(self.failureException,
+                          check_date_cache_args, psr, args)
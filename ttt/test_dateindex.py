@@ -0,0 +1,126 @@
+"""
+Test suite for the date index
+"""
+
+from os import path as fp
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from ttt.dateindex import DateIndex, date_range, index_dir, window_range
+
+
+def _records(seed):
+    "some random records, some of them dated"
+    rng = random.Random(seed)
+    dates = [None, "1290", "1299-02", "1296-02-29", "1310-12-31",
+             "1311", "1305-06", "not a date"]
+    pairs = []
+    for i in range(30):
+        subrecs = []
+        for _ in range(rng.randint(0, 5)):
+            date = rng.choice(dates)
+            subrecs.append({} if date is None else
+                           {u'appearanceDate': date})
+        pairs.append(('d{}/f{}'.format(i % 3, i), subrecs))
+    pairs.append(('condensed', [{u'appearanceDate (min)': '1200',
+                                 u'appearanceDate (max)': '1295-03'}]))
+    return pairs
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class DateIndexTest(unittest.TestCase):
+    "tests for ttt.dateindex"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertQueries(self, pairs, index):
+        "index queries give the same results as a full scan"
+        windows = [(None, None), ("1290", "1310"), ("1296-02-29", None),
+                   (None, "1294"), ("1299-03", "1300-01"), ("1400", None),
+                   ("1295-03-31", "1295-04")]
+        for start, end in windows:
+            first, last = window_range(start, end)
+            expected = []
+            for subpath, subrecs in pairs:
+                for i, subrec in enumerate(subrecs):
+                    if u'appearanceDate' in subrec:
+                        dstr = subrec[u'appearanceDate']
+                        if dstr == "not a date":
+                            continue
+                        span = date_range(dstr)
+                    elif subrec:
+                        span = (date_range('1200')[0],
+                                date_range('1295-03')[1])
+                    else:
+                        continue
+                    if span[0] <= last and span[1] >= first:
+                        expected.append((subpath, i))
+            self.assertEqual(sorted(expected),
+                             sorted(index.query(start, end)))
+
+    def test_date_range(self):
+        "the days covered by partial dates"
+        self.assertEqual(366, len(range(*date_range("1296"))) + 1)
+        self.assertEqual(29, len(range(*date_range("1296-02"))) + 1)
+        first, last = date_range("1296-02-29")
+        self.assertEqual(first, last)
+        self.assertRaises(ValueError, date_range, "1300-02-29")
+
+    def test_query(self):
+        "range queries"
+        pairs = _records(1)
+        self.assertQueries(pairs, DateIndex.build(iter(pairs)))
+        index = DateIndex.build(iter(pairs))
+        files = index.query_files("1290", "1290")
+        self.assertEqual(sorted(x for x, _ in files),
+                         [x for x, _ in files])
+        self.assertTrue(all(p == sorted(p) for _, p in files))
+
+    def test_save(self):
+        "saved indices give the same results"
+        pairs = _records(2)
+        ifile = fp.join(self.tmpdir, 'index')
+        DateIndex.build(iter(pairs)).save(ifile)
+        index = DateIndex.load(ifile)
+        self.assertEqual([p for p, _ in pairs], index.paths)
+        self.assertQueries(pairs, index)
+        DateIndex.build(iter([])).save(ifile)
+        self.assertEqual([], list(DateIndex.load(ifile).query()))
+
+    def test_index_dir(self):
+        "indexing json dirs, and noticing when they change"
+        jdir = fp.join(self.tmpdir, 'json')
+        os.makedirs(fp.join(jdir, 'sub'))
+        with open(fp.join(jdir, 'sub', 'a'), 'w') as stream:
+            json.dump([{'appearanceDate': '1291'}, {}], stream)
+        stream = gzip.GzipFile(fp.join(jdir, 'b.gz'), 'wb')
+        json.dump([{}, {'appearanceDate': '1290-07', 'x': 'b'}], stream)
+        stream.close()
+        ifile = fp.join(self.tmpdir, 'index')
+        index_dir(jdir).save(ifile)
+        index = DateIndex.load(ifile)
+        self.assertTrue(index.is_current(jdir))
+        self.assertEqual([(u'b', [{u'appearanceDate': u'1290-07',
+                                   u'x': u'b'}])],
+                         list(index.read_window(jdir, '1290-07-14',
+                                                '1290-07-14')))
+        self.assertEqual([u'b', u'sub/a'],
+                         [p for p, _ in index.read_window(jdir)])
+        with open(fp.join(jdir, 'c'), 'w') as stream:
+            json.dump([], stream)
+        self.assertFalse(index.is_current(jdir))
+        os.remove(fp.join(jdir, 'c'))
+        self.assertTrue(index.is_current(jdir))
+        with open(fp.join(jdir, 'sub', 'a'), 'w') as stream:
+            json.dump([], stream)
+        self.assertFalse(index.is_current(jdir))
+        self.assertFalse(DateIndex.build(iter([])).is_current(jdir))
@@ -0,0 +1,89 @@
+"""
+Test suite for chunked/incremental archives
+"""
+
+from os import path as fp
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ttt.cli import read_records
+from ttt.goldarchive import (ArchiveError, archive_chain, build_archive,
+                             restore_archive)
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class GoldArchiveTest(unittest.TestCase):
+    "tests for ttt.goldarchive"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = fp.join(self.tmpdir, 'working')
+        for i in range(6):
+            self.write('ds/json-eric/s{}'.format(i),
+                       json.dumps([{'origOccurrence': 'x' * i}]))
+        self.write('ds/notes.txt', 'hello')
+        os.link(fp.join(self.src, 'ds', 'json-eric', 's0'),
+                fp.join(self.src, 'ds', 'json-eric', 's0-link'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, subpath, text):
+        "write a file in the source dir"
+        filename = fp.join(self.src, subpath)
+        if not fp.exists(fp.dirname(filename)):
+            os.makedirs(fp.dirname(filename))
+        with open(filename, 'w') as stream:
+            stream.write(text)
+
+    def contents(self, dirname):
+        "the files in a directory"
+        results = {}
+        for root, _, names in os.walk(dirname):
+            for name in names:
+                filename = fp.join(root, name)
+                with open(filename) as stream:
+                    results[fp.relpath(filename, dirname)] = stream.read()
+        return results
+
+    def test_chain(self):
+        "full and incremental archives, restored and read directly"
+        arc1 = fp.join(self.tmpdir, 'archives', 'gold-1')
+        stats = build_archive(self.src, arc1, processes=2, chunk_size=100)
+        self.assertEqual(8, stats.files)
+        self.assertEqual(8, stats.changed)
+        self.assertTrue(stats.chunks > 1)
+        expected1 = self.contents(self.src)
+
+        # change one file, add one, delete one, touch one
+        time.sleep(0.01)
+        self.write('ds/json-eric/s1', '[]')
+        self.write('ds/json-eric/s9', '[]')
+        os.remove(fp.join(self.src, 'ds', 'notes.txt'))
+        os.utime(fp.join(self.src, 'ds', 'json-eric', 's2'), (1, 1))
+        arc2 = fp.join(self.tmpdir, 'archives', 'gold-2')
+        stats = build_archive(self.src, arc2, parent=arc1)
+        self.assertEqual((8, 2, 1), stats[:3])
+        self.assertEqual(['gold-2', 'gold-1'], archive_chain(arc2))
+        self.assertRaises(ArchiveError, build_archive, self.src, arc2)
+
+        for arc, expected in [(arc1, expected1),
+                              (arc2, self.contents(self.src))]:
+            out = fp.join(self.tmpdir, 'out-' + fp.basename(arc))
+            self.assertEqual(len(expected),
+                             restore_archive(arc, out, processes=2))
+            self.assertEqual(expected, self.contents(out))
+        self.assertEqual(1, os.stat(fp.join(out, 'ds', 'json-eric',
+                                             's2')).st_mtime)
+
+        # read records straight out of the archive
+        records = read_records(fp.join(arc2, 'ds', 'json-eric'))
+        self.assertEqual(['s0', 's0-link', 's1', 's2', 's3', 's4', 's5',
+                          's9'],
+                         sorted(records))
+        self.assertEqual([], records['s1'])
+        self.assertEqual('xxx', records['s3'][0]['origOccurrence'])
@@ -0,0 +1,46 @@
+"""
+Test suite for near-duplicate detection
+"""
+
+import unittest
+
+from ttt.minhash import (DEFAULT_CONFIG, MinHasher, cluster_sizes,
+                         find_clusters, shingles, similarity)
+
+_FORMULA = (u'The king has taken the homage of {} for the lands '
+            u'which {} held of him in chief, and he has paid a fine '
+            u'of {} marks. Order to the sheriff of Kent to take '
+            u'security and to give him full seisin.')
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class MinHashTest(unittest.TestCase):
+    "tests for ttt.minhash"
+
+    def test_similarity(self):
+        "signature agreement estimates Jaccard similarity"
+        hasher = MinHasher(256, seed=1)
+        set1 = set(range(100))
+        set2 = set(range(50, 150))  # Jaccard similarity 1/3
+        estimate = similarity(hasher.signature(set1),
+                              hasher.signature(set2))
+        self.assertTrue(0.2 < estimate < 0.45, estimate)
+        # same as the plain Python version (in case we used numpy)
+        self.assertEqual(tuple(min((a * x + b) % ((1 << 31) - 1)
+                                   for x in set1)
+                               for a, b in hasher.coeffs),
+                         hasher.signature(set1))
+        self.assertEqual(1, len(shingles(u'Hi!', 3)))
+
+    def test_clusters(self):
+        "near-duplicate formulaic entries end up together"
+        snippets = [(u'a/1', _FORMULA.format(u'John', u'his father', 5)),
+                    (u'a/2', u'Something else entirely, about Alice.'),
+                    (u'b/1', _FORMULA.format(u'Jon', u'his father', 10)),
+                    (u'b/2', _FORMULA.format(u'John', u'his father', 5)),
+                    (u'b/3', u'Something else entirely, about Bob.')]
+        cmap = find_clusters(snippets, DEFAULT_CONFIG)
+        self.assertEqual({u'a/1': u'a/1', u'a/2': u'a/2', u'b/1': u'a/1',
+                          u'b/2': u'a/1', u'b/3': u'b/3'}, cmap)
+        self.assertEqual({u'a/1': 3, u'a/2': 1, u'b/3': 1},
+                         cluster_sizes(cmap))
@@ -0,0 +1,76 @@
+"""
+Test suite for running nimrodel (using a stand-in for it)
+"""
+
+from os import path as fp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ttt.nimrodel import Scheduler, make_jobs
+from ttt.test_batch import FAKE_NIMRODEL
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class SchedulerTest(unittest.TestCase):
+    "tests for ttt.nimrodel"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        nimrodel = fp.join(self.tmpdir, 'nimrodel.py')
+        with open(nimrodel, 'w') as stream:
+            stream.write(FAKE_NIMRODEL)
+        self.command = [sys.executable, nimrodel]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dataset(self, name, contents):
+        "write a dataset's input files, return its jobs"
+        idir = fp.join(self.tmpdir, name, 'unannotated')
+        for subpath, text in contents.items():
+            if not fp.exists(fp.dirname(fp.join(idir, subpath))):
+                os.makedirs(fp.dirname(fp.join(idir, subpath)))
+            with open(fp.join(idir, subpath), 'w') as stream:
+                stream.write(text)
+        return make_jobs(name, idir, fp.join(self.tmpdir, name, 'json'),
+                         max_files=3)
+
+    def read_output(self, name, subpath):
+        "names found in an output file"
+        with open(fp.join(self.tmpdir, name, 'json', subpath)) as stream:
+            return [x['origOccurrence'] for x in json.load(stream)]
+
+    def test_scheduler(self):
+        "jobs are split until we find the bad files"
+        jobs = self.dataset('ds1', {'a/1': 'Alice', 'a/2': 'CRASH Bob',
+                                    'a/3': 'Carol', 'b/1': 'SLOW Dave',
+                                    'b/2': 'Eve'})
+        self.assertEqual([3, 2], [len(j.subpaths) for j in jobs])
+        self.assertEqual([19, 12], [j.size for j in jobs])
+        jobs.extend(self.dataset('ds2', {'c': 'Fred and George'}))
+        failures = Scheduler(self.command, workers=2, timeout=1).run(jobs)
+        idir = fp.join(self.tmpdir, 'ds1', 'unannotated')
+        self.assertEqual([fp.join(idir, 'a/2'), fp.join(idir, 'b/1')],
+                         sorted(failures))
+        self.assertTrue('timed out' in failures[fp.join(idir, 'b/1')])
+        self.assertEqual(['Alice'], self.read_output('ds1', 'a/1'))
+        self.assertEqual(['Carol'], self.read_output('ds1', 'a/3'))
+        self.assertEqual(['Eve'], self.read_output('ds1', 'b/2'))
+        self.assertEqual(['Fred', 'George'], self.read_output('ds2', 'c'))
+        self.assertFalse(fp.exists(fp.join(self.tmpdir, 'ds1', 'json',
+                                           'a/2')))
+
+    def test_missing_command(self):
+        "all files fail (rather than the workers) if nimrodel is missing"
+        jobs = self.dataset('ds1', {'a': 'Alice', 'b': 'Bob', 'c': 'Carol',
+                                    'd': 'Dave'})
+        missing = [fp.join(self.tmpdir, 'no-such-nimrodel')]
+        failures = Scheduler(missing, workers=2).run(jobs)
+        idir = fp.join(self.tmpdir, 'ds1', 'unannotated')
+        self.assertEqual([fp.join(idir, x) for x in 'abcd'],
+                         sorted(failures))
+        self.assertTrue(all('OSError' in x for x in failures.values()))
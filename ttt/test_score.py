@@ -0,0 +1,45 @@
+"""
+Test suite for scoring
+"""
+
+import unittest
+
+from ttt.score import RunningScores, score_records, score_streams
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class ScoreTest(unittest.TestCase):
+    "tests for ttt.score"
+
+    reference = {'a': [{'origOccurrence': 'Alice', 'role': 'Queen'},
+                       {'origOccurrence': 'Bob'}],
+                 'b': [{'origOccurrence': 'Carol', 'surname': 'Smith'}],
+                 'd': [{'origOccurrence': 'Dave'}]}
+    test = {'a': [{'origOccurrence': 'Alice', 'role': 'queen'}],
+            'b': [{'origOccurrence': 'Carol', 'surname': 'Jones'},
+                  {'origOccurrence': 'Eve'}],
+            'c': [{'origOccurrence': 'Frank'}]}
+
+    def test_streams_match_records(self):
+        "streaming scores are the same as all-at-once ones"
+        expected = score_records(self.reference, self.test)
+        got = score_streams(sorted(self.reference.items()),
+                            sorted(self.test.items()))
+        self.assertEqual(sorted(expected[1]), sorted(got[1]))
+        for key in expected[1]:
+            for skey, score in expected[1][key].items():
+                self.assertAlmostEqual(score, got[1][key][skey])
+        for skey, score in expected[0].items():
+            self.assertAlmostEqual(score, got[0][skey])
+
+    def test_running_scores(self):
+        "running scores end up the same as all-at-once ones"
+        expected = score_records(self.reference, self.test)[0]
+        running = RunningScores(self.reference)
+        for key in ['c', 'b', 'a']:
+            running.add('some/dir/' + key, self.test[key])
+        self.assertEqual(3, len(running))
+        # Dave has not been seen yet (so does not count against recall)
+        self.assertAlmostEqual(2.0 / 3, running.scores()['text recall'])
+        for skey, score in expected.items():
+            self.assertAlmostEqual(score, running.scores(final=True)[skey])
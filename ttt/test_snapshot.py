@@ -0,0 +1,76 @@
+"""
+Test suite for the snapshot store
+"""
+
+from os import path as fp
+import os
+import shutil
+import tempfile
+import unittest
+
+from ttt.snapshot import SnapshotError, SnapshotStore
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class SnapshotTest(unittest.TestCase):
+    "tests for ttt.snapshot"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SnapshotStore(fp.join(self.tmpdir, 'store'))
+        self.src = fp.join(self.tmpdir, 'src')
+        self.write('a', '[1]')
+        self.write('x/b', '[2]')
+        self.write('x/c', '[1]')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, subpath, text):
+        "write a file in the source dir"
+        filename = fp.join(self.src, subpath)
+        if not fp.exists(fp.dirname(filename)):
+            os.makedirs(fp.dirname(filename))
+        with open(filename, 'w') as stream:
+            stream.write(text)
+
+    def contents(self, dirname):
+        "the files in a directory"
+        results = {}
+        for root, _, names in os.walk(dirname):
+            for name in names:
+                filename = fp.join(root, name)
+                with open(filename) as stream:
+                    results[fp.relpath(filename, dirname)] = stream.read()
+        return results
+
+    def test_save_checkout(self):
+        "snapshots only store new contents, and check out as links"
+        stats = self.store.save('ds/1', self.src)
+        self.assertEqual((3, 3, 2), stats)
+        out = fp.join(self.tmpdir, 'out')
+        self.assertEqual(3, self.store.checkout('ds/1', out))
+        self.assertEqual(self.contents(self.src), self.contents(out))
+        self.assertTrue(fp.samefile(fp.join(out, 'a'),
+                                    fp.join(out, 'x', 'c')))
+
+        # one file changed, one deleted
+        self.write('x/b', '[3]')
+        os.remove(fp.join(self.src, 'a'))
+        stats = self.store.save('ds/2', self.src, previous='ds/1')
+        self.assertEqual((2, 1, 1), stats)
+        self.assertEqual(['ds/1', 'ds/2'], self.store.snapshots())
+        self.assertEqual('ds/2', self.store.latest('ds/'))
+        self.assertEqual(1, self.store.checkout('ds/2', out))
+        self.assertEqual(self.contents(self.src), self.contents(out))
+        # the old snapshot is still there
+        old = fp.join(self.tmpdir, 'old')
+        self.store.checkout('ds/1', old, link=False)
+        self.assertEqual({'a': '[1]', 'x/b': '[2]', 'x/c': '[1]'},
+                         self.contents(old))
+
+        self.assertRaises(SnapshotError, self.store.save, 'ds/2', self.src)
+        self.store.drop('ds/1')
+        self.assertEqual(1, self.store.gc())
+        self.assertRaises(SnapshotError, self.store.manifest, 'ds/1')
+        self.assertRaises(SnapshotError, self.store.manifest, '../ds')
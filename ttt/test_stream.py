@@ -0,0 +1,113 @@
+"""
+Test suite for streaming convert/nimrodel/score runs (using a stand-in
+for nimrodel)
+"""
+
+from os import path as fp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ttt.pipeline import Stages, write_snippets
+from ttt.stream import StreamingRun
+from ttt.test_batch import FAKE_NIMRODEL
+
+
+def _read(idir, subpath):
+    "toy converter: read a file"
+    with open(fp.join(idir, subpath)) as stream:
+        return stream.read()
+
+
+def _parse(subpath, text):
+    "toy converter: one snippet per line"
+    return [(u'{}-{}'.format(subpath, i), line + u'\n')
+            for i, line in enumerate(text.splitlines())]
+
+
+_STAGES = Stages(read=_read, parse=_parse, write=write_snippets)
+
+
+# pylint: disable=too-many-public-methods, invalid-name
+class StreamTest(unittest.TestCase):
+    "tests for ttt.stream"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        nimrodel = fp.join(self.tmpdir, 'nimrodel.py')
+        with open(nimrodel, 'w') as stream:
+            stream.write(FAKE_NIMRODEL)
+        self.command = [sys.executable, nimrodel]
+        self.idir = fp.join(self.tmpdir, 'raw')
+        os.makedirs(self.idir)
+        for name, text in [('doc1.txt', 'Alice met Bob\nCRASH\nCarol'),
+                           ('doc2.txt', 'Dave\nEve'),
+                           ('notes.md', 'Mallory')]:
+            with open(fp.join(self.idir, name), 'w') as stream:
+                stream.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run(self):
+        "convert, run nimrodel and score as we go"
+        reference = {'doc1.txt-0': [{'origOccurrence': 'Alice'}],
+                     'doc2.txt-1': [{'origOccurrence': 'Eve'}],
+                     'doc3.txt-0': [{'origOccurrence': 'Trent'}]}
+        json_dir = fp.join(self.tmpdir, 'json')
+        run = StreamingRun(_STAGES, self.command,
+                           fp.join(self.tmpdir, 'text'), json_dir,
+                           reference=reference, workers=2, job_files=2)
+        progress = []
+        scores = run.run(self.idir, '*.txt',
+                         on_progress=progress.append, interval=0)
+        self.assertTrue(progress)
+        self.assertEqual(5, run.converted)
+        self.assertEqual(4, run.processed)
+        self.assertEqual({}, run.convert_failures)
+        self.assertEqual(['doc1.txt-1'], list(run.failures))
+        with open(fp.join(json_dir, 'doc1.txt-0')) as stream:
+            self.assertEqual(['Alice', 'Bob'],
+                             [x['origOccurrence'] for x in json.load(stream)])
+        # Alice and Eve found; Bob, Carol and Dave are false positives,
+        # and Trent (never seen) is a miss
+        self.assertAlmostEqual(2. / 3, scores['text recall'])
+        self.assertAlmostEqual(2. / 5, scores['text precision'])
+
+    def test_run_unscored(self):
+        "a run without a reference"
+        run = StreamingRun(_STAGES, self.command,
+                           fp.join(self.tmpdir, 'text'),
+                           fp.join(self.tmpdir, 'json'))
+        self.assertEqual(None, run.run(self.idir, '*.txt'))
+        self.assertEqual(4, run.processed)
+
+    def test_missing_command(self):
+        "all snippets fail (rather than the run hanging) without nimrodel"
+        missing = [fp.join(self.tmpdir, 'no-such-nimrodel')]
+        run = StreamingRun(_STAGES, missing,
+                           fp.join(self.tmpdir, 'text'),
+                           fp.join(self.tmpdir, 'json'), job_files=1)
+        self.assertEqual(None, run.run(self.idir, '*.txt'))
+        self.assertEqual(0, run.processed)
+        self.assertEqual(5, len(run.failures))
+        self.assertTrue(all('OSError' in x for x in run.failures.values()))
+
+    def test_no_output(self):
+        "snippets that nimrodel says nothing about are failures"
+        silent = fp.join(self.tmpdir, 'silent.py')
+        with open(silent, 'w') as stream:
+            stream.write('import sys\n')
+        reference = {'doc2.txt-1': [{'origOccurrence': 'Eve'}]}
+        run = StreamingRun(_STAGES, [sys.executable, silent],
+                           fp.join(self.tmpdir, 'text'),
+                           fp.join(self.tmpdir, 'json'),
+                           reference=reference)
+        scores = run.run(self.idir, '*.txt')
+        self.assertEqual(0, run.processed)
+        self.assertEqual(5, len(run.failures))
+        self.assertTrue(all('no output' in x for x in run.failures.values()))
+        self.assertEqual(None, scores['text precision'])